@@ -0,0 +1,70 @@
+"""
+ASGI entry point: the trainers and pokemons routes as async views on an
+AsyncSession, for an ASGI server such as uvicorn or hypercorn:
+
+    uvicorn asgi:app --workers 4
+
+It shares the configuration (init.py), models, schemas, tokens, caches and
+rate limits of the Flask app, which keeps working as before under a WSGI
+server. The ETag and response cache fast paths and read replica routing
+are only in the Flask app.
+"""
+import asyncio
+from quart import Quart, jsonify
+from marshmallow.exceptions import ValidationError
+from init import create_app
+from json_provider import json_provider
+from metrics import registry
+from async_auth import ApiError
+from async_db import engine
+from events import event_log
+from blueprints.async_trainers_bp import async_trainers_bp
+from blueprints.async_pokemons_bp import async_pokemons_bp
+
+# The Flask app only provides the configuration and extensions (tokens, search index
+# builds), so none of its blueprints are imported
+flask_app = create_app(blueprints=[])
+
+app = Quart(__name__)
+app.config.from_mapping(flask_app.config)
+app.json = json_provider(app, app.config["JSON_PROVIDER"])
+
+app.register_blueprint(async_trainers_bp)
+app.register_blueprint(async_pokemons_bp)
+
+
+# Error handler for 404 (Not Found) and 405 (Method Not Allowed) errors
+@app.errorhandler(404)
+@app.errorhandler(405)
+async def not_found(error=None):
+    return jsonify({"error": "Not Found"}), 404
+
+
+# Error handler for ValidationError (invalid data)
+@app.errorhandler(ValidationError)
+async def invalid_request(err):
+    return jsonify({"error": err.messages}), 400
+
+
+# JSON errors raised by the async views (ownership, tokens, rate limits, busy hashing pool)
+@app.errorhandler(ApiError)
+async def api_error(err):
+    return jsonify(err.body), err.status, err.headers
+
+
+# Metrics in the Prometheus text exposition format
+@app.route("/metrics")
+async def metrics():
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+# Close the pooled connections when the server stops
+@app.after_serving
+async def dispose_engine():
+    await engine.dispose()
+
+
+# Write the buffered change events before the server stops
+@app.after_serving
+async def drain_event_log():
+    await asyncio.to_thread(event_log.close)
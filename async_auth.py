@@ -0,0 +1,135 @@
+import asyncio
+from functools import wraps
+from quart import g, request, abort
+from jwt import ExpiredSignatureError, InvalidTokenError
+from sqlalchemy import select
+from flask_jwt_extended import create_access_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from init import app
+from auth import admin_cache, pokemon_exists
+from cache import MISSING
+from async_db import async_session
+from revocation import token_denylist
+from hashing import hashing_pool, _generate_hash, _check_hash
+from models.trainer import Trainer
+
+
+class ApiError(Exception):
+    """Raised by the async views to answer with a JSON error body (see asgi.py)."""
+
+    def __init__(self, status, message, headers=None, key="error"):
+        super().__init__(message)
+        self.status = status
+        self.body = {key: message}
+        self.headers = headers or {}
+
+
+# Tokens are created and verified by the Flask app's JWTManager, so both apps accept
+# each other's tokens and keep the same claims, expiry and error messages
+def issue_token(**kwargs):
+    with app.app_context():
+        return create_access_token(**kwargs)
+
+
+def verify_token(authorization):
+    # Same responses as Flask-JWT-Extended's default handlers
+    if not authorization:
+        raise ApiError(401, "Missing Authorization Header", key="msg")
+    scheme, _, token = authorization.partition(" ")
+    if scheme != "Bearer" or not token:
+        raise ApiError(
+            401, "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", key="msg"
+        )
+    try:
+        with app.app_context():
+            claims = decode_token(token)
+    except ExpiredSignatureError:
+        raise ApiError(401, "Token has expired", key="msg")
+    except (InvalidTokenError, JWTExtendedException) as err:
+        raise ApiError(422, str(err), key="msg")
+    if claims.get("type") != "access":
+        raise ApiError(422, "Only non-refresh tokens are allowed", key="msg")
+    return claims
+
+
+# Async counterpart of flask_jwt_extended.jwt_required()
+def jwt_required(fn):
+    @wraps(fn)
+    async def inner(*args, **kwargs):
+        g.jwt = verify_token(request.headers.get("Authorization"))
+        # Same denylist as auth.token_revoked, only the first checks wait (off the event loop)
+        # for its first read
+        if not token_denylist.ready(timeout=0) and not await asyncio.to_thread(token_denylist.ready):
+            raise ApiError(503, "The server is busy, please try again shortly", {"Retry-After": "1"})
+        if token_denylist.is_revoked(g.jwt):
+            raise ApiError(401, "Token has been revoked", key="msg")
+        return await fn(*args, **kwargs)
+
+    return inner
+
+
+def get_jwt():
+    return g.jwt
+
+
+def get_jwt_identity():
+    return g.jwt["sub"]
+
+
+# Async counterpart of auth.is_admin, sharing its cache
+async def is_admin(trainer_id):
+    use_cache = app.config["ADMIN_CACHE_TTL"] > 0
+    if use_cache:
+        admin = admin_cache.get(trainer_id)
+        if admin is not MISSING:
+            return admin
+    async with async_session() as session:
+        stmt = select(Trainer.id).where(Trainer.id == trainer_id, Trainer.admin)
+        admin = await session.scalar(stmt) is not None
+    if use_cache:
+        admin_cache.set(trainer_id, admin)
+    return admin
+
+
+# Route decorator to ensure JWT trainer is an admin
+def admin_only(fn):
+    @wraps(fn)
+    @jwt_required
+    async def inner(*args, **kwargs):
+        # The signed "admin" claim turns non-admins away without a query
+        if g.jwt.get("admin") is not False and await is_admin(get_jwt_identity()):
+            return await fn(*args, **kwargs)
+        return {'error': 'You need to have administrator privileges to access this resource'}, 403
+
+    return inner
+
+
+# Async counterpart of auth.authorize_owner_pokemon, once a statement scoped with
+# auth.owned_pokemon matched no row: 404 if the Pokemon does not exist, otherwise 403
+async def authorize_owner_pokemon(session, id):
+    if await session.scalar(pokemon_exists(id)) is None:
+        abort(404)
+    raise ApiError(403, "You must be the pokemon owner to access this resource")
+
+
+def authorize_owner_trainer(trainer):
+    if get_jwt_identity() != trainer.id:
+        raise ApiError(403, "You must be a registered trainer to access this resource")
+
+
+# bcrypt on the shared process pool, awaited so the event loop keeps serving requests
+async def _hash(fn, *args):
+    result = await hashing_pool.run_async(
+        fn, *args, size=app.config["HASH_POOL_SIZE"], queue_depth=app.config["HASH_QUEUE_DEPTH"]
+    )
+    if result is None:
+        raise ApiError(503, "The server is busy, please try again shortly", {"Retry-After": "1"})
+    return result
+
+
+async def hash_password(password):
+    return await _hash(_generate_hash, password.encode("utf-8"), app.config["BCRYPT_LOG_ROUNDS"])
+
+
+async def check_password(pw_hash, password):
+    return await _hash(_check_hash, pw_hash.encode("utf-8"), password.encode("utf-8"))
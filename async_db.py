@@ -0,0 +1,57 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from init import app
+from config import async_database_uri, async_engine_options
+from resource_cache import committed_keys, invalidate_keys, track_writes
+from search import track_search_writes
+from events import track_change_events
+from revocation import track_revocations
+from versions import track_pokemon_owners
+
+
+class AsyncAppSession(Session):
+    """
+    The synchronous session inside the ASGI app's AsyncSession. The models
+    are the Flask-SQLAlchemy ones, but this session is bound to the async
+    engine instead of going through Flask-SQLAlchemy's app context.
+    """
+
+
+class AppAsyncSession(AsyncSession):
+    """
+    AsyncSession whose commit invalidates the response cache entries the
+    commit made stale on a worker thread: with the Redis backend every
+    invalidation is a blocking round trip, which inside the commit would
+    stall the event loop and every request on it.
+    """
+
+    async def commit(self):
+        await super().commit()
+        keys = committed_keys(self.sync_session)
+        if keys:
+            await asyncio.to_thread(invalidate_keys, keys)
+
+
+# Writes from the async app invalidate the response cache like the Flask app's do, once
+# AppAsyncSession.commit has returned from the commit
+track_writes(AsyncAppSession, invalidate_on_commit=False)
+# and mark the in-process search index stale
+track_search_writes(AsyncAppSession)
+# Their changes go to the event log too
+track_change_events(AsyncAppSession)
+# and the tokens they revoke are refused by this process straight away
+track_revocations(AsyncAppSession)
+# and bump the owners' pokemons_version in the same transaction
+track_pokemon_owners(AsyncAppSession)
+
+# asyncpg (or aiosqlite in development) engine for the same database as DB_URI
+engine = create_async_engine(
+    async_database_uri(app.config["SQLALCHEMY_DATABASE_URI"]),
+    **async_engine_options(app.config["SQLALCHEMY_DATABASE_URI"]),
+)
+
+# One AsyncSession per request: `async with async_session() as session:`
+async_session = async_sessionmaker(
+    engine, class_=AppAsyncSession, expire_on_commit=False, sync_session_class=AsyncAppSession
+)
@@ -0,0 +1,80 @@
+from quart import abort, current_app, request
+from init import app
+from async_db import async_session
+from pagination import Sort, page_items
+from projection import RowProjection
+
+
+# Read and validate the ?limit= and ?after= query parameters
+def page_args():
+    max_limit = app.config["PAGINATION_MAX_LIMIT"]
+    limit = request.args.get("limit", app.config["PAGINATION_DEFAULT_LIMIT"], type=int)
+    if limit is None or limit < 1 or limit > max_limit:
+        abort(400, description=f"limit must be between 1 and {max_limit}")
+    return limit, request.args.get("after") or None
+
+
+def wants_stream():
+    if request.args.get("stream") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+
+def wants_page():
+    return "limit" in request.args or "after" in request.args
+
+
+# Run a listing statement, as Rows for a column projection or as model objects otherwise
+async def fetch_all(session, stmt, schema):
+    result = await session.execute(stmt)
+    if isinstance(schema, RowProjection):
+        return result.all()
+    return result.scalars().all()
+
+
+async def paginate(session, stmt, model, schema, sort=None):
+    """Async pagination.paginate: one keyset page and the cursor for the next one."""
+    sort = sort or Sort(model)
+    limit, after = page_args()
+    if after is not None:
+        stmt = stmt.where(sort.after(after))
+    stmt = stmt.add_columns(*sort.columns()).order_by(*sort.order_by()).limit(limit + 1)
+    rows = (await session.execute(stmt)).all()
+    next_cursor = sort.cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"data": schema.dump(page_items(rows[:limit], schema), many=True), "next_cursor": next_cursor}
+
+
+def stream_ndjson(stmt, model, schema, sort=None):
+    """
+    Streams every row as newline delimited JSON from a server side cursor,
+    with its own session that stays open until the last row is sent.
+    """
+    sort = sort or Sort(model)
+    chunk_size = app.config["STREAM_CHUNK_SIZE"]
+    stmt = stmt.order_by(*sort.order_by()).execution_options(yield_per=chunk_size)
+    dumps = current_app.json.dumps
+    projected = isinstance(schema, RowProjection)
+
+    async def generate():
+        async with async_session() as session:
+            result = await session.stream(stmt)
+            rows = result if projected else result.scalars()
+            async for row in rows:
+                yield dumps(schema.dump(row, many=False)) + "\n"
+
+    return generate(), 200, {"Content-Type": "application/x-ndjson"}
+
+
+async def list_response(stmt, model, schema, sort=None):
+    """
+    Async pagination.list_response: an NDJSON stream, a keyset page, or the
+    whole result as a plain JSON list, in the sort order.
+    """
+    sort = sort or Sort(model)
+    if wants_stream():
+        return stream_ndjson(stmt, model, schema, sort)
+    async with async_session() as session:
+        if wants_page():
+            return await paginate(session, stmt, model, schema, sort)
+        rows = await fetch_all(session, stmt.order_by(*sort.order_by()), schema)
+    return schema.dump(rows, many=True)
@@ -1,28 +1,96 @@
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask import abort, jsonify, make_response
-from init import db
+from functools import wraps
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from flask import abort, jsonify, make_response, current_app
+from sqlalchemy import event
+from init import app, db, jwt, on_setup
+from cache import TTLCache, MISSING
+from revocation import token_denylist
+from models.pokemon import Pokemon
 from models.trainer import Trainer
 
+# In-process cache of trainer id -> admin flag, so admin routes do not hit the
+# database on every call (ADMIN_CACHE_TTL=0 turns it off)
+admin_cache = TTLCache()
+
+
+# Sized from the configuration once create_app has applied it
+@on_setup
+def _size_admin_cache(app):
+    admin_cache.maxsize = app.config["ADMIN_CACHE_SIZE"]
+    admin_cache.ttl = app.config["ADMIN_CACHE_TTL"]
+
+
+# Look up whether a trainer is an admin, from the cache when possible
+def is_admin(trainer_id):
+    use_cache = current_app.config["ADMIN_CACHE_TTL"] > 0
+    if use_cache:
+        admin = admin_cache.get(trainer_id)
+        if admin is not MISSING:
+            return admin
+    # Answered from the partial index on admins, a missing trainer is not an admin
+    stmt = db.select(Trainer.id).where(Trainer.id == trainer_id, Trainer.admin)
+    admin = db.session.scalar(stmt) is not None
+    if use_cache:
+        admin_cache.set(trainer_id, admin)
+    return admin
+
+
+# Drop the cached admin flag as soon as the trainer is changed or removed
+@event.listens_for(Trainer, "after_update")
+@event.listens_for(Trainer, "after_delete")
+def invalidate_admin_cache(mapper, connection, trainer):
+    admin_cache.delete(trainer.id)
+
+
+# Refuse revoked tokens (logged out, or of a deleted trainer) on every jwt_required route.
+# Answered from the in-process denylist without a query, a background thread reads new
+# revocations every TOKEN_DENYLIST_SYNC_SECONDS. Only the first checks of a process wait
+# for its first read, and get a 503 if it is not done within revocation.FIRST_SYNC_WAIT
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    if not token_denylist.ready():
+        abort(
+            make_response(
+                jsonify(error="The server is busy, please try again shortly"), 503, {"Retry-After": "1"}
+            )
+        )
+    return token_denylist.is_revoked(jwt_payload)
+
 
 # Route decorator to ensure JWT trainer is an admin
 def admin_only(fn):
+    @wraps(fn)
     @jwt_required()
-    def inner():
-        trainer_id = get_jwt_identity()
-        stmt = db.select(Trainer).where(Trainer.id == trainer_id, Trainer.admin)
-        trainer = db.session.scalar(stmt)
-        if trainer:
-            return fn()
+    def inner(*args, **kwargs):
+        # The signed "admin" claim set at login turns non-admins away without a query,
+        # admin tokens are still checked against the (cached) database flag
+        if get_jwt().get("admin") is not False and is_admin(get_jwt_identity()):
+            return fn(*args, **kwargs)
         else:
             return {'error': 'You need to have administrator privileges to access this resource'}, 403
-        
+
     return inner
 
-# Ensure that the JWT trainer is the owner of the given pokemon
-def authorize_owner_pokemon(pokemon):
-    trainer_id = get_jwt_identity()
-    if trainer_id != pokemon.trainer_id:
-        abort(make_response(jsonify(error="You must be the pokemon owner to access this resource"), 403))
+# Conditions scoping a Pokemon statement to the given Pokemon of the given trainer, so the
+# database checks ownership in the same SELECT/UPDATE/DELETE that reads or writes the row
+def owned_pokemon(id, trainer_id):
+    return Pokemon.id == id, Pokemon.trainer_id == trainer_id
+
+
+# The Pokemon, whoever owns it, for telling 403 and 404 apart
+def pokemon_exists(id):
+    return db.select(Pokemon.id).where(Pokemon.id == id)
+
+
+def authorize_owner_pokemon(id):
+    """
+    Called once a statement scoped with owned_pokemon matched no row, so only
+    the rejected requests pay for a second query: 404 if the Pokemon does not
+    exist, 403 if it belongs to another trainer.
+    """
+    if db.session.scalar(pokemon_exists(id)) is None:
+        abort(404)
+    abort(make_response(jsonify(error="You must be the pokemon owner to access this resource"), 403))
 
 
 def authorize_owner_trainer(trainer):
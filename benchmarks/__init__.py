@@ -0,0 +1,2 @@
+# Benchmarks and query budget checks for the Pokemon API.
+# Run them from the repository root, e.g. `python -m benchmarks.query_budget`.
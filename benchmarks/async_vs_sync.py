@@ -0,0 +1,118 @@
+"""
+Load test of the Flask app under a threaded WSGI server against the ASGI app
+(asgi.py) under uvicorn, at high concurrency. Each server runs in its own
+process against the same seeded database; the client is a small asyncio
+HTTP client so it does not need a thread per connection. Run with:
+
+    python -m benchmarks.async_vs_sync [concurrency] [requests]
+
+The difference only shows against a database with real round-trip latency,
+so point DB_URI at PostgreSQL. The response cache is turned off in both
+servers so every request reaches the database.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from benchmarks.common import app, reset_database, seed, login
+
+HOST = "127.0.0.1"
+SERVERS = {
+    "sync (werkzeug, threaded)": lambda port: [
+        sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads",
+    ],
+    "async (uvicorn)": lambda port: [
+        sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning",
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def get(port, path, headers):
+    """One GET over a fresh connection, returning (status, seconds)."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(HOST, port)
+    lines = [f"GET {path} HTTP/1.1", f"Host: {HOST}:{port}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1]) if response else 0
+    return status, time.perf_counter() - start
+
+
+async def load(port, path, headers, concurrency, requests):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            try:
+                status, elapsed = await get(port, path, headers)
+            except OSError:
+                status, elapsed = 0, 0
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main(concurrency=200, requests=5000):
+    reset_database()
+    seed(100, 10_000)
+    headers = login(app.test_client(), 1)
+    env = {**os.environ, "RESPONSE_CACHE_BACKEND": "none", "HASH_POOL_SIZE": "0"}
+    print(f"GET /pokemons/owned, {requests} requests, {concurrency} concurrent connections")
+    for label, command in SERVERS.items():
+        port = free_port()
+        server = subprocess.Popen(command(port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            latencies, errors, elapsed = asyncio.run(
+                load(port, "/pokemons/owned", headers, concurrency, requests)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f"{label:<28} {len(latencies) / elapsed:8.0f} req/s  "
+            f"p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  "
+            f"p95 {percentile(latencies, 0.95) * 1000:7.1f}ms  "
+            f"p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  "
+            f"errors {errors}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
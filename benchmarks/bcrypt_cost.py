@@ -0,0 +1,45 @@
+"""
+Times bcrypt at a range of work factors on this machine and recommends the
+highest one that stays under a target latency. Run with:
+
+    python -m benchmarks.bcrypt_cost [target_ms]
+
+Put the result in BCRYPT_LOG_ROUNDS; existing hashes are upgraded to the new
+cost the next time each trainer logs in.
+"""
+import sys
+import time
+import bcrypt
+
+PASSWORD = b"benchmarkpassword"
+ROUNDS = range(8, 15)
+SAMPLES = 3
+
+
+def time_rounds(rounds):
+    pw_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds))
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        bcrypt.checkpw(PASSWORD, pw_hash)
+    return (time.perf_counter() - start) / SAMPLES * 1000
+
+
+def main(target_ms=250.0):
+    recommended = None
+    for rounds in ROUNDS:
+        elapsed = time_rounds(rounds)
+        print(f"rounds={rounds:<3} {elapsed:8.1f} ms per check")
+        if elapsed <= target_ms:
+            recommended = rounds
+        else:
+            # Each extra round doubles the cost, no point going further
+            break
+    if recommended is None:
+        print(f"\nEven {ROUNDS.start} rounds take longer than {target_ms:.0f} ms")
+        return 1
+    print(f"\nRecommended BCRYPT_LOG_ROUNDS={recommended} (target {target_ms:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(float(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,80 @@
+"""
+Compares Pokemon throughput of the single row endpoints against /pokemons/bulk
+for create, update and delete. Run with:
+
+    python -m benchmarks.bulk_vs_single [pokemons]
+"""
+import sys
+import time
+from benchmarks.common import app, reset_database, seed, login
+
+TYPES = ["Fire", "Water", "Grass", "Electric"]
+
+
+def payload(i):
+    return {"name": "Bench", "type": TYPES[i % len(TYPES)], "ability": f"Ability{i}"}
+
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {count / elapsed:10.0f} pokemons/s  ({elapsed:.2f}s)")
+    return elapsed
+
+
+def main(count=1000):
+    reset_database()
+    seed(2, 0)
+    client = app.test_client()
+    headers = login(client, 1)
+    batch = app.config["BULK_MAX_BATCH_SIZE"]
+    created = []
+
+    def single_create():
+        for i in range(count):
+            created.append(client.post("/pokemons/create", json=payload(i), headers=headers).json["id"])
+
+    def single_update():
+        for i, pokemon_id in enumerate(created):
+            client.put(f"/pokemons/update/{pokemon_id}", json=payload(i + 1), headers=headers)
+
+    def single_delete():
+        for pokemon_id in created:
+            client.delete(f"/pokemons/delete/{pokemon_id}", headers=headers)
+
+    bulk_created = []
+
+    def bulk_create():
+        for offset in range(0, count, batch):
+            items = [payload(i) for i in range(offset, min(offset + batch, count))]
+            results = client.post("/pokemons/bulk", json=items, headers=headers).json
+            bulk_created.extend(result["id"] for result in results)
+
+    def bulk_update():
+        for offset in range(0, count, batch):
+            ids = bulk_created[offset:offset + batch]
+            items = [{"id": pokemon_id, **payload(i + 1)} for i, pokemon_id in enumerate(ids)]
+            client.put("/pokemons/bulk", json=items, headers=headers)
+
+    def bulk_delete():
+        for offset in range(0, count, batch):
+            client.delete("/pokemons/bulk", json=bulk_created[offset:offset + batch], headers=headers)
+
+    results = {}
+    for operation, single, bulk in [
+        ("create", single_create, bulk_create),
+        ("update", single_update, bulk_update),
+        ("delete", single_delete, bulk_delete),
+    ]:
+        single_time = timed(f"single {operation}", count, single)
+        bulk_time = timed(f"bulk {operation}", count, bulk)
+        results[operation] = single_time / bulk_time
+    print()
+    for operation, speedup in results.items():
+        print(f"bulk {operation} is {speedup:.1f}x faster")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:2])))
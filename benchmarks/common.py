@@ -0,0 +1,108 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+# Point the app at a throwaway SQLite database unless DB_URI is already set,
+# this has to happen before anything imports init.py
+os.environ.setdefault(
+    "DB_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "pokemon_bench.db")
+)
+os.environ.setdefault("JWT_KEY", "benchmark-secret-key-benchmark-secret")
+# Benchmarks log in far more often than the login rate limits allow
+os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+
+from flask import has_request_context  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+from init import app, db, bcrypt  # noqa: E402
+import app as _routes  # noqa: E402,F401  (registers the blueprints)
+from models.pokemon import Pokemon, pokemon_types  # noqa: E402
+from models.trainer import Trainer, gym_types  # noqa: E402
+
+PASSWORD = "benchmarkpassword"
+
+
+def reset_database():
+    """Drops and recreates every table."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def seed(trainers, pokemons):
+    """
+    Inserts `trainers` trainers (the first one is an admin) and `pokemons`
+    Pokemons spread evenly across them with Core bulk inserts.
+    """
+    password = bcrypt.generate_password_hash(PASSWORD).decode("utf-8")
+    types = pokemon_types.enums
+    teams = gym_types.enums
+    with app.app_context():
+        db.session.execute(
+            insert(Trainer),
+            [
+                {
+                    "name": f"Trainer {i}",
+                    "username": f"trainer{i}",
+                    "email": f"trainer{i}@example.com",
+                    "password": password,
+                    "team": teams[i % len(teams)],
+                    "admin": i == 0,
+                }
+                for i in range(trainers)
+            ],
+        )
+        trainer_ids = db.session.scalars(db.select(Trainer.id).order_by(Trainer.id)).all()
+        start = date(2024, 1, 1)
+        for offset in range(0, pokemons, 10_000):
+            db.session.execute(
+                insert(Pokemon),
+                [
+                    {
+                        "name": "Pokemon",
+                        "type": types[i % len(types)],
+                        "ability": f"Ability{i % 97}",
+                        "date_caught": start + timedelta(days=i % 365),
+                        "trainer_id": trainer_ids[i % len(trainer_ids)],
+                    }
+                    for i in range(offset, min(offset + 10_000, pokemons))
+                ],
+            )
+        db.session.commit()
+
+
+def login(client, index=0):
+    """Logs in as the seeded trainer `index` and returns the auth headers."""
+    response = client.post(
+        "/trainers/login",
+        json={
+            "email": f"trainer{index}@example.com",
+            "username": f"trainer{index}",
+            "password": PASSWORD,
+        },
+    )
+    return {"Authorization": f"Bearer {response.json['token']}"}
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the SQL statements the requests handled inside the block send
+    to the database. Those of other threads (the event log writing the
+    changes, the denylist sync, a stats refresh) run outside any request
+    and belong to none. Yields a list that is filled with the statements as
+    they execute.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
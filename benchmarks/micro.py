@@ -0,0 +1,65 @@
+"""
+Micro-benchmarks for the per request building blocks: schema dump and load,
+the column projection, JSON encoding, JWT encode/decode (with and without
+the verified payload cache), the token denylist check and bcrypt. Used by
+benchmarks.suite, each returns the mean time per operation.
+"""
+import time
+from flask_jwt_extended import create_access_token, decode_token
+from benchmarks.common import app, db, PASSWORD
+from hashing import _generate_hash, _check_hash
+from projection import listing
+from revocation import token_denylist
+from models.pokemon import Pokemon
+from blueprints.pokemons_bp import pokemons_schema, pokemon_input_schema
+from blueprints.trainers_bp import login_schema
+
+# Rows per dump, so dump timings are per list of this many Pokemons
+DUMP_ROWS = 1000
+
+
+def timed(fn, iterations):
+    """Runs fn `iterations` times and returns {"mean_us", "ops_per_sec"}."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = (time.perf_counter() - start) / iterations
+    return {"mean_us": elapsed * 1_000_000, "ops_per_sec": 1 / elapsed}
+
+
+def run(iterations=200):
+    results = {}
+    with app.app_context():
+        stmt, schema = listing(Pokemon, pokemons_schema, fast_dump=False)
+        pokemons = db.session.scalars(stmt.order_by(Pokemon.id).limit(DUMP_ROWS)).all()
+        stmt, projection = listing(Pokemon, pokemons_schema, fast_dump=True)
+        rows = db.session.execute(stmt.order_by(Pokemon.id).limit(DUMP_ROWS)).all()
+        dumped = schema.dump(pokemons)
+
+        dump_iterations = max(3, iterations // 20)
+        results["schema_dump_orm"] = timed(lambda: schema.dump(pokemons), dump_iterations)
+        results["schema_dump_projection"] = timed(lambda: projection.dump(rows, many=True), dump_iterations)
+        results["json_encode"] = timed(lambda: app.json.dumps(dumped), dump_iterations)
+
+        pokemon_body = {"name": "Bench", "type": "Fire", "ability": "Blaze", "unknown": 1}
+        results["schema_load_pokemon"] = timed(lambda: pokemon_input_schema.load(pokemon_body), iterations * 10)
+        login_body = {"email": "trainer1@example.com", "username": "trainer1", "password": PASSWORD}
+        results["schema_load_login"] = timed(lambda: login_schema.load(login_body), iterations * 10)
+
+        token = create_access_token(identity=1, additional_claims={"admin": False})
+        results["jwt_encode"] = timed(
+            lambda: create_access_token(identity=1, additional_claims={"admin": False}), iterations * 10
+        )
+        results["jwt_decode"] = timed(lambda: decode_token(token), iterations * 10)
+        # allow_expired bypasses the cache, so this is the signature check every time
+        results["jwt_decode_uncached"] = timed(lambda: decode_token(token, allow_expired=True), iterations * 10)
+        claims = decode_token(token)
+        token_denylist.sync()
+        results["token_denylist_check"] = timed(lambda: token_denylist.is_revoked(claims), iterations * 10)
+
+        rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        pw_hash = _generate_hash(PASSWORD.encode("utf-8"), rounds).encode("utf-8")
+        results["bcrypt_check"] = timed(lambda: _check_hash(pw_hash, PASSWORD.encode("utf-8")), 3)
+        results["bcrypt_check"]["rounds"] = rounds
+    return results
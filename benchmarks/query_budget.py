@@ -0,0 +1,81 @@
+"""
+Fails when a listing endpoint issues more SQL statements than its budget.
+
+The budget is a fixed number of statements per request, so an N+1 lazy load
+shows up as soon as the table grows. Run with:
+
+    python -m benchmarks.query_budget
+
+tests/test_query_budget.py runs the same check as part of the test suite.
+"""
+import sys
+from benchmarks.common import app, reset_database, seed, login, count_queries
+from stats import refresh_stats
+
+# (method, path, auth as admin?) -> maximum SQL statements per request
+BUDGETS = {
+    ("GET", "/pokemons/", True): 2,
+    ("GET", "/pokemons/?limit=50", True): 2,
+    ("GET", "/pokemons/?stream=ndjson", True): 2,
+    ("GET", "/pokemons/?type=Fire&name=b&limit=50", True): 2,
+    ("GET", "/pokemons/?sort=-date_caught,name&fields=id,name&limit=50", True): 2,
+    ("GET", "/pokemons/?sort=name&stream=ndjson", True): 2,
+    # the ETag lookup, then the list itself on a cache miss
+    ("GET", "/pokemons/owned", False): 2,
+    ("GET", "/pokemons/owned?type=Fire&limit=50", False): 2,
+    # on SQLite the first search also reads the Pokemons into the in-process index
+    ("GET", "/pokemons/search?q=Pokemn&limit=50", True): 2,
+    ("GET", "/pokemons/search?q=Pok&mode=prefix&limit=50", False): 2,
+    # the latest refresh, then one query per rollup
+    ("GET", "/pokemons/stats", True): 4,
+    ("GET", "/trainers/stats", True): 2,
+    ("GET", "/trainers", True): 2,
+    ("GET", "/trainers?limit=50", True): 2,
+    ("GET", "/trainers/export", True): 2,
+}
+
+# Row counts to check each budget at (trainers, pokemons)
+SIZES = [(5, 20), (50, 500), (200, 5_000)]
+
+
+def measure(trainers, pokemons):
+    """
+    Seeds a database with this many rows and requests every budgeted
+    endpoint once. Returns (method, path, status, statements, budget) for
+    each of them.
+    """
+    reset_database()
+    seed(trainers, pokemons)
+    with app.app_context():
+        # Built like `db seed` does, the first request would otherwise build the rollups
+        refresh_stats()
+    client = app.test_client()
+    headers = {True: login(client, 0), False: login(client, 1)}
+    results = []
+    for (method, path, admin), budget in BUDGETS.items():
+        with count_queries() as statements:
+            response = client.open(path, method=method, headers=headers[admin])
+            # Consume streamed bodies so every query actually runs
+            response.get_data()
+        results.append((method, path, response.status_code, statements, budget))
+    return results
+
+
+def main():
+    failures = []
+    for trainers, pokemons in SIZES:
+        for method, path, status, statements, budget in measure(trainers, pokemons):
+            result = "ok" if len(statements) <= budget else "OVER BUDGET"
+            print(f"{pokemons:>7} rows  {method} {path:<58} {status}  {len(statements)}/{budget} queries  {result}")
+            if len(statements) > budget:
+                failures.append((pokemons, path, statements))
+
+    for pokemons, path, statements in failures:
+        print(f"\n{path} at {pokemons} rows issued {len(statements)} queries:")
+        for statement in statements:
+            print("   ", " ".join(statement.split()))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
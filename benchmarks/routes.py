@@ -0,0 +1,213 @@
+"""
+The routes driven by benchmarks.suite. Each route builds its requests up
+front (creating whatever rows they need), so only the requests are timed.
+Add new endpoints here to have them benchmarked and checked for regressions.
+"""
+import itertools
+from datetime import date
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+from benchmarks.common import app, db, login, PASSWORD
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+
+_unique = itertools.count()
+
+
+class Route:
+    """
+    One benchmarked endpoint. `build(fixture, count)` returns `count`
+    requests as (path, json body or None, headers). Heavy routes run a
+    fraction of the iterations and are skipped above `max_size` Pokemons.
+    """
+
+    def __init__(self, name, method, build, weight=1.0, max_size=None):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.weight = weight
+        self.max_size = max_size
+
+    def iterations(self, iterations):
+        return max(3, int(iterations * self.weight))
+
+
+class Fixture:
+    """Logged in admin and trainer plus the ids the write routes work on."""
+
+    def __init__(self, client):
+        self.admin = login(client, 0)
+        self.user = login(client, 1)
+        with app.app_context():
+            self.user_id = db.session.scalar(
+                db.select(Trainer.id).where(Trainer.username == "trainer1")
+            )
+            self.owned = db.session.scalars(
+                db.select(Pokemon.id).where(Pokemon.trainer_id == self.user_id).order_by(Pokemon.id).limit(1000)
+            ).all()
+
+    def new_pokemons(self, count):
+        """Inserts `count` Pokemons owned by the trainer, for the delete routes."""
+        with app.app_context():
+            ids = db.session.scalars(
+                insert(Pokemon).returning(Pokemon.id, sort_by_parameter_order=True),
+                [pokemon_body(i) | {"date_caught": date.today(), "trainer_id": self.user_id} for i in range(count)],
+            ).all()
+            db.session.commit()
+        return ids
+
+    def new_trainers(self, count):
+        """Inserts `count` trainers and returns (id, headers) for each, for the delete route."""
+        run = next(_unique)
+        with app.app_context():
+            ids = db.session.scalars(
+                insert(Trainer).returning(Trainer.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "name": "Bench",
+                        "username": f"d{run}x{i}",
+                        "email": f"d{run}x{i}@example.com",
+                        "password": "unused",
+                        "team": "Mystic",
+                    }
+                    for i in range(count)
+                ],
+            ).all()
+            db.session.commit()
+            # Tokens are minted directly, logging each trainer in would time bcrypt instead
+            return [(trainer_id, bearer(trainer_id)) for trainer_id in ids]
+
+    def new_tokens(self, count):
+        """Mints `count` tokens of the trainer, for the logout route (each token logs out once)."""
+        with app.app_context():
+            return [bearer(self.user_id) for _ in range(count)]
+
+
+def bearer(trainer_id):
+    token = create_access_token(identity=trainer_id, additional_claims={"admin": False})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def pokemon_body(i):
+    return {"name": "Bench", "type": ("Fire", "Water", "Grass")[i % 3], "ability": f"Ability{i}"}
+
+
+def cycle(values, count):
+    return list(itertools.islice(itertools.cycle(values), count))
+
+
+def get(path, auth):
+    return lambda fx, count: [(path, None, getattr(fx, auth) if auth else {})] * count
+
+
+def trainer_login(fx, count):
+    body = {"email": "trainer1@example.com", "username": "trainer1", "password": PASSWORD}
+    return [("/trainers/login", body, {})] * count
+
+
+def trainer_one(fx, count):
+    return [(f"/trainers/{fx.user_id}", None, {})] * count
+
+
+def trainer_create(fx, count):
+    run = next(_unique)
+    return [
+        (
+            "/trainers/create",
+            {
+                "name": "Bench",
+                "username": f"c{run}x{i}",
+                "email": f"c{run}x{i}@example.com",
+                "password": PASSWORD,
+                "team": "mystic",
+            },
+            {},
+        )
+        for i in range(count)
+    ]
+
+
+def trainer_update(fx, count):
+    # username is required by the schema, so it is sent back unchanged
+    return [
+        (f"/trainers/update/{fx.user_id}", {"name": f"Trainer {i}", "username": "trainer1"}, fx.user)
+        for i in range(count)
+    ]
+
+
+def trainer_logout(fx, count):
+    return [("/trainers/logout", None, headers) for headers in fx.new_tokens(count)]
+
+
+def trainer_delete(fx, count):
+    return [(f"/trainers/delete/{trainer_id}", None, headers) for trainer_id, headers in fx.new_trainers(count)]
+
+
+def pokemon_one(fx, count):
+    return [(f"/pokemons/{pokemon_id}", None, fx.user) for pokemon_id in cycle(fx.owned, count)]
+
+
+def pokemon_create(fx, count):
+    return [("/pokemons/create", pokemon_body(i), fx.user) for i in range(count)]
+
+
+def pokemon_update(fx, count):
+    return [
+        (f"/pokemons/update/{pokemon_id}", pokemon_body(i), fx.user)
+        for i, pokemon_id in enumerate(cycle(fx.owned, count))
+    ]
+
+
+def pokemon_delete(fx, count):
+    return [(f"/pokemons/delete/{pokemon_id}", None, fx.user) for pokemon_id in fx.new_pokemons(count)]
+
+
+# Bulk routes send batches of BATCH Pokemons
+BATCH = 100
+
+
+def pokemon_bulk_create(fx, count):
+    return [("/pokemons/bulk", [pokemon_body(i) for i in range(BATCH)], fx.user)] * count
+
+
+def pokemon_bulk_update(fx, count):
+    return [
+        ("/pokemons/bulk", [{"id": pokemon_id, "ability": f"Ability{i}"} for pokemon_id in fx.owned[:BATCH]], fx.user)
+        for i in range(count)
+    ]
+
+
+def pokemon_bulk_delete(fx, count):
+    ids = fx.new_pokemons(count * BATCH)
+    return [("/pokemons/bulk", ids[i:i + BATCH], fx.user) for i in range(0, len(ids), BATCH)]
+
+
+ROUTES = [
+    Route("trainers.login", "POST", trainer_login, weight=0.1),
+    Route("trainers.logout", "POST", trainer_logout),
+    Route("trainers.all", "GET", get("/trainers", "admin"), weight=0.1, max_size=100_000),
+    Route("trainers.all_page", "GET", get("/trainers?limit=100", "admin")),
+    Route("trainers.one", "GET", trainer_one),
+    Route("trainers.stats", "GET", get("/trainers/stats", "admin")),
+    Route("trainers.create", "POST", trainer_create, weight=0.1),
+    Route("trainers.update", "PATCH", trainer_update),
+    Route("trainers.delete", "DELETE", trainer_delete),
+    Route("trainers.export", "GET", get("/trainers/export?trainer=trainer1", "admin"), weight=0.1),
+    Route("trainers.export_all", "GET", get("/trainers/export", "admin"), weight=0.05, max_size=100_000),
+    Route("pokemons.all", "GET", get("/pokemons/", "admin"), weight=0.05, max_size=100_000),
+    Route("pokemons.all_page", "GET", get("/pokemons/?limit=100", "admin")),
+    Route("pokemons.filter_page", "GET", get("/pokemons/?type=Fire&name=b&limit=100", "admin")),
+    Route("pokemons.sorted_page", "GET", get("/pokemons/?sort=-date_caught,name&fields=id,name&limit=100", "admin")),
+    Route("pokemons.all_stream", "GET", get("/pokemons/?stream=ndjson", "admin"), weight=0.05, max_size=100_000),
+    Route("pokemons.owned", "GET", get("/pokemons/owned", "user")),
+    Route("pokemons.stats", "GET", get("/pokemons/stats", "admin")),
+    Route("pokemons.search", "GET", get("/pokemons/search?q=Pokemn&limit=100", "admin")),
+    Route("pokemons.search_prefix", "GET", get("/pokemons/search?q=Pok&mode=prefix&limit=100", "user")),
+    Route("pokemons.one", "GET", pokemon_one),
+    Route("pokemons.create", "POST", pokemon_create),
+    Route("pokemons.update", "PUT", pokemon_update),
+    Route("pokemons.delete", "DELETE", pokemon_delete),
+    Route("pokemons.bulk_create", "POST", pokemon_bulk_create, weight=0.2),
+    Route("pokemons.bulk_update", "PATCH", pokemon_bulk_update, weight=0.2),
+    Route("pokemons.bulk_delete", "DELETE", pokemon_bulk_delete, weight=0.2),
+]
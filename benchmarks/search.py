@@ -0,0 +1,107 @@
+"""
+Compares /pokemons/search against a LIKE '%q%' scan over a seeded table
+(1M Pokemons by default) for fuzzy and prefix queries. On PostgreSQL the
+search runs on the pg_trgm indexes, elsewhere on the in-process trigram
+index (its build time is reported separately). Run with:
+
+    python -m benchmarks.search [pokemons] [repeats]
+
+Reuses the seeded table when it already has that many Pokemons.
+"""
+import sys
+import time
+from sqlalchemy import case, func, or_, select, update
+from benchmarks.common import app, db, reset_database, seed, login
+from models.pokemon import Pokemon
+from search import search_in_database, search_clause, trigram_index
+
+NAMES = ["Bulbasaur", "Charmander", "Squirtle", "Pikachu", "Eevee", "Snorlax", "Gengar", "Onix", "Psyduck", "Jigglypuff"]
+SUFFIXES = ["", "Alpha", "Mega", "Shiny", "Gigantamax", "Junior", "Prime"]
+ABILITIES = ["Overgrow", "Blaze", "Torrent", "Static", "Adaptability", "Levitate", "Sturdy", "Swift Swim"]
+
+QUERIES = [
+    ("fuzzy", "charmnder"),
+    ("fuzzy", "pika"),
+    ("fuzzy", "swift"),
+    ("prefix", "char"),
+    ("prefix", "ps"),
+]
+
+
+def prepare(pokemons):
+    """Seeds the table (unless it is already that size) with varied names and abilities."""
+    with app.app_context():
+        try:
+            existing = db.session.scalar(select(func.count(Pokemon.id)))
+        except Exception:
+            existing = None
+            db.session.rollback()
+    if existing == pokemons:
+        return
+    reset_database()
+    seed(100, pokemons)
+    with app.app_context():
+        position = Pokemon.id % (len(NAMES) * len(SUFFIXES))
+        db.session.execute(
+            update(Pokemon).values(
+                name=case({i: NAMES[i % len(NAMES)] + SUFFIXES[i // len(NAMES)] for i in range(len(NAMES) * len(SUFFIXES))}, value=position),
+                ability=case({i: ability for i, ability in enumerate(ABILITIES)}, value=Pokemon.id % len(ABILITIES)),
+            )
+        )
+        db.session.commit()
+
+
+def like_scan(query):
+    # What a search costs without a trigram index: a substring match on every row
+    pattern = f"%{query.lower()}%"
+    stmt = select(Pokemon.id).where(
+        or_(func.lower(Pokemon.name).like(pattern), func.lower(Pokemon.ability).like(pattern))
+    )
+    return db.session.scalars(stmt).all()
+
+
+def indexed_search(mode, query):
+    # Every match, ranked, the way /pokemons/search finds them
+    if search_in_database():
+        condition, rank = search_clause(query, mode)
+        return db.session.scalars(select(Pokemon.id).where(condition).order_by(rank.desc(), Pokemon.id.desc())).all()
+    return trigram_index.search(query, mode)
+
+
+def timed(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1000, len(result)
+
+
+def main(pokemons=1_000_000, repeats=5):
+    prepare(pokemons)
+    client = app.test_client()
+    headers = login(client, 0)
+    with app.app_context():
+        backend = "pg_trgm" if search_in_database() else "in-process index"
+        print(f"{pokemons:,} Pokemons on {db.engine.dialect.name}, search with {backend}")
+        if not search_in_database():
+            start = time.perf_counter()
+            trigram_index.invalidate()
+            trigram_index.search("warm", "fuzzy")
+            print(f"in-process index built in {time.perf_counter() - start:.2f}s")
+        for mode, query in QUERIES:
+            scan_ms, scan_rows = timed(lambda: like_scan(query), repeats)
+            search_ms, search_rows = timed(lambda: indexed_search(mode, query), repeats)
+            endpoint_ms, _ = timed(
+                lambda: client.get(f"/pokemons/search?q={query}&mode={mode}&limit=100", headers=headers).json["data"],
+                repeats,
+            )
+            print(
+                f"{mode:<6} {query:<10} LIKE scan {scan_ms:9.1f}ms ({scan_rows:>7,} rows)  "
+                f"search {search_ms:9.1f}ms ({search_rows:>7,} rows)  "
+                f"GET /pokemons/search first page {endpoint_ms:8.1f}ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
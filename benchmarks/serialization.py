@@ -0,0 +1,59 @@
+"""
+Measures GET /pokemons/ over a seeded table (10k Pokemons by default) with
+each serialisation setup: ORM objects through marshmallow with Flask's
+JSON provider, the same with orjson, and the column projection with orjson.
+Run with:
+
+    python -m benchmarks.serialization [pokemons] [requests]
+"""
+import sys
+import time
+from flask.json.provider import DefaultJSONProvider
+from benchmarks.common import app, reset_database, seed, login
+from json_provider import orjson, OrjsonProvider
+
+SETUPS = [
+    ("marshmallow + json", False, DefaultJSONProvider),
+    ("marshmallow + orjson", False, OrjsonProvider),
+    ("projection + orjson", True, OrjsonProvider),
+]
+
+
+def main(pokemons=10_000, requests=20):
+    if orjson is None:
+        print("orjson is not installed, pip install orjson to run this benchmark")
+        return 1
+    reset_database()
+    seed(100, pokemons)
+    client = app.test_client()
+    headers = login(client, 0)
+    default_json, default_fast_dump = app.json, app.config["FAST_DUMP"]
+    bodies = {}
+    baseline = None
+    try:
+        for label, fast_dump, provider in SETUPS:
+            app.config["FAST_DUMP"] = fast_dump
+            app.json = provider(app)
+            # Warm up once (and keep the body to compare the setups)
+            bodies[label] = client.get("/pokemons/", headers=headers).get_json()
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = client.get("/pokemons/", headers=headers)
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - start
+            rate = requests / elapsed
+            baseline = baseline or rate
+            print(
+                f"{label:<22} {rate:8.1f} req/s  {pokemons * rate:12.0f} rows/s  "
+                f"{rate / baseline:5.1f}x"
+            )
+    finally:
+        app.json, app.config["FAST_DUMP"] = default_json, default_fast_dump
+    if len({repr(body) for body in bodies.values()}) != 1:
+        print("the setups returned different bodies")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:3])))
@@ -0,0 +1,121 @@
+"""
+Fails when importing an entry point takes longer than its startup budget.
+
+Every `flask db ...` command and every cold started worker pays for these
+imports before doing anything. Each entry point is imported in a fresh
+interpreter with `python -X importtime`, a few times over; the median
+import time is checked against the budget and broken down by package (own
+time of its modules), so a heavy new dependency shows up by name. Run with:
+
+    python -m benchmarks.startup [--repeat 5] [--budget app=1000]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point -> largest median import time allowed (milliseconds)
+BUDGETS = {
+    # the `flask db` commands only (create_app(blueprints=["db"]))
+    "manage": 900,
+    # the whole Flask API
+    "app": 1000,
+    # the async views on the Flask app's configuration
+    "asgi": 1300,
+}
+
+# Packages of this repository, marked in the breakdown
+FIRST_PARTY = {
+    name.removesuffix(".py")
+    for name in os.listdir(ROOT)
+    if name.endswith(".py") or os.path.isfile(os.path.join(ROOT, name, "__init__.py"))
+} | {"blueprints", "models"}
+
+
+def parse_importtime(stderr):
+    """Returns [(module, own microseconds, cumulative microseconds)] from -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def import_once(entry):
+    env = {
+        **os.environ,
+        # The same throwaway settings as the other benchmarks, nothing is connected to
+        "DB_URI": os.environ.get("DB_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "pokemon_bench.db")),
+        "JWT_KEY": os.environ.get("JWT_KEY", "benchmark-secret-key-benchmark-secret"),
+    }
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entry}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {entry} failed:\n{completed.stderr[-2000:]}")
+    modules = parse_importtime(completed.stderr)
+    total = next(cumulative for name, _, cumulative in modules if name == entry)
+    return total / 1000, wall * 1000, modules
+
+
+def breakdown(modules, top=12):
+    """Own import time summed per top level package, largest first."""
+    packages = {}
+    for name, own, _ in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + own
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point")
+    parser.add_argument(
+        "--budget", action="append", default=[], metavar="ENTRY=MS",
+        help="override a budget, e.g. --budget app=1500 (slower CI machines)",
+    )
+    parser.add_argument("--entries", default=",".join(BUDGETS), help="comma separated entry points")
+    args = parser.parse_args()
+    budgets = dict(BUDGETS)
+    for override in args.budget:
+        entry, _, milliseconds = override.partition("=")
+        budgets[entry] = float(milliseconds)
+
+    failures = []
+    for entry in args.entries.split(","):
+        runs = [import_once(entry) for _ in range(args.repeat)]
+        imports = [run[0] for run in runs]
+        walls = [run[1] for run in runs]
+        median = statistics.median(imports)
+        budget = budgets[entry]
+        status = "ok" if median <= budget else "OVER BUDGET"
+        print(
+            f"{entry:<8} import {median:7.1f}ms (min {min(imports):.1f}ms)  "
+            f"process {statistics.median(walls):7.1f}ms  budget {budget:.0f}ms  {status}"
+        )
+        # Break down the run closest to the median
+        _, _, modules = min(runs, key=lambda run: abs(run[0] - median))
+        for package, own in breakdown(modules):
+            marker = "*" if package in FIRST_PARTY else " "
+            print(f"    {marker} {package:<24} {own / 1000:7.1f}ms")
+        if median > budget:
+            failures.append(entry)
+
+    print("\n* this repository's modules")
+    if failures:
+        print(f"Over the startup budget: {', '.join(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Benchmark suite: seeds a database at each size, drives every route in
+benchmarks/routes.py through the Flask test client and through a real
+threaded WSGI server, and runs the micro-benchmarks in benchmarks/micro.py.
+Reports p50/p95/p99 latency, throughput and SQL statements per request, and
+writes everything to JSON. Run with:
+
+    python -m benchmarks.suite --sizes 1000,100000 --output results.json
+    python -m benchmarks.suite --baseline results.json   # exit 1 on regressions
+
+Each size runs in its own process on its own SQLite file (reused with
+--reuse), or on DB_URI when it is set (e.g. PostgreSQL, reseeded per size).
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+# benchmarks.common and the app are imported in run_size, once DB_URI is set for the size
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--sizes", default="1k", help="Pokemon counts, e.g. 1k,100k,1m or 5000")
+    parser.add_argument("--iterations", type=int, default=200, help="requests per route (scaled per route)")
+    parser.add_argument("--drivers", default="client,wsgi", help="client and/or wsgi")
+    parser.add_argument("--concurrency", type=int, default=8, help="connections used by the wsgi driver")
+    parser.add_argument("--routes", default="", help="only run routes whose name contains this")
+    parser.add_argument("--no-micro", action="store_true", help="skip the micro-benchmarks")
+    parser.add_argument("--reuse", action="store_true", help="reuse an already seeded SQLite file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this results file, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def summarise(latencies, elapsed, statements, errors):
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_rps": count / elapsed if elapsed else 0.0,
+        "sql_per_request": statements / count if count else 0.0,
+    }
+
+
+def drive_client(client, method, requests):
+    """Sends the requests one after the other through the Flask test client."""
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for path, body, headers in requests:
+        began = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers)
+        # Read streamed bodies to the end so their queries are counted
+        response.get_data()
+        latencies.append(time.perf_counter() - began)
+        errors += response.status_code >= 300
+    return latencies, errors, time.perf_counter() - start
+
+
+def drive_wsgi(port, method, requests, concurrency):
+    """Sends the requests over `concurrency` keep-alive HTTP connections."""
+    latencies = []
+    errors = []
+    pending = iter(requests)
+    lock = threading.Lock()
+
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                break
+            path, body, headers = request
+            payload = None if body is None else json.dumps(body)
+            headers = {**headers, "Content-Type": "application/json"} if payload else headers
+            began = time.perf_counter()
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                if response.status >= 300:
+                    errors.append(response.status)
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.perf_counter() - start
+
+
+class QuietHandler(WSGIRequestHandler):
+    # The access log would flood the report
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def run_size(args, size):
+    """Seeds the database and benchmarks every route and the micro-benchmarks at one size."""
+    from benchmarks.common import app, db, reset_database, seed, count_queries
+    from benchmarks.routes import ROUTES, Fixture
+    from benchmarks import micro
+
+    if not args.reuse:
+        reset_database()
+        seed(max(10, size // 100), size)
+    client = app.test_client()
+    fixture = Fixture(client)
+    drivers = [driver.strip() for driver in args.drivers.split(",") if driver.strip()]
+    server = None
+    if "wsgi" in drivers:
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    try:
+        for route in ROUTES:
+            if args.routes not in route.name or (route.max_size and size > route.max_size):
+                continue
+            for driver in drivers:
+                requests = route.build(fixture, route.iterations(args.iterations))
+                with count_queries() as statements:
+                    if driver == "client":
+                        latencies, errors, elapsed = drive_client(client, route.method, requests)
+                    else:
+                        latencies, errors, elapsed = drive_wsgi(
+                            server.port, route.method, requests, args.concurrency
+                        )
+                result = summarise(latencies, elapsed, len(statements), errors)
+                results[f"{size}/{driver}/{route.name}"] = result
+                print(
+                    f"{size:>8} {driver:<7} {route.name:<22} p50 {result['p50_ms']:8.2f}ms  "
+                    f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  "
+                    f"{result['throughput_rps']:8.1f} req/s  {result['sql_per_request']:5.1f} sql  "
+                    f"errors {errors}",
+                    flush=True,
+                )
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if not args.no_micro:
+        for name, result in micro.run(args.iterations).items():
+            results[f"{size}/micro/{name}"] = result
+            print(f"{size:>8} micro   {name:<22} {result['mean_us']:12.1f}us  {result['ops_per_sec']:12.1f} ops/s")
+
+    with app.app_context():
+        database = db.engine.dialect.name
+    return results, database
+
+
+def compare(baseline, current, threshold):
+    """
+    Compares two results files and returns the regressions: a route whose
+    p95 got slower by more than `threshold` (and by more than a millisecond,
+    below that it is noise), a route that now sends more SQL statements per
+    request, or a micro-benchmark whose mean time got slower by `threshold`.
+    """
+    regressions = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        if "/micro/" in key:
+            if result["mean_us"] > before["mean_us"] * (1 + threshold):
+                regressions.append(f"{key}: {before['mean_us']:.1f}us -> {result['mean_us']:.1f}us")
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + threshold) and result["p95_ms"] - before["p95_ms"] > 1:
+            regressions.append(f"{key}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+        if result["sql_per_request"] > before["sql_per_request"] + 0.5:
+            regressions.append(
+                f"{key}: {before['sql_per_request']:.1f} -> {result['sql_per_request']:.1f} SQL statements per request"
+            )
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{key}: {before['errors']} -> {result['errors']} failed requests")
+    return regressions
+
+
+def run_in_subprocess(argv, size):
+    """Runs one size in a fresh process (the database URI is fixed at import)."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as output:
+        path = output.name
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", *argv, "--sizes", str(size), "--output", path],
+            check=True,
+        )
+        with open(path) as results_file:
+            return json.load(results_file)
+    finally:
+        os.unlink(path)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+
+    if len(sizes) > 1:
+        # Pass everything but the sizes, output and baseline down to one process per size
+        child_argv = []
+        skip = False
+        for arg in argv:
+            if skip:
+                skip = False
+                continue
+            if arg in ("--sizes", "--output", "--baseline"):
+                skip = True
+                continue
+            if not arg.startswith(("--sizes=", "--output=", "--baseline=")):
+                child_argv.append(arg)
+        report = {"meta": None, "results": {}}
+        for size in sizes:
+            part = run_in_subprocess(child_argv, size)
+            report["meta"] = report["meta"] or part["meta"]
+            report["results"].update(part["results"])
+        report["meta"]["sizes"] = sizes
+    else:
+        if "DB_URI" not in os.environ:
+            os.environ["DB_URI"] = "sqlite:///" + os.path.join(
+                tempfile.gettempdir(), f"pokemon_bench_{sizes[0]}.db"
+            )
+        results, database = run_size(args, sizes[0])
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "database": database,
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "sizes": sizes,
+            },
+            "results": results,
+        }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
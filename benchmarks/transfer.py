@@ -0,0 +1,119 @@
+"""
+Checks the throughput of `flask db export` and `flask db import` against
+their targets on a seeded table (1M Pokemons by default): exports to gzip
+compressed NDJSON and CSV, then imports the NDJSON file into an empty
+database. Each command runs in its own process, the way it is used, so its
+peak memory is measured too and shows whether it stays flat with the row
+count. Exits with an error when a step is below its target. Run with:
+
+    python -m benchmarks.transfer [--pokemons 1000000] [--target "import ndjson=5000"]
+
+Reuses the seeded table when it already has that many Pokemons. The import
+goes to a throwaway SQLite file unless --import-uri is given.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import func, select
+from benchmarks.common import app, db, reset_database
+from models.pokemon import Pokemon
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Step -> fewest records per second allowed. Imports run every record through the
+# marshmallow schemas, which takes most of their time
+TARGETS = {
+    "export ndjson": 50_000,
+    "export csv": 40_000,
+    "import ndjson": 10_000,
+}
+
+
+def flask(uri, *args):
+    """Runs a `flask --app manage` command, returning (seconds, peak memory in MB)."""
+    env = {**os.environ, "DB_URI": uri, "EVENT_LOG_BACKEND": "none"}
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "flask", "--app", "manage", *args],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=stderr,
+        )
+        # wait4 rather than wait, for the child's resource usage
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        if os.waitstatus_to_exitcode(status) != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"flask {' '.join(args)} failed:\n{stderr.read().decode()[-2000:]}")
+    # ru_maxrss is in kilobytes on Linux
+    return seconds, usage.ru_maxrss / 1024
+
+
+def prepare(uri, trainers, pokemons):
+    """Seeds the table with `db seed` unless it already has that many Pokemons."""
+    with app.app_context():
+        try:
+            existing = db.session.scalar(select(func.count(Pokemon.id)))
+        except Exception:
+            existing = None
+            db.session.rollback()
+    if existing == pokemons:
+        return
+    reset_database()
+    # In another process too: a child's peak memory starts from its parent's size when forked
+    flask(uri, "db", "seed", "--trainers", str(trainers), "--pokemons", str(pokemons), "--seed", "1")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.transfer")
+    parser.add_argument("--pokemons", type=int, default=1_000_000)
+    parser.add_argument("--trainers", type=int, default=1000)
+    parser.add_argument("--import-uri", help="database the import goes to (emptied first)")
+    parser.add_argument(
+        "--target", action="append", default=[], metavar="STEP=RECORDS_PER_SECOND",
+        help='override a target, e.g. --target "import ndjson=10000" (slower CI machines)',
+    )
+    args = parser.parse_args()
+    targets = dict(TARGETS)
+    for override in args.target:
+        step, _, rate = override.partition("=")
+        targets[step] = float(rate)
+
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    prepare(uri, args.trainers, args.pokemons)
+    directory = tempfile.mkdtemp(prefix="pokemon_transfer_")
+    import_uri = args.import_uri or "sqlite:///" + os.path.join(directory, "import.db")
+    records = args.trainers + args.pokemons
+    print(f"{args.trainers:,} trainers and {args.pokemons:,} Pokemons on {uri.split(':')[0]}")
+
+    failures = []
+
+    def report(step, seconds, memory, path=None):
+        rate = records / seconds
+        size = f"  {os.path.getsize(path) / 1024 / 1024:7.1f}MB file" if path else ""
+        status = "ok" if rate >= targets[step] else "BELOW TARGET"
+        print(
+            f"{step:<14} {seconds:7.1f}s  {rate:10,.0f} records/s  peak {memory:6.0f}MB{size}  "
+            f"target {targets[step]:,.0f}/s  {status}"
+        )
+        if rate < targets[step]:
+            failures.append(step)
+
+    for format in ("ndjson", "csv"):
+        path = os.path.join(directory, f"export.{format}.gz")
+        seconds, memory = flask(uri, "db", "export", path)
+        report(f"export {format}", seconds, memory, path)
+
+    flask(import_uri, "db", "create")
+    seconds, memory = flask(import_uri, "db", "import", os.path.join(directory, "export.ndjson.gz"))
+    report("import ndjson", seconds, memory)
+
+    if failures:
+        print(f"Below the throughput target: {', '.join(failures)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import asyncio
+from datetime import date
+from quart import Blueprint, g, request, jsonify
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.orm import joinedload
+from init import app
+from auth import owned_pokemon
+from async_db import async_session
+from async_auth import admin_only, authorize_owner_pokemon, get_jwt_identity, is_admin, jwt_required, ApiError
+from async_pagination import list_response, fetch_all, wants_stream, paginate, page_args
+from projection import listing
+from filtering import date_arg, sparse_schema
+from stats import STATS_BUILDING, latest_refresh_async, pokemon_queries, pokemon_stats_body
+from search import search_args, search_in_database, search_clause, search_sort, page_in_app_context
+from models.pokemon import Pokemon
+from blueprints.pokemons_bp import (
+    pokemon_schema,
+    pokemons_schema,
+    pokemon_input_schema,
+    pokemon_fields_schema,
+    pokemon_listing,
+    parse_ndjson,
+    check_batch,
+    load_batch,
+    batch_ids,
+    batch_response,
+    checked_type,
+    ownership_error,
+)
+
+# The pokemons_bp routes as async views for the ASGI app (see asgi.py),
+# with the same paths, schemas and responses
+async_pokemons_bp = Blueprint("pokemons", __name__, url_prefix="/pokemons")
+
+
+# Get all Pokemons (R) (only admin can do this)
+@async_pokemons_bp.route("/")
+@admin_only
+async def all_pokemons():
+    conditions, sort, schema = pokemon_listing(request.args)
+    stmt, dumper = listing(Pokemon, schema, app.config["FAST_DUMP"])
+    return await list_response(stmt.where(*conditions), Pokemon, dumper, sort)
+
+
+# The Pokemons owned by the authenticated trainer (R)
+@async_pokemons_bp.route("/owned")
+@jwt_required
+async def get_owned_pokemons():
+    if request.args or wants_stream():
+        return await owned_pokemons_listing(get_jwt_identity())
+    stmt, dumper = listing(Pokemon, pokemons_schema, app.config["FAST_DUMP"])
+    stmt = stmt.where(Pokemon.trainer_id == get_jwt_identity()).order_by(Pokemon.id)
+    async with async_session() as session:
+        rows = await fetch_all(session, stmt, dumper)
+    if not rows:
+        raise ApiError(404, "No Pokemon found for this trainer.")
+    return jsonify(dumper.dump(rows, many=True))
+
+
+# Filtered, sorted, sparse or paginated owned Pokemons, see pokemons_bp.owned_pokemons_listing
+async def owned_pokemons_listing(trainer_id):
+    conditions, sort, schema = pokemon_listing(request.args)
+    async with async_session() as session:
+        owns_any = await session.scalar(select(Pokemon.id).where(Pokemon.trainer_id == trainer_id).limit(1))
+    if owns_any is None:
+        raise ApiError(404, "No Pokemon found for this trainer.")
+    stmt, dumper = listing(Pokemon, schema, app.config["FAST_DUMP"])
+    stmt = stmt.where(Pokemon.trainer_id == trainer_id, *conditions)
+    return await list_response(stmt, Pokemon, dumper, sort)
+
+
+# Pokemon counts from the rollup tables, see pokemons_bp.pokemon_stats
+@async_pokemons_bp.route("/stats")
+@admin_only
+async def pokemon_stats():
+    caught_from = date_arg(request.args, "caught_from")
+    caught_to = date_arg(request.args, "caught_to")
+    async with async_session() as session:
+        refresh = await latest_refresh_async(session)
+        if refresh is None:
+            raise ApiError(503, STATS_BUILDING, {"Retry-After": "1"})
+        rows = {
+            name: (await session.execute(query)).all()
+            for name, query in pokemon_queries(caught_from, caught_to).items()
+        }
+    return pokemon_stats_body(refresh, rows)
+
+
+# Search Pokemons by name and ability, see pokemons_bp.search_pokemons
+@async_pokemons_bp.route("/search")
+@jwt_required
+async def search_pokemons():
+    query, mode = search_args(request.args)
+    schema = sparse_schema(request.args, pokemons_schema)
+    trainer_id = get_jwt_identity()
+    if g.jwt.get("admin") is not False and await is_admin(trainer_id):
+        trainer_id = None
+    stmt, dumper = listing(Pokemon, schema, app.config["FAST_DUMP"])
+    if trainer_id is not None:
+        stmt = stmt.where(Pokemon.trainer_id == trainer_id)
+    async with async_session() as session:
+        if search_in_database():
+            condition, rank = search_clause(query, mode)
+            return await paginate(session, stmt.where(condition), Pokemon, dumper, search_sort(rank))
+        # The in-process index ranks on a worker thread, off the event loop
+        limit, after = page_args()
+        matches, next_cursor = await asyncio.to_thread(
+            page_in_app_context, query, mode, trainer_id, search_sort(), after, limit
+        )
+        ids = [pokemon_id for _, pokemon_id in matches]
+        rows = {row.id: row for row in await fetch_all(session, stmt.where(Pokemon.id.in_(ids)), dumper)}
+    page = [rows[pokemon_id] for pokemon_id in ids if pokemon_id in rows]
+    return {"data": dumper.dump(page, many=True), "next_cursor": next_cursor}
+
+
+# Get one Pokemon (R)
+@async_pokemons_bp.route("/<int:id>")
+@jwt_required
+async def get_one_pokemon(id):
+    async with async_session() as session:
+        # Only the trainer's own Pokemon, with its trainer in the same query (async sessions
+        # cannot lazy load), telling 404 and 403 apart only when nothing matched
+        stmt = (
+            select(Pokemon)
+            .options(joinedload(Pokemon.trainer))
+            .where(*owned_pokemon(id, get_jwt_identity()))
+        )
+        pokemon = await session.scalar(stmt)
+        if pokemon is None:
+            await authorize_owner_pokemon(session, id)
+    return pokemon_schema.dump(pokemon)
+
+
+# Add a Pokemon (C)
+@async_pokemons_bp.route("/create", methods=["POST"])
+@jwt_required
+async def adding_pokemon():
+    pokemon_info = pokemon_input_schema.load(await request.get_json())
+    pokemon = Pokemon(
+        name=pokemon_info["name"],
+        type=checked_type(pokemon_info),
+        ability=pokemon_info["ability"],
+        date_caught=date.today(),
+        trainer_id=get_jwt_identity(),
+    )
+    async with async_session() as session:
+        session.add(pokemon)
+        await session.commit()
+        # Load the trainer for the response
+        await session.refresh(pokemon, ["trainer"])
+    return pokemon_schema.dump(pokemon), 201
+
+
+# Update a Pokemon (U), one UPDATE ... RETURNING scoped to the trainer's own Pokemon
+@async_pokemons_bp.route("/update/<int:id>", methods=["PUT", "PATCH"])
+@jwt_required
+async def update_pokemon(id):
+    pokemon_info = pokemon_input_schema.load(await request.get_json())
+    stmt = (
+        update(Pokemon)
+        .where(*owned_pokemon(id, get_jwt_identity()))
+        .values({**pokemon_info, "type": checked_type(pokemon_info)})
+        .returning(Pokemon.name, Pokemon.type, Pokemon.ability)
+        .execution_options(synchronize_session=False)
+    )
+    async with async_session() as session:
+        pokemon = (await session.execute(stmt)).first()
+        if pokemon is None:
+            await authorize_owner_pokemon(session, id)
+        await session.commit()
+    return pokemon_fields_schema.dump(pokemon._mapping), 200
+
+
+# Delete a Pokemon (D), one DELETE scoped to the trainer's own Pokemon
+@async_pokemons_bp.route("/delete/<int:id>", methods=["DELETE"])
+@jwt_required
+async def delete_pokemon(id):
+    stmt = (
+        delete(Pokemon)
+        .where(*owned_pokemon(id, get_jwt_identity()))
+        .execution_options(synchronize_session=False)
+    )
+    async with async_session() as session:
+        if (await session.execute(stmt)).rowcount == 0:
+            await authorize_owner_pokemon(session, id)
+        await session.commit()
+    return {"message": "The pokemon has successfully been deleted!"}
+
+
+# Read a batch from a JSON array or an NDJSON body
+async def read_batch():
+    if request.mimetype == "application/x-ndjson":
+        items = parse_ndjson(await request.get_data(as_text=True))
+    else:
+        items = await request.get_json()
+    return check_batch(items, app.config["BULK_MAX_BATCH_SIZE"])
+
+
+async def owners_of(session, ids):
+    stmt = select(Pokemon.id, Pokemon.trainer_id).where(
+        Pokemon.id.in_({pokemon_id for pokemon_id in ids if pokemon_id is not None})
+    )
+    return dict((await session.execute(stmt)).all())
+
+
+# Bulk create (C), see pokemons_bp.bulk_adding_pokemons
+@async_pokemons_bp.route("/bulk", methods=["POST"])
+@jwt_required
+async def bulk_adding_pokemons():
+    items = await read_batch()
+    valid, errors = load_batch(items)
+    trainer_id = get_jwt_identity()
+    rows = [
+        {**pokemon_info, "date_caught": date.today(), "trainer_id": trainer_id}
+        for pokemon_info in valid.values()
+    ]
+    ids = []
+    if rows:
+        async with async_session() as session:
+            stmt = insert(Pokemon).returning(Pokemon.id, sort_by_parameter_order=True)
+            ids = (await session.scalars(stmt, rows)).all()
+            await session.commit()
+    created = dict(zip(valid, ids))
+    results = [
+        {"index": index, "id": created[index], "status": 201}
+        if index in created
+        else {"index": index, "status": 400, "errors": errors[index]}
+        for index in range(len(items))
+    ]
+    return batch_response(results, 201)
+
+
+# Bulk update (U), see pokemons_bp.bulk_update_pokemons
+@async_pokemons_bp.route("/bulk", methods=["PUT", "PATCH"])
+@jwt_required
+async def bulk_update_pokemons():
+    items = await read_batch()
+    ids = batch_ids(items)
+    valid, errors = load_batch(items, partial=request.method == "PATCH")
+    trainer_id = get_jwt_identity()
+    async with async_session() as session:
+        owners = await owners_of(session, ids)
+        results = []
+        rows = []
+        for index, pokemon_id in enumerate(ids):
+            result = ownership_error(index, pokemon_id, owners, trainer_id)
+            if result is None and index in errors:
+                result = {"index": index, "id": pokemon_id, "status": 400, "errors": errors[index]}
+            if result is None:
+                rows.append({"id": pokemon_id, **valid[index]})
+                result = {"index": index, "id": pokemon_id, "status": 200}
+            results.append(result)
+        if rows:
+            stmt = (
+                update(Pokemon)
+                .where(Pokemon.trainer_id == trainer_id)
+                .execution_options(synchronize_session=None)
+            )
+            await session.execute(stmt, rows)
+            await session.commit()
+    return batch_response(results, 200)
+
+
+# Bulk delete (D), see pokemons_bp.bulk_delete_pokemons
+@async_pokemons_bp.route("/bulk", methods=["DELETE"])
+@jwt_required
+async def bulk_delete_pokemons():
+    items = await read_batch()
+    ids = batch_ids(items)
+    trainer_id = get_jwt_identity()
+    async with async_session() as session:
+        owners = await owners_of(session, ids)
+        results = []
+        deletable = set()
+        for index, pokemon_id in enumerate(ids):
+            result = ownership_error(index, pokemon_id, owners, trainer_id)
+            if result is None:
+                deletable.add(pokemon_id)
+                result = {"index": index, "id": pokemon_id, "status": 200}
+            results.append(result)
+        if deletable:
+            stmt = delete(Pokemon).where(
+                Pokemon.id.in_(deletable), Pokemon.trainer_id == trainer_id
+            )
+            await session.execute(stmt)
+            await session.commit()
+    return batch_response(results, 200)
@@ -0,0 +1,219 @@
+import asyncio
+from quart import Blueprint, request, abort, current_app
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+from init import app
+from async_db import async_session
+from async_auth import (
+    ApiError,
+    admin_only,
+    authorize_owner_trainer,
+    check_password,
+    get_jwt,
+    hash_password,
+    issue_token,
+    jwt_required,
+)
+from async_pagination import list_response
+from hashing import needs_rehash
+from projection import listing
+from ratelimit import consume, by_account, by_ip
+from stats import STATS_BUILDING, latest_refresh_async, trainer_queries, trainer_stats_body
+from revocation import TOKEN_LIFETIME, already_revoked, revoke_token, revoke_trainer_tokens
+from transfer import Encoder, GzipChunks, export_queries
+from models.trainer import Trainer, gym_types
+from blueprints.trainers_bp import (
+    login_schema,
+    trainers_schema,
+    trainer_public_schema,
+    trainer_create_schema,
+    trainer_created_schema,
+    trainer_update_schema,
+    trainer_updated_schema,
+    unique_violation,
+    export_args,
+    export_headers,
+)
+
+# The trainers_bp routes as async views for the ASGI app (see asgi.py),
+# with the same paths, schemas and responses
+async_trainers_bp = Blueprint("trainers", __name__, url_prefix="/trainers")
+
+
+# Trainer Login
+@async_trainers_bp.route("/login", methods=["POST"])
+async def login():
+    body = await request.get_json(silent=True)
+    # Attempts are limited per address and per account before any lookup or bcrypt work,
+    # on a worker thread since the Redis buckets are a blocking round trip
+    allowed, _, headers = await asyncio.to_thread(
+        consume,
+        "login",
+        [
+            (by_ip(request.remote_addr), app.config["RATE_LIMIT_LOGIN_IP"]),
+            (by_account(body), app.config["RATE_LIMIT_LOGIN_ACCOUNT"]),
+        ],
+    )
+    if not allowed:
+        raise ApiError(429, "Too many requests, please try again later", headers)
+    # get the username, email and password from the request
+    params = login_schema.load(body)
+    async with async_session() as session:
+        # find the trainer by email address and the username
+        stmt = select(Trainer).where(
+            and_(Trainer.email == params["email"], Trainer.username == params["username"])
+        )
+        trainer = await session.scalar(stmt)
+        if not trainer or not await check_password(trainer.password, params["password"]):
+            # Error handling if trainer is not found, wrong username or wrong password)
+            abort(401, description="Invalid username, email or password")
+        # Upgrade the stored hash if the work factor setting has changed since it was made
+        if needs_rehash(trainer.password, app.config["BCRYPT_LOG_ROUNDS"]):
+            trainer.password = await hash_password(params["password"])
+            await session.commit()
+    # Generate the JWT that works for 8 hours, carrying the admin role as a signed claim
+    token = issue_token(
+        identity=trainer.id,
+        additional_claims={"admin": bool(trainer.admin)},
+        expires_delta=TOKEN_LIFETIME,
+    )
+    return {"token": token}, 200, headers
+
+
+# Trainer Logout
+@async_trainers_bp.route("/logout", methods=["POST"])
+@jwt_required
+async def logout():
+    async with async_session() as session:
+        revoke_token(session, get_jwt())
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Logged out by a concurrent request, see trainers_bp.logout
+            await session.rollback()
+            already_revoked(get_jwt())
+    return {"message": "You have successfully been logged out!"}
+
+
+# Get all Trainers (R) (only admin can do this)
+@async_trainers_bp.route("")
+@admin_only
+async def all_trainers():
+    stmt, dumper = listing(Trainer, trainers_schema, app.config["FAST_DUMP"])
+    return await list_response(stmt, Trainer, dumper)
+
+
+# Trainer and Pokemon counts per team from the rollup tables, see trainers_bp.trainer_stats
+@async_trainers_bp.route("/stats")
+@admin_only
+async def trainer_stats():
+    async with async_session() as session:
+        refresh = await latest_refresh_async(session)
+        if refresh is None:
+            raise ApiError(503, STATS_BUILDING, {"Retry-After": "1"})
+        rows = {name: (await session.execute(query)).all() for name, query in trainer_queries().items()}
+    return trainer_stats_body(refresh, rows)
+
+
+# Export trainers and their Pokemons as a gzip compressed NDJSON or CSV file (only admin
+# can do this), see trainers_bp.export_trainers
+@async_trainers_bp.route("/export")
+@admin_only
+async def export_trainers():
+    format, usernames = export_args(request.args)
+    encoder = Encoder(format, current_app.json.dumps)
+    chunk_size = app.config["STREAM_CHUNK_SIZE"]
+
+    async def generate():
+        chunks = GzipChunks()
+        if data := chunks.write(encoder.header()):
+            yield data
+        async with async_session() as session:
+            for stmt, record in export_queries(usernames, passwords=False):
+                result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+                async for row in result:
+                    if data := chunks.write(encoder.line(record(row))):
+                        yield data
+        yield chunks.close()
+
+    return generate(), 200, export_headers(format)
+
+
+# Get One Trainer (R)
+@async_trainers_bp.route("/<int:id>")
+async def one_trainer(id):
+    async with async_session() as session:
+        trainer = await session.get(Trainer, id)
+    if trainer is None:
+        abort(404)
+    return trainer_public_schema.dump(trainer)
+
+
+# Create a Trainer (C)
+@async_trainers_bp.route("/create", methods=["POST"])
+async def create_trainer():
+    trainer_info = trainer_create_schema.load(await request.get_json())
+    # checks if the team matches with the existing teams in the models
+    if trainer_info["team"].capitalize() not in gym_types.enums:
+        abort(400, description=f"This is a Invalid Gym team: {trainer_info['team']}")
+    trainer = Trainer(
+        name=trainer_info["name"],
+        username=trainer_info["username"],
+        email=trainer_info["email"],
+        password=await hash_password(trainer_info["password"]),
+        team=trainer_info["team"].capitalize(),
+    )
+    async with async_session() as session:
+        session.add(trainer)
+        # The unique constraints on username and email reject duplicates
+        try:
+            await session.commit()
+        except IntegrityError as err:
+            await session.rollback()
+            if unique_violation(err) is None:
+                raise
+            abort(400, description="This trainer is already registered!")
+    return trainer_created_schema.dump(trainer), 201
+
+
+# update an existing trainer (U)
+@async_trainers_bp.route("/update/<int:id>", methods=["PUT", "PATCH"])
+@jwt_required
+async def update_trainer(id):
+    async with async_session() as session:
+        trainer = await session.get(Trainer, id)
+        if trainer is None:
+            abort(404)
+        authorize_owner_trainer(trainer)
+        trainer_info = trainer_update_schema.load(await request.get_json())
+        trainer.name = trainer_info.get("name", trainer.name)
+        trainer.username = trainer_info.get("username", trainer.username)
+        trainer.email = trainer_info.get("email", trainer.email)
+        if "password" in trainer_info:
+            trainer.password = await hash_password(trainer_info["password"])
+        try:
+            await session.commit()
+        except IntegrityError as err:
+            await session.rollback()
+            column = unique_violation(err)
+            if column == "username":
+                abort(400, description="Username already registered")
+            if column == "email":
+                abort(400, description="Email already registered")
+            raise
+    return trainer_updated_schema.dump(trainer), 200
+
+
+# Delete an existing Trainer (D)
+@async_trainers_bp.route("/delete/<int:id>", methods=["DELETE"])
+@jwt_required
+async def delete_trainer(id):
+    async with async_session() as session:
+        trainer = await session.get(Trainer, id)
+        if trainer is None:
+            abort(404)
+        authorize_owner_trainer(trainer)
+        await session.delete(trainer)
+        revoke_trainer_tokens(session, trainer.id)
+        await session.commit()
+    return {"message": "The trainer has successfully been deleted!"}
@@ -1,8 +1,23 @@
-from datetime import date
-from flask import Blueprint
-from models.pokemon import Pokemon
-from models.trainer import Trainer
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import date, timedelta
+from functools import partial
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import func, insert
+from models.pokemon import Pokemon, pokemon_types
+from models.trainer import Trainer, gym_types
+from models.event import ChangeEvent  # noqa: F401 (so `db create` makes its table)
+from models.revoked_token import RevokedToken  # noqa: F401 (so `db create` makes its table)
 from init import db, bcrypt
+from stats import refresh_stats
+from versions import pokemons_changed
+from transfer import (
+    FORMATS, Encoder, export_format, export_records, import_batch, known_trainers, open_export, read_records,
+)
 
 # Defines a Blueprint for database commands
 db_commands = Blueprint("db", __name__)
@@ -93,5 +108,311 @@ def db_create():
     # Commit the changes to the database
     db.session.commit()
 
+    # Build the statistics rollups for the sample data
+    refresh_stats()
+
     # printing a message to ensure that data has been inserted successfully
     print("Pokemons and trainers have been added to the database!")
+
+
+# Word lists the synthetic data is built from
+FIRST_NAMES = ["Ash", "Misty", "Brock", "Gary", "May", "Dawn", "Iris", "Cilan", "Serena", "Clemont"]
+LAST_NAMES = ["Ketchum", "Waterflower", "Harrison", "Oak", "Maple", "Berlitz", "Stone", "Birch"]
+POKEMON_NAMES = [
+    "Bulbasaur", "Charmander", "Squirtle", "Pikachu", "Eevee", "Snorlax", "Gengar",
+    "Onix", "Psyduck", "Jigglypuff", "Meowth", "Machop", "Geodude", "Magikarp", "Dratini",
+]
+ABILITIES = ["Overgrow", "Blaze", "Torrent", "Static", "Adaptability", "Levitate", "Sturdy", "Swift Swim"]
+# Latest catch date of a `db seed --seed N` run, so the same seed gives the same rows on any day
+SEED_UNTIL = date(2024, 12, 31)
+
+
+def synthetic_trainers(rng, start, count, password):
+    """Yields `count` trainer rows with unique usernames and emails numbered from `start`."""
+    teams = gym_types.enums
+    for number in range(start, start + count):
+        first_name = rng.choice(FIRST_NAMES)
+        # letters and digits only, at most 15 characters, unique through the number
+        username = f"{first_name[:4].lower()}{number}"
+        yield {
+            "name": f"{first_name} {rng.choice(LAST_NAMES)}",
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": password,
+            "team": rng.choice(teams),
+            "admin": False,
+        }
+
+
+def synthetic_pokemons(rng, count, trainer_ids, until):
+    """Yields `count` Pokemon rows caught by random trainers in the three years up to `until`."""
+    types = pokemon_types.enums
+    for _ in range(count):
+        yield {
+            "name": rng.choice(POKEMON_NAMES),
+            "type": rng.choice(types),
+            "ability": rng.choice(ABILITIES),
+            "date_caught": until - timedelta(days=rng.randrange(3 * 365)),
+            "trainer_id": rng.choice(trainer_ids) if trainer_ids else None,
+        }
+
+
+def batches(rows, batch_size):
+    """Groups an iterable of rows into lists of at most `batch_size` rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(table, batch):
+    """Loads a batch with PostgreSQL COPY ... FROM STDIN, the fastest way in."""
+    # COPY knows nothing of the defaults computed in Python (e.g. Pokemon.uuid), fill them in
+    defaults = {
+        column.name: column.default.arg
+        for column in table.columns
+        if column.name not in batch[0] and column.default is not None and column.default.is_callable
+    }
+    if defaults:
+        batch = [{**row, **{name: default(None) for name, default in defaults.items()}} for row in batch]
+    columns = list(batch[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["" if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.driver_connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+    if table is Pokemon.__table__:
+        # COPY bypasses the session, tell it whose Pokemons changed
+        pokemons_changed(db.session, {row["trainer_id"] for row in batch})
+
+
+def bulk_load(model, rows, batch_size, use_copy, label):
+    """Inserts the rows in batches, committing and reporting progress after each batch."""
+    loaded = 0
+    start = time.perf_counter()
+    for batch in batches(rows, batch_size):
+        if use_copy:
+            copy_rows(model.__table__, batch)
+        else:
+            # Core executemany, skipping the ORM unit of work entirely
+            db.session.execute(insert(model.__table__), batch)
+        db.session.commit()
+        loaded += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"\r{label}: {loaded:,} rows ({loaded / elapsed:,.0f} rows/s)", end="", flush=True)
+    if loaded:
+        print()
+    return loaded
+
+
+@db_commands.cli.command("seed")
+@click.option("--trainers", default=100, show_default=True, help="Number of trainers to add.")
+@click.option("--pokemons", default=1000, show_default=True, help="Number of Pokemons to add.")
+@click.option("--seed", "random_seed", type=int, help="Random seed for reproducible data.")
+@click.option(
+    "--until", type=click.DateTime(["%Y-%m-%d"]),
+    help=f"Latest date_caught (default: today, or {SEED_UNTIL} with --seed).",
+)
+@click.option("--batch-size", default=10_000, show_default=True, help="Rows per commit.")
+@click.option("--password", default="pokemonpassword", show_default=True, help="Password of every synthetic trainer.")
+@click.option("--copy/--no-copy", "use_copy", default=None, help="Use PostgreSQL COPY (default: on PostgreSQL).")
+def db_seed(trainers, pokemons, random_seed, until, batch_size, password, use_copy):
+    """
+    This function is executed when the `db seed` command is run.
+    It adds synthetic trainers and Pokemons on top of the existing data,
+    bulk loading them in batches so that millions of rows take minutes.
+    """
+    rng = random.Random(random_seed)
+    if until is not None:
+        until = until.date()
+    else:
+        # A seeded run must not depend on the day it runs on
+        until = SEED_UNTIL if random_seed is not None else date.today()
+    if use_copy is None:
+        use_copy = db.engine.dialect.name == "postgresql"
+
+    # Hash the shared password once instead of once per synthetic trainer
+    password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
+
+    # Number new trainers after the existing ones so usernames and emails stay unique
+    start = db.session.scalar(db.select(func.coalesce(func.max(Trainer.id), 0))) + 1
+    bulk_load(
+        Trainer, synthetic_trainers(rng, start, trainers, password_hash), batch_size, use_copy, "Trainers"
+    )
+
+    # Pokemons go to the new trainers, or to any existing trainer if none were added
+    stmt = db.select(Trainer.id)
+    if trainers:
+        stmt = stmt.where(Trainer.id >= start)
+    trainer_ids = db.session.scalars(stmt).all()
+    bulk_load(Pokemon, synthetic_pokemons(rng, pokemons, trainer_ids, until), batch_size, use_copy, "Pokemons")
+
+    print(f"Seeded {trainers:,} trainers and {pokemons:,} pokemons!")
+
+    # Rebuild the statistics rollups so they include the new rows
+    refresh = refresh_stats()
+    if refresh is not None:
+        print(f"Refreshed the statistics in {refresh.seconds:.2f}s")
+
+
+@db_commands.cli.command("export")
+@click.argument("path")
+@click.option("--format", type=click.Choice(FORMATS), help="ndjson or csv (default: from the file name, else ndjson).")
+@click.option("--trainer", "usernames", multiple=True, help="Only export this trainer and their Pokemons (repeatable).")
+@click.option("--passwords/--no-passwords", default=True, show_default=True, help="Include the trainers' password hashes.")
+@click.option("--chunk-size", default=10_000, show_default=True, help="Rows fetched per round-trip.")
+def db_export(path, format, usernames, passwords, chunk_size):
+    """
+    This function is executed when the `db export` command is run.
+    It writes the trainers and their Pokemons to an NDJSON or CSV file
+    (gzip compressed when the name ends in .gz) for backups and for moving
+    them to another environment with `db import`. Rows are streamed from
+    server side cursors, so memory use stays flat whatever the row count.
+    """
+    format = export_format(path, format)
+    encoder = Encoder(format, current_app.json.dumps)
+    exported = 0
+    start = time.perf_counter()
+    with open_export(path, "w") as file:
+        file.write(encoder.header())
+        for record in export_records(usernames, passwords, chunk_size):
+            file.write(encoder.line(record))
+            exported += 1
+            if exported % chunk_size == 0:
+                elapsed = time.perf_counter() - start
+                print(f"\rExported {exported:,} records ({exported / elapsed:,.0f} records/s)", end="", flush=True)
+    elapsed = time.perf_counter() - start
+    print(f"\rExported {exported:,} records to {path} in {elapsed:.1f}s")
+
+
+@db_commands.cli.command("import")
+@click.argument("path")
+@click.option("--format", type=click.Choice(FORMATS), help="ndjson or csv (default: from the file name, else ndjson).")
+@click.option("--batch-size", default=10_000, show_default=True, help="Records per transaction.")
+@click.option("--offset", default=0, show_default=True, help="Records to skip, to resume a failed import.")
+@click.option("--skip-invalid", is_flag=True, help="Leave invalid records out (and list them) instead of stopping.")
+@click.option("--copy/--no-copy", "use_copy", default=None, help="Load Pokemons with PostgreSQL COPY (default: on PostgreSQL).")
+def db_import(path, format, batch_size, offset, skip_invalid, use_copy):
+    """
+    This function is executed when the `db import` command is run.
+    It loads a file written by `db export`, validating every record with
+    the trainer and Pokemon schemas, in one transaction per batch. Trainers
+    already there (same username and email) and Pokemons already there (same
+    uuid) are left as they are, so importing a file twice adds nothing. A
+    trainer whose username or email belongs to another account is left out
+    with its Pokemons. When a batch fails, the batches before it stay
+    imported and the command prints the --offset to resume from.
+    """
+    format = export_format(path, format)
+    if use_copy is None:
+        use_copy = db.engine.dialect.name == "postgresql"
+    insert_pokemons = partial(copy_rows, Pokemon.__table__) if use_copy else None
+    position = offset
+    trainers = existing_trainers = pokemons = existing_pokemons = invalid = skipped = 0
+    # Username in the file -> id of the trainer's account, or None when it was left out
+    owners = {}
+    start = time.perf_counter()
+    with open_export(path, "r") as file:
+        records = read_records(file, format)
+        if offset:
+            # The trainers imported before the offset, their Pokemons may come after it
+            known_trainers(itertools.islice(records, offset), owners)
+        try:
+            for batch in batches(records, batch_size):
+                result = import_batch(batch, position, owners, insert_pokemons)
+                errors = result.errors
+                for number, messages in sorted({**result.skipped, **errors}.items())[:10]:
+                    print(f"\nRecord {number}: {messages}")
+                if errors and not skip_invalid:
+                    db.session.rollback()
+                    raise click.ClickException(
+                        f"{len(errors)} invalid records in the batch from record {position}, which was not imported. "
+                        f"Fix them or pass --skip-invalid, then resume with --offset {position}"
+                    )
+                db.session.commit()
+                position += len(batch)
+                trainers += result.trainers
+                existing_trainers += result.existing_trainers
+                pokemons += result.pokemons
+                existing_pokemons += result.existing_pokemons
+                invalid += len(errors)
+                skipped += len(result.skipped)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"\rImported {position - offset:,} records ({(position - offset) / elapsed:,.0f} records/s)",
+                    end="", flush=True,
+                )
+        except click.ClickException:
+            raise
+        except Exception as err:
+            db.session.rollback()
+            raise click.ClickException(
+                f"Import failed in the batch from record {position}: {err}\n"
+                f"The records before it are imported, resume with --offset {position}"
+            )
+    print(
+        f"\rImported {trainers:,} trainers and {pokemons:,} pokemons in {time.perf_counter() - start:.1f}s "
+        f"({existing_trainers:,} trainers and {existing_pokemons:,} pokemons were already there, "
+        f"{skipped:,} records of trainers taken by other accounts and {invalid:,} invalid records left out)"
+    )
+
+    # Rebuild the statistics rollups so they include the new rows
+    refresh = refresh_stats()
+    if refresh is not None:
+        print(f"Refreshed the statistics in {refresh.seconds:.2f}s")
+
+
+@db_commands.cli.command("refresh-stats")
+def db_refresh_stats():
+    """
+    This function is executed when the `db refresh-stats` command is run.
+    It rebuilds the rollup tables behind /pokemons/stats and /trainers/stats
+    (counts by type, by catch day and by team) in one transaction. Run it
+    periodically, e.g. from cron, when STATS_MAX_AGE is 0.
+    """
+    refresh = refresh_stats()
+    if refresh is None:
+        raise click.ClickException("Another process is refreshing the statistics")
+    print(f"Refreshed the statistics in {refresh.seconds:.2f}s")
+
+
+@db_commands.cli.command("explain")
+@click.option("--analyze/--no-analyze", default=True, show_default=True, help="Run EXPLAIN ANALYZE on PostgreSQL.")
+@click.option("--verbose", is_flag=True, help="Print every query plan.")
+def db_explain(analyze, verbose):
+    """
+    This function is executed when the `db explain` command is run.
+    It runs EXPLAIN on every query the blueprints issue and exits with an
+    error if any of them falls back to a sequential scan. Seed realistic
+    volumes first (`db seed`), planners happily scan tiny tables.
+    """
+    # Imported here, the queries come from the API views the other commands do not need
+    from explain import blueprint_queries, explain
+
+    trainer = db.session.scalars(db.select(Trainer).order_by(Trainer.id)).first()
+    pokemon = db.session.scalars(db.select(Pokemon).order_by(Pokemon.id)).first()
+    if trainer is None or pokemon is None:
+        raise click.ClickException("Add some data first (db create or db seed)")
+
+    flagged = 0
+    for label, stmt, allow_scan in blueprint_queries(trainer, pokemon):
+        scans, plan = explain(stmt, analyze)
+        if scans and not allow_scan:
+            flagged += 1
+            print(f"SEQ SCAN  {label}: {', '.join(scans)}")
+        else:
+            print(f"ok        {label}")
+        if verbose:
+            print(plan, "\n")
+
+    if flagged:
+        raise click.ClickException(f"{flagged} queries use sequential scans")
+    print("No unexpected sequential scans!")
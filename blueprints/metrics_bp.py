@@ -0,0 +1,50 @@
+from flask import Blueprint, request, current_app
+from metrics import registry, start_request, finish_request
+
+# Blueprint for the request instrumentation hooks and the Prometheus scrape endpoint
+metrics_bp = Blueprint("metrics", __name__)
+
+
+# Start timing every request handled by the app (not only this blueprint's)
+@metrics_bp.before_app_request
+def start_timing():
+    start_request(capture_statements=current_app.config["SLOW_REQUEST_MS"] > 0)
+
+
+# Keep the status code for the teardown hook, which runs once streaming has finished
+@metrics_bp.after_app_request
+def remember_status(response):
+    request.environ["metrics.status"] = response.status_code
+    return response
+
+
+# Record the request's metrics and log it with its SQL if it was slow
+@metrics_bp.teardown_app_request
+def finish_timing(error=None):
+    if "metrics.status" not in request.environ and error is None:
+        # before_app_request never ran (e.g. the request failed during routing)
+        return
+    endpoint = request.endpoint or "unmatched"
+    status = request.environ.get("metrics.status", 500)
+    duration, phases, statements = finish_request(endpoint, request.method, status)
+    threshold = current_app.config["SLOW_REQUEST_MS"]
+    if threshold and duration * 1000 > threshold:
+        breakdown = ", ".join(f"{name}={elapsed * 1000:.1f}ms" for name, elapsed in phases.items())
+        queries = "\n".join(f"  [{elapsed * 1000:.1f}ms] {statement}" for elapsed, statement in statements)
+        current_app.logger.warning(
+            "Slow request %s %s (%s) took %.1fms [%s]\n%s",
+            request.method,
+            request.path,
+            endpoint,
+            duration * 1000,
+            breakdown,
+            queries,
+        )
+
+
+# Metrics in the Prometheus text exposition format
+@metrics_bp.route("/metrics")
+def metrics():
+    return current_app.response_class(
+        registry.render(), mimetype="text/plain; version=0.0.4"
+    )
@@ -1,53 +1,256 @@
+import hashlib
+import json
+import re
 from datetime import date
-from flask import Blueprint, request, abort, jsonify, make_response
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from auth import admin_only, authorize_owner_pokemon
+from flask import Blueprint, request, abort, jsonify, make_response, current_app
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import func
+from auth import admin_only, authorize_owner_pokemon, owned_pokemon, is_admin
 from init import db
+from loaders import load_options
+from pagination import list_response, fetch, wants_stream, paginate, page_args
+from projection import listing
+from filtering import list_arg, date_arg, prefix_range, parse_sort, sparse_schema
+from routing import read_only
+from conditional import make_etag, not_modified, with_etag, cached_response
+from resource_cache import resource_cache
+import versions  # noqa: F401 (bumps the owned Pokemons ETag on every write)
+from stats import latest_refresh, pokemon_queries, pokemon_stats_body
+from search import search_args, search_in_database, search_clause, search_sort, trigram_index
 from models.pokemon import Pokemon, PokemonSchema, pokemon_types
+from models.trainer import Trainer
 
 # Prefixing the URL for the 'pokemons' blueprint with '/pokemons' to route related endpoints
 pokemons_bp = Blueprint("pokemons", __name__, url_prefix="/pokemons")
 
+# Schemas are built once when the module loads instead of on every request
+pokemon_schema = PokemonSchema()
+pokemons_schema = PokemonSchema(many=True)
+# Only "name", "type" and "ability" can be set by a trainer, ignoring any unknown fields
+pokemon_input_schema = PokemonSchema(only=["name", "type", "ability"], unknown="exclude")
+pokemon_fields_schema = PokemonSchema(only=["name", "type", "ability"])
+# Batches are validated as a list, PUT requires every field and PATCH only the given ones
+pokemon_batch_schema = PokemonSchema(many=True, only=["name", "type", "ability"], unknown="exclude")
+pokemon_partial_batch_schema = PokemonSchema(
+    many=True, only=["name", "type", "ability"], unknown="exclude", partial=True
+)
+
+
+# Keys a Pokemon listing can be sorted by (?sort=-date_caught,name), with the expression
+# each one orders by and how its value is read back from a pagination cursor.
+# Names sort case-insensitively, on the same lower(name) index as the ?name= prefix filter
+POKEMON_SORT_KEYS = {
+    "name": (func.lower(Pokemon.name), str),
+    "type": (Pokemon.type, str),
+    "ability": (Pokemon.ability, str),
+    "date_caught": (Pokemon.date_caught, date.fromisoformat),
+}
+
+
+def pokemon_listing(args):
+    """
+    Reads the listing query parameters into (conditions, sort, schema):
+        ?type=Fire,Water      one of the types (validated against pokemon_types)
+        ?ability=Blaze        exact ability
+        ?name=char            name prefix, case-insensitive
+        ?caught_from=2024-01-01&caught_to=2024-06-30   date caught, inclusive
+        ?sort=-date_caught,name                         order (default id)
+        ?fields=id,name,type                            sparse fieldset
+    Each filter is served by one of the indexes declared on the Pokemon model.
+    """
+    conditions = []
+    types = []
+    for pokemon_type in list_arg(args, "type"):
+        # Types are matched the way they are stored, with the first letter capitalised
+        if pokemon_type.capitalize() not in pokemon_types.enums:
+            abort(400, description=f"This is a Invalid Pokemon type: {pokemon_type}")
+        types.append(pokemon_type.capitalize())
+    if len(types) == 1:
+        conditions.append(Pokemon.type == types[0])
+    elif types:
+        conditions.append(Pokemon.type.in_(types))
+    if args.get("ability"):
+        conditions.append(Pokemon.ability == args["ability"])
+    if args.get("name"):
+        # Names only hold letters, so the prefix can be matched as a range on lower(name)
+        if not re.fullmatch("[a-zA-Z]+", args["name"]):
+            abort(400, description="name must contain only letters.")
+        conditions.append(prefix_range(func.lower(Pokemon.name), args["name"].lower()))
+    caught_from = date_arg(args, "caught_from")
+    if caught_from is not None:
+        conditions.append(Pokemon.date_caught >= caught_from)
+    caught_to = date_arg(args, "caught_to")
+    if caught_to is not None:
+        conditions.append(Pokemon.date_caught <= caught_to)
+    return conditions, parse_sort(args, Pokemon, POKEMON_SORT_KEYS), sparse_schema(args, pokemons_schema)
+
 
 # This route handler function gets all Pokemon objects from the database
 # and returns them in JSON format (R)
+# ?limit=&after= returns one keyset page, ?stream=ndjson streams every row,
+# and the filters, ?sort= and ?fields= of pokemon_listing apply to all three
 @pokemons_bp.route("/")
+@read_only
 @admin_only
 def all_pokemons():
-    # Creates a SQLAlchemy select statement to retrieve all Pokemon objects
-    stmt = db.select(Pokemon)
-    # Executes the statement and fetches all results as a list
-    pokemons = db.session.scalars(stmt).all()
-    # Creates a PokemonSchema object to serialise the list of Pokemons into JSON format
-    # (many=True indicates multiple Pokemon objects)
-    return PokemonSchema(many=True).dump(pokemons)
+    conditions, sort, schema = pokemon_listing(request.args)
+    # Creates a SQLAlchemy select statement to retrieve all Pokemons with their trainers
+    # in one query, either as plain columns or as Pokemon objects with eager loaded trainers
+    stmt, dumper = listing(Pokemon, schema)
+    # Serialises the Pokemons as a full list, a single page or an NDJSON stream
+    return list_response(stmt.where(*conditions), Pokemon, dumper, sort)
+
+# ETag of a trainer's owned Pokemons, raising 404 if the trainer has none.
+# `variant` tells apart the representations of the same Pokemons (filtered, sorted...)
+def owned_pokemons_etag(trainer_id, *variant):
+    # One primary key lookup: the trainer's pokemons_version is bumped by every write to their
+    # Pokemons and never goes back, and the trainer's version covers the nested trainer
+    trainer = db.session.execute(
+        db.select(
+            Trainer.version,
+            Trainer.pokemons_version,
+            db.select(Pokemon.id).where(Pokemon.trainer_id == trainer_id).exists().label("owns_any"),
+        ).where(Trainer.id == trainer_id)
+    ).first()
+    # Check if the authenticated user owns any Pokemon
+    if trainer is None or not trainer.owns_any:
+        abort(make_response(jsonify(error="No Pokemon found for this trainer."), 404))
+    return make_etag("owned", trainer_id, trainer.version, trainer.pokemons_version, *variant)
+
+
+# A trainer's owned Pokemons serialised into JSON format
+def owned_pokemons_body(trainer_id):
+    # Create a SQLAlchemy select statement to retrieve all Pokemon objects owned by the trainer
+    stmt, dumper = listing(Pokemon, pokemons_schema)
+    stmt = stmt.where(Pokemon.trainer_id == trainer_id).order_by(Pokemon.id)
+    # Execute the statement and serialise the list of owned Pokémon
+    return dumper.dump(fetch(stmt, dumper).all())
+
+
+# A trainer's owned Pokemons with query parameters: filtered, sorted, narrowed to some
+# fields, paginated or streamed. Not cached, but still answered with 304 when unchanged
+def owned_pokemons_listing(trainer_id):
+    conditions, sort, schema = pokemon_listing(request.args)
+    # The query string picks the representation, so a digest of it is part of the ETag
+    etag = owned_pokemons_etag(trainer_id, hashlib.sha1(request.query_string).hexdigest()[:16])
+    stmt, dumper = listing(Pokemon, schema)
+    stmt = stmt.where(Pokemon.trainer_id == trainer_id, *conditions)
+    if wants_stream():
+        return list_response(stmt, Pokemon, dumper, sort)
+    if (response := not_modified(etag)) is not None:
+        return response
+    return with_etag(list_response(stmt, Pokemon, dumper, sort), etag)
+
 
 @pokemons_bp.route("/owned")
+@read_only
 @jwt_required()
 def get_owned_pokemons():
     trainer_id = get_jwt_identity()
-    # Create a SQLAlchemy select statement to retrieve all Pokemon objects owned by the trainer
-    stmt = db.select(Pokemon).where(Pokemon.trainer_id == trainer_id)
-    # Execute the statement and fetch all results as a list
-    owned_pokemons = db.session.scalars(stmt).all()
-    # Check if the authenticated user owns any Pokemon
-    if not owned_pokemons:
-        abort(make_response(jsonify(error="No Pokemon found for this trainer."), 404))
-    # Serialise the list of owned Pokémon into JSON format
-    return PokemonSchema(many=True).dump(owned_pokemons)
+    if request.args or wants_stream():
+        return owned_pokemons_listing(trainer_id)
+    if resource_cache.enabled:
+        # Served from the cache, rebuilt only once this trainer's Pokemons (or the trainer) change
+        entry = resource_cache.get_or_set(
+            "owned",
+            trainer_id,
+            lambda: {
+                "etag": owned_pokemons_etag(trainer_id),
+                "body": owned_pokemons_body(trainer_id),
+            },
+        )
+        return cached_response(entry)
+    etag = owned_pokemons_etag(trainer_id)
+    if (response := not_modified(etag)) is not None:
+        return response
+    return with_etag(owned_pokemons_body(trainer_id), etag)
+
+
+# Pokemon counts by type, by trainer team and per catch day, read from the rollup
+# tables (one row per group) rather than counted over every Pokemon (only admin can do this)
+# ?caught_from=&caught_to= limit the catches per day to those dates.
+# Not read_only: the rollups are built in the request the very first time
+@pokemons_bp.route("/stats")
+@admin_only
+def pokemon_stats():
+    caught_from = date_arg(request.args, "caught_from")
+    caught_to = date_arg(request.args, "caught_to")
+    refresh = latest_refresh()
+    # The statistics only change when the rollups are rebuilt
+    etag = make_etag("pokemon-stats", refresh.id, hashlib.sha1(request.query_string).hexdigest()[:16])
+    if (response := not_modified(etag)) is not None:
+        return response
+    rows = {name: db.session.execute(query).all() for name, query in pokemon_queries(caught_from, caught_to).items()}
+    return with_etag(pokemon_stats_body(refresh, rows), etag)
+
+
+# Find the Pokemons whose name or ability looks like ?q= (R), best match first.
+# ?mode=prefix matches the start of the name or ability instead (autocomplete).
+# Admins search every Pokemon and other trainers their own. Always one keyset page
+# (?limit=&after=), ?fields= narrows the results like on the listings
+@pokemons_bp.route("/search")
+@read_only
+@jwt_required()
+def search_pokemons():
+    query, mode = search_args(request.args)
+    schema = sparse_schema(request.args, pokemons_schema)
+    trainer_id = get_jwt_identity()
+    if get_jwt().get("admin") is not False and is_admin(trainer_id):
+        trainer_id = None
+    stmt, dumper = listing(Pokemon, schema)
+    if trainer_id is not None:
+        stmt = stmt.where(Pokemon.trainer_id == trainer_id)
+    if search_in_database():
+        # Matched and ranked by pg_trgm, through the trigram indexes
+        condition, rank = search_clause(query, mode)
+        return paginate(stmt.where(condition), Pokemon, dumper, search_sort(rank))
+    # Matched and ranked by the in-process index, then only that page is loaded by id
+    limit, after = page_args()
+    matches, next_cursor = trigram_index.page(query, mode, trainer_id, search_sort(), after, limit)
+    ids = [pokemon_id for _, pokemon_id in matches]
+    rows = {row.id: row for row in fetch(stmt.where(Pokemon.id.in_(ids)), dumper)}
+    # In rank order, leaving out any Pokemon deleted since the index was built
+    page = [rows[pokemon_id] for pokemon_id in ids if pokemon_id in rows]
+    return {"data": dumper.dump(page, many=True), "next_cursor": next_cursor}
 
 
 # This route handler function gets a single Pokemon object based on the provided ID
 # from the database and returns it in JSON format (R)
 @pokemons_bp.route("/<int:id>")
+@read_only
 @jwt_required()
 def get_one_pokemon(id):
-    # Uses the db.get_or_404 function to retrieve a Pokemon object with the specified ID.
-    # If the object is not found, it raises a 404 Not Found exception.
-    pokemon = db.get_or_404(Pokemon, id)
-    authorize_owner_pokemon(pokemon)
+    # Look up only the versions of the trainer's own Pokemon first, so an unchanged Pokemon
+    # costs one narrow query and no serialisation. Raises 404 or 403 if nothing matched.
+    versions = db.session.execute(
+        db.select(Pokemon.version, Trainer.version)
+        .join(Pokemon.trainer)
+        .where(*owned_pokemon(id, get_jwt_identity()))
+    ).first()
+    if versions is None:
+        authorize_owner_pokemon(id)
+    # The body nests the trainer, so the trainer's version is part of the ETag too
+    etag = make_etag("pokemon", id, *versions)
+    if (response := not_modified(etag)) is not None:
+        return response
+    # The Pokemon with its trainer in one query, raising 404 if it was deleted in between
+    pokemon = db.first_or_404(
+        db.select(Pokemon).options(*load_options(Pokemon, pokemon_schema)).where(Pokemon.id == id)
+    )
     # Creates a PokemonSchema object to serialise the Pokemon object into JSON format
-    return PokemonSchema().dump(pokemon)
+    return with_etag(pokemon_schema.dump(pokemon), etag)
+
+# checks if the pokemon type matches with the existing types in the models,
+# returning it capitalised (shared with the async views, so flask's abort that
+# works without a Flask app context too)
+def checked_type(pokemon_info):
+    pokemon_type = pokemon_info["type"]
+    if not isinstance(pokemon_type, str) or pokemon_type.capitalize() not in pokemon_types.enums:
+        # if it does not match it sends out an error
+        abort(400, description=f"This is a Invalid Pokemon type: {pokemon_type}")
+    return pokemon_type.capitalize()
+
 
 # This route handler function adds a pokemon object to the database
 # and returns it in JSON format (C)
@@ -55,22 +258,14 @@ def get_one_pokemon(id):
 @jwt_required()
 def adding_pokemon():
     # Load the Pokemon data from the request body using PokemonSchema
-    pokemon_info = PokemonSchema(
-        only=["name", "type", "ability"], unknown="exclude"
-    ).load(request.json)
-    # Capitalise the first letter of the type to avoid errors
-    pokemon_type = pokemon_info["type"].capitalize()
-    # checks if the pokemon type matches with the existing types in the models
-    if pokemon_type not in pokemon_types.enums:
-        # if it does not match it sends out an error
-        abort(
-            400, description=f"This is a Invalid Pokemon type: {pokemon_info['type']}"
-        )
+    pokemon_info = pokemon_input_schema.load(request.json)
+    # Capitalise the first letter of the type to avoid errors, 400 if it is not a Pokemon type
+    pokemon_type = checked_type(pokemon_info)
 
     # Create a new Pokemon object with the provided information
     pokemon = Pokemon(
         name=pokemon_info["name"],
-        type=pokemon_info["type"].capitalize(),
+        type=pokemon_type,
         ability=pokemon_info["ability"],
         date_caught=date.today(),
         trainer_id=get_jwt_identity()
@@ -80,7 +275,7 @@ def adding_pokemon():
     # Commit the changes to the database
     db.session.commit()
     # Return the newly created Pokemon data as JSON with a 201 sucessful Created status code
-    return PokemonSchema().dump(pokemon), 201
+    return pokemon_schema.dump(pokemon), 201
 
 
 # This route handler function that updates a existing pokemon object in the database
@@ -88,41 +283,229 @@ def adding_pokemon():
 @pokemons_bp.route("/update/<int:id>", methods=["PUT", "PATCH"])
 @jwt_required()
 def update_pokemon(id):
-    # Fetch the Pokemon object with the given ID from the database
-    # Raise a 404 error if the Pokemon is not found
-    pokemon = db.get_or_404(Pokemon, id)
-    authorize_owner_pokemon(pokemon)
     # Use PokemonSchema to validate and deserialise the incoming JSON data
     # Only allow updates to "name", "type", and "ability" fields ignoring any unknown fields
-    pokemon_info = PokemonSchema(
-        only=["name", "type", "ability"], unknown="exclude"
-    ).load(request.json)
-    # Capitalise the first letter of the type to avoid errors
-    pokemon_type = pokemon_info["type"].capitalize()
-    # checks if the pokemon type matches with the existing types in the models
-    if pokemon_type not in pokemon_types.enums:
-    # if it does not match it sends out an error
-        abort(
-            400, description=f"This is a Invalid Pokemon type: {pokemon_info['type']}"
-        )
-    # Update the Pokemon object's attributes with the provided data
-    pokemon.name = pokemon_info.get('name', pokemon.name)
-    pokemon.type = pokemon_info.get('type', pokemon.type).capitalize()
-    pokemon.ability = pokemon_info.get('ability', pokemon.ability)
+    pokemon_info = pokemon_input_schema.load(request.json)
+    # Capitalise the first letter of the type to avoid errors, 400 if it is not a Pokemon type
+    pokemon_type = checked_type(pokemon_info)
+    # One UPDATE ... WHERE id AND trainer_id RETURNING writes the trainer's own Pokemon
+    # (bumping its version) and reads back the response, without loading it first
+    stmt = (
+        db.update(Pokemon)
+        .where(*owned_pokemon(id, get_jwt_identity()))
+        .values({**pokemon_info, "type": pokemon_type})
+        .returning(Pokemon.name, Pokemon.type, Pokemon.ability)
+        .execution_options(synchronize_session=False)
+    )
+    pokemon = db.session.execute(stmt).first()
+    # Nothing updated, raise 404 if the Pokemon is not found or 403 if it is not the trainer's
+    if pokemon is None:
+        authorize_owner_pokemon(id)
     # Commit the changes to the database
     db.session.commit()
     # Return a 200 OK response with the only requested JSON representation
-    return PokemonSchema(only=['name', 'type', 'ability']).dump(pokemon), 200
+    return pokemon_fields_schema.dump(pokemon._mapping), 200
 
 
 # Delete an existing Pokemon (D)
 @pokemons_bp.route("/delete/<int:id>", methods=["DELETE"])
 @jwt_required()
 def delete_pokemon(id):
-    # Fetch a pokemon record by ID, raising 404 if not found
-    pokemon = db.get_or_404(Pokemon, id)
-    authorize_owner_pokemon(pokemon)
-    # Delete the pokemon object
-    db.session.delete(pokemon)
+    # Delete the trainer's own Pokemon in one statement, the row count tells whether it was theirs
+    stmt = (
+        db.delete(Pokemon)
+        .where(*owned_pokemon(id, get_jwt_identity()))
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(stmt).rowcount == 0:
+        # Raise 404 if the Pokemon is not found or 403 if it is not the trainer's
+        authorize_owner_pokemon(id)
     db.session.commit()
     return jsonify({"message": "The pokemon has successfully been deleted!"})
+
+
+# Read a batch of items from a JSON array or an NDJSON (one JSON value per line) body
+def read_batch():
+    if request.mimetype == "application/x-ndjson":
+        items = parse_ndjson(request.get_data(as_text=True))
+    else:
+        items = request.json
+    return check_batch(items, current_app.config["BULK_MAX_BATCH_SIZE"])
+
+
+def parse_ndjson(text):
+    try:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    except ValueError:
+        abort(400, description="Invalid NDJSON body")
+
+
+# A batch must be a list of at most BULK_MAX_BATCH_SIZE items
+def check_batch(items, max_batch_size):
+    if not isinstance(items, list):
+        abort(400, description="Expected a list of Pokemons")
+    if len(items) > max_batch_size:
+        abort(413, description=f"A batch can contain at most {max_batch_size} Pokemons")
+    return items
+
+
+# Validate a batch with PokemonSchema, returning the loaded items and the errors by index
+def load_batch(items, partial=False):
+    schema = pokemon_partial_batch_schema if partial else pokemon_batch_schema
+    # The whole batch is loaded once, valid_data keeps one entry per item (its valid fields)
+    try:
+        loaded, errors = schema.load(items), {}
+    except ValidationError as err:
+        loaded, errors = err.valid_data, err.messages
+    valid = {}
+    for index, pokemon_info in enumerate(loaded):
+        if index in errors:
+            continue
+        # Only "name" is required by the schema, a full item needs its type and ability too
+        missing = [] if partial else [key for key in ("type", "ability") if key not in pokemon_info]
+        if missing:
+            errors[index] = {key: ["Missing data for required field."] for key in missing}
+            continue
+        # checks if the pokemon type matches with the existing types in the models
+        if "type" in pokemon_info:
+            pokemon_type = pokemon_info["type"]
+            if not isinstance(pokemon_type, str) or pokemon_type.capitalize() not in pokemon_types.enums:
+                errors[index] = {"type": [f"This is a Invalid Pokemon type: {pokemon_type}"]}
+                continue
+            pokemon_info["type"] = pokemon_type.capitalize()
+        valid[index] = pokemon_info
+    return valid, errors
+
+
+# Return the per item results, 207 Multi-Status when only some of the items succeeded
+# (a list both Flask and Quart turn into a JSON response, so the async views share it)
+def batch_response(results, success_status):
+    if all(result["status"] == success_status for result in results):
+        return results, success_status
+    return results, 207
+
+
+# Pull the Pokemon ids out of a batch of ids (or objects with an "id"), None where missing
+def batch_ids(items):
+    ids = []
+    for item in items:
+        pokemon_id = item.get("id") if isinstance(item, dict) else item
+        ids.append(pokemon_id if type(pokemon_id) is int else None)
+    return ids
+
+
+# Look up which of the given Pokemon ids exist and who owns them in a single query
+def owners_of(ids):
+    stmt = db.select(Pokemon.id, Pokemon.trainer_id).where(
+        Pokemon.id.in_({pokemon_id for pokemon_id in ids if pokemon_id is not None})
+    )
+    return dict(db.session.execute(stmt).all())
+
+
+# Result for an item whose id is missing, unknown or owned by another trainer
+def ownership_error(index, pokemon_id, owners, trainer_id):
+    if pokemon_id is None:
+        return {"index": index, "status": 400, "errors": {"id": ["Missing or invalid id."]}}
+    if pokemon_id not in owners:
+        return {"index": index, "id": pokemon_id, "status": 404, "errors": "Not Found"}
+    if owners[pokemon_id] != trainer_id:
+        return {
+            "index": index,
+            "id": pokemon_id,
+            "status": 403,
+            "errors": "You must be the pokemon owner to access this resource",
+        }
+    return None
+
+
+# Add a batch of pokemon objects to the database in one transaction (C)
+@pokemons_bp.route("/bulk", methods=["POST"])
+@jwt_required()
+def bulk_adding_pokemons():
+    items = read_batch()
+    valid, errors = load_batch(items)
+    trainer_id = get_jwt_identity()
+    rows = [
+        {
+            "name": pokemon_info["name"],
+            "type": pokemon_info["type"],
+            "ability": pokemon_info["ability"],
+            "date_caught": date.today(),
+            "trainer_id": trainer_id,
+        }
+        for pokemon_info in valid.values()
+    ]
+    ids = []
+    if rows:
+        # One multi-row INSERT ... RETURNING for the whole batch
+        stmt = db.insert(Pokemon).returning(Pokemon.id, sort_by_parameter_order=True)
+        ids = db.session.scalars(stmt, rows).all()
+        db.session.commit()
+    created = dict(zip(valid, ids))
+    results = [
+        {"index": index, "id": created[index], "status": 201}
+        if index in created
+        else {"index": index, "status": 400, "errors": errors[index]}
+        for index in range(len(items))
+    ]
+    return batch_response(results, 201)
+
+
+# Update a batch of existing pokemon objects in one transaction (U)
+# PATCH only updates the fields given for each item, PUT requires all of them
+@pokemons_bp.route("/bulk", methods=["PUT", "PATCH"])
+@jwt_required()
+def bulk_update_pokemons():
+    items = read_batch()
+    ids = batch_ids(items)
+    valid, errors = load_batch(items, partial=request.method == "PATCH")
+    trainer_id = get_jwt_identity()
+    # Ownership is checked once for the whole batch
+    owners = owners_of(ids)
+    results = []
+    rows = []
+    for index, pokemon_id in enumerate(ids):
+        result = ownership_error(index, pokemon_id, owners, trainer_id)
+        if result is None and index in errors:
+            result = {"index": index, "id": pokemon_id, "status": 400, "errors": errors[index]}
+        if result is None:
+            rows.append({"id": pokemon_id, **valid[index]})
+            result = {"index": index, "id": pokemon_id, "status": 200}
+        results.append(result)
+    if rows:
+        # Bulk UPDATE by primary key, still scoped to the trainer's own Pokemons
+        # (nothing from the batch is loaded in the session, so there is nothing to synchronise)
+        stmt = (
+            db.update(Pokemon)
+            .where(Pokemon.trainer_id == trainer_id)
+            .execution_options(synchronize_session=None)
+        )
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    return batch_response(results, 200)
+
+
+# Delete a batch of existing pokemon objects in one statement (D)
+@pokemons_bp.route("/bulk", methods=["DELETE"])
+@jwt_required()
+def bulk_delete_pokemons():
+    items = read_batch()
+    ids = batch_ids(items)
+    trainer_id = get_jwt_identity()
+    # Ownership is checked once for the whole batch
+    owners = owners_of(ids)
+    results = []
+    deletable = set()
+    for index, pokemon_id in enumerate(ids):
+        result = ownership_error(index, pokemon_id, owners, trainer_id)
+        if result is None:
+            deletable.add(pokemon_id)
+            result = {"index": index, "id": pokemon_id, "status": 200}
+        results.append(result)
+    if deletable:
+        stmt = db.delete(Pokemon).where(
+            Pokemon.id.in_(deletable), Pokemon.trainer_id == trainer_id
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+    return batch_response(results, 200)
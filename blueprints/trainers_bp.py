@@ -1,32 +1,76 @@
-from datetime import timedelta
-from flask import Blueprint, request, abort, jsonify
-from sqlalchemy import and_, or_
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from init import db, bcrypt
+from itertools import chain
+from flask import Blueprint, request, abort, jsonify, current_app, stream_with_context
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from init import db
+from hashing import hash_password, check_password, needs_rehash
 from models.trainer import Trainer, TrainerSchema, gym_types
 from auth import admin_only, authorize_owner_trainer
+from pagination import list_response
+from projection import listing
+from routing import read_only
+from conditional import make_etag, not_modified, with_etag, cached_response
+from resource_cache import resource_cache
+from ratelimit import rate_limit, by_ip, by_account
+from stats import latest_refresh, trainer_queries, trainer_stats_body
+from revocation import TOKEN_LIFETIME, already_revoked, revoke_token, revoke_trainer_tokens
+from transfer import FORMATS, Encoder, GzipChunks, export_records
 
 # Prefixing the URL for the 'trainers' blueprint with '/trainers' to route related endpoints
 trainers_bp = Blueprint("trainers", __name__, url_prefix="/trainers")
 
+# Schemas are built once when the module loads instead of on every request
+login_schema = TrainerSchema(only=["email", "username", "password"], unknown="exclude")
+trainers_schema = TrainerSchema(many=True, only=["id", "name", "username", "email", "team"])
+trainer_public_schema = TrainerSchema(only=["name", "username"])
+trainer_create_schema = TrainerSchema(
+    only=["name", "username", "email", "password", "team"], unknown="exclude"
+)
+trainer_created_schema = TrainerSchema(only=["name", "username", "email", "team"])
+trainer_update_schema = TrainerSchema(
+    only=["name", "username", "email", "password"], unknown="exclude"
+)
+trainer_updated_schema = TrainerSchema(only=["name", "username", "email"])
+
+
+# Work out which unique column (username or email) an IntegrityError is about
+def unique_violation(err):
+    # PostgreSQL names the violated constraint (e.g. trainers_email_key),
+    # SQLite puts the column in the message (UNIQUE constraint failed: trainers.email)
+    diag = getattr(err.orig, "diag", None)
+    message = getattr(diag, "constraint_name", None) or str(err.orig)
+    for column in ("username", "email"):
+        if column in message:
+            return column
+    return None
+
 
 # Trainer Login
+# Attempts are limited per address and per account before any lookup or bcrypt work
 @trainers_bp.route("/login", methods=["POST"])
+@rate_limit(
+    "login", (by_ip, "RATE_LIMIT_LOGIN_IP"), (by_account, "RATE_LIMIT_LOGIN_ACCOUNT")
+)
 def login():
     # get the username, email and password from the request
-    params = TrainerSchema(only=["email", "username", "password"]).load(
-        request.json, unknown="exclude"
-    )
+    params = login_schema.load(request.json)
     # find the trainer by email address and the username
     stmt = db.select(Trainer).where(
         and_(Trainer.email == params["email"], Trainer.username == params["username"])
     )
     trainer = db.session.scalar(stmt)
     # check if trainer is true and the password matches
-    if trainer and bcrypt.check_password_hash(trainer.password, params["password"]):
-        # Generate the JWT that works for 8 hours
+    if trainer and check_password(trainer.password, params["password"]):
+        # Upgrade the stored hash if the work factor setting has changed since it was made
+        if needs_rehash(trainer.password):
+            trainer.password = hash_password(params["password"])
+            db.session.commit()
+        # Generate the JWT that works for 8 hours, carrying the admin role as a signed claim
         token = create_access_token(
-            identity=trainer.id, expires_delta=timedelta(hours=8)
+            identity=trainer.id,
+            additional_claims={"admin": bool(trainer.admin)},
+            expires_delta=TOKEN_LIFETIME,
         )
         # now we return the JWT
         return {"token": token}
@@ -35,52 +79,125 @@ def login():
         return abort(401, description="Invalid username, email or password")
 
 
+# Trainer Logout, the token used for this request is refused from now on
+@trainers_bp.route("/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    revoke_token(db.session, get_jwt())
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same token was logged out by a concurrent request, whose row is already there
+        db.session.rollback()
+        already_revoked(get_jwt())
+    return jsonify({"message": "You have successfully been logged out!"})
+
+
 # Get all Trainers (R) (only admin can do this)
+# ?limit=&after= returns one keyset page, ?stream=ndjson streams every row
 @trainers_bp.route("")
+@read_only
 @admin_only
 def all_trainers():
-    # Create a query to fetch all Trainer records
-    stmt = db.Select(Trainer)
-    trainers = db.session.scalars(stmt).all()
+    # Create a query to fetch all Trainer records, selecting only the serialised columns
+    stmt, dumper = listing(Trainer, trainers_schema)
+
+    # Serialise trainers with specified fields as a full list, a page or an NDJSON stream
+    return list_response(stmt, Trainer, dumper)
+
+
+# Trainer and Pokemon counts per gym team, read from the rollup tables (only admin can do this).
+# Not read_only: the rollups are built in the request the very first time
+@trainers_bp.route("/stats")
+@admin_only
+def trainer_stats():
+    refresh = latest_refresh()
+    # The statistics only change when the rollups are rebuilt
+    etag = make_etag("trainer-stats", refresh.id)
+    if (response := not_modified(etag)) is not None:
+        return response
+    rows = {name: db.session.execute(query).all() for name, query in trainer_queries().items()}
+    return with_etag(trainer_stats_body(refresh, rows), etag)
+
+
+# Read and validate ?format= (ndjson, the default, or csv) and ?trainer= (usernames) of an export
+def export_args(args):
+    format = args.get("format", "ndjson")
+    if format not in FORMATS:
+        abort(400, description=f"format must be one of {', '.join(FORMATS)}")
+    return format, args.getlist("trainer")
+
+
+# Headers of an export download
+def export_headers(format):
+    return {
+        "Content-Type": "application/gzip",
+        "Content-Disposition": f"attachment; filename=trainers.{format}.gz",
+    }
+
+
+# Export trainers and their Pokemons as a gzip compressed NDJSON or CSV file, in the
+# format `flask db import` reads (only admin can do this). Rows are streamed from a server
+# side cursor and compressed as they go. Password hashes are left out, so an import of the
+# file adds Pokemons to the trainers' existing accounts (same username and email) but cannot
+# create trainers, use `flask db export` for backups that keep the trainers' logins
+@trainers_bp.route("/export")
+@read_only
+@admin_only
+def export_trainers():
+    format, usernames = export_args(request.args)
+    encoder = Encoder(format, current_app.json.dumps)
+    records = export_records(usernames, passwords=False, chunk_size=current_app.config["STREAM_CHUNK_SIZE"])
+
+    def generate():
+        chunks = GzipChunks()
+        for text in chain([encoder.header()], map(encoder.line, records)):
+            if data := chunks.write(text):
+                yield data
+        yield chunks.close()
+
+    # stream_with_context keeps the request (and its db session) alive while streaming
+    return current_app.response_class(stream_with_context(generate()), headers=export_headers(format))
 
-    # Serialise trainers with specified fields and return as JSON
-    return TrainerSchema(many=True, only=["id", "name", "username", "email", "team"]).dump(
-        trainers
-    )
+
+# A trainer's public fields and ETag, raising 404 if not found
+def trainer_entry(id):
+    trainer = db.get_or_404(Trainer, id)
+    return {
+        "etag": make_etag("trainer", id, trainer.version),
+        "body": trainer_public_schema.dump(trainer),
+    }
 
 
 # Get One Trainer (R)
 @trainers_bp.route("/<int:id>")
+@read_only
 def one_trainer(id):
-    # Fetch a Trainer record by ID, raising 404 if not found
+    if resource_cache.enabled:
+        # Served from the cache, rebuilt only once the trainer changes
+        return cached_response(
+            resource_cache.get_or_set("trainer", id, lambda: trainer_entry(id))
+        )
+    # Look up only the trainer's version first, raising 404 if not found
+    version = db.session.scalar(db.select(Trainer.version).where(Trainer.id == id))
+    if version is None:
+        abort(404)
+    etag = make_etag("trainer", id, version)
+    # The client already has this version of the trainer
+    if (response := not_modified(etag)) is not None:
+        return response
+    # Fetch the Trainer record by ID
     trainer = db.get_or_404(Trainer, id)
 
     # Serialise trainer with specified fields and return as JSON
-    return TrainerSchema(only=["name", "username"]).dump(trainer)
+    return with_etag(trainer_public_schema.dump(trainer), etag)
 
 
 # Create a Trainer (C)
 @trainers_bp.route("/create", methods=["POST"])
 def create_trainer():
     # # Load the requested "only" Trainer data from the request body using TrainerSchema
-    trainer_info = TrainerSchema(
-        only=["name", "username", "email", "password", "team"], unknown="exclude"
-    ).load(request.json)
-
-    # Check for existing username or email
-    existing_trainer = (
-        db.session.query(Trainer)
-        .filter(
-            or_(
-                Trainer.username == trainer_info["username"],
-                Trainer.email == trainer_info["email"],
-            )
-        )
-        .first()
-    )
-    if existing_trainer:
-        # Raise an error if the trainer already exists
-        abort(400, description="This trainer is already registered!")
+    trainer_info = trainer_create_schema.load(request.json)
 
     trainer_team = trainer_info["team"].capitalize()
     # checks if the team matches with the existing teams in the models
@@ -95,18 +212,24 @@ def create_trainer():
         name=trainer_info["name"],
         username=trainer_info["username"],
         email=trainer_info["email"],
-        password=bcrypt.generate_password_hash(trainer_info["password"]).decode(
-            "utf-8"
-        ),
+        password=hash_password(trainer_info["password"]),
         team=trainer_info['team'].capitalize(),
         
     )
     # Add the new trainer to the database session
     db.session.add(trainer)
-    # Commit changes to the database
-    db.session.commit()
+    # Commit changes to the database, the unique constraints on username and email
+    # reject duplicates in the same round-trip (and without a check-then-insert race)
+    try:
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        if unique_violation(err) is None:
+            raise
+        # Raise an error if the trainer already exists
+        abort(400, description="This trainer is already registered!")
     # Serialise the newly created trainer and return with 201 successfully Created status
-    return TrainerSchema(only=["name", "username", "email", "team"]).dump(trainer), 201
+    return trainer_created_schema.dump(trainer), 201
 
 
 # update an existing trainer (U)
@@ -117,42 +240,29 @@ def update_trainer(id):
     trainer = db.get_or_404(Trainer, id)
     authorize_owner_trainer(trainer)
     # Only allow updates to specified fields (name, username, email, password)
-    trainer_info = TrainerSchema(
-        only=["name", "username", "email", "password",], unknown="exclude"
-    ).load(request.json)
-
-    # Check for existing username (if changed)
-    if trainer_info.get("username") and trainer_info["username"] != trainer.username:
-        # Check if a trainer with the new username already exists
-        existing_username = (
-            db.session.query(Trainer)
-            .filter_by(username=trainer_info["username"])
-            .first()
-        )
-        if existing_username:
-            # Raise a 400 Bad Request error
-            abort(400, description="Username already registered")
+    trainer_info = trainer_update_schema.load(request.json)
 
-    # Check for existing email (if changed) (similar logic as username)
-    if trainer_info.get("email") and trainer_info["email"] != trainer.email:
-        existing_email = (
-            db.session.query(Trainer).filter_by(email=trainer_info["email"]).first()
-        )
-        if existing_email:
-            # Raise a 400 Bad Request error
-            abort(400, description="Email already registered")
     # Update trainer fields with provided data (or keep existing values)
     trainer.name = trainer_info.get("name", trainer.name)
     trainer.username = trainer_info.get("username", trainer.username)
     trainer.email = trainer_info.get("email", trainer.email)
-    # Update password if provided in the request data (hashed for security)
-    trainer.password = bcrypt.generate_password_hash(
-        trainer_info.get("password", trainer.password)
-    ).decode("utf-8")
-    # Save changes to the database
-    db.session.commit()
+    # Update password only if provided in the request data (hashed for security)
+    if "password" in trainer_info:
+        trainer.password = hash_password(trainer_info["password"])
+    # Save changes to the database, a taken username or email violates its unique constraint
+    try:
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        column = unique_violation(err)
+        if column == "username":
+            # Raise a 400 Bad Request error
+            abort(400, description="Username already registered")
+        if column == "email":
+            abort(400, description="Email already registered")
+        raise
     # return the data that is relvant fields (name, username, email)
-    return TrainerSchema(only=["name", "username", "email"]).dump(trainer), 200
+    return trainer_updated_schema.dump(trainer), 200
 
 
 # Delete an existing Trainer (D)
@@ -162,7 +272,8 @@ def delete_trainer(id):
     # Fetch a Trainer record by ID, raising 404 if not found
     trainer = db.get_or_404(Trainer, id)
     authorize_owner_trainer(trainer)
-    # Delete the trainer object
+    # Delete the trainer object, and revoke its tokens in the same transaction
     db.session.delete(trainer)
+    revoke_trainer_tokens(db.session, trainer.id)
     db.session.commit()
     return jsonify({"message": "The trainer has successfully been deleted!"})
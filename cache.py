@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Marks a cache miss so that falsy values (False, 0, None) can still be cached
+MISSING = object()
+
+# Seconds a key's invalidation counter is kept after its last invalidation
+INVALIDATION_TTL = 300
+
+
+class TTLCache:
+    """
+    A small thread safe in-process LRU cache whose entries expire after `ttl`
+    seconds. Once `maxsize` entries are stored the least recently used one is
+    evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                # Expired entries are dropped lazily when they are read
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    """In-process LRU backend for ResponseCache (one cache per worker process)."""
+
+    def __init__(self, maxsize=10_000):
+        self._cache = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        # Generation counters (one per namespace), kept out of the LRU: an evicted counter
+        # would restart at 1 and bring the keys of an earlier generation back to life
+        self._counters = {}
+        # Counters that expire (one per recently invalidated key), apart from the entries so
+        # filling the cache does not evict them
+        self._expiring = TTLCache(maxsize=maxsize)
+
+    def get(self, key):
+        if key in self._counters:
+            return self._counters[key]
+        value = self._expiring.get(key)
+        if value is MISSING:
+            value = self._cache.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def add(self, key, value, ttl):
+        # Set only if absent, used as a short lived lock
+        with self._lock:
+            if self._cache.get(key) is not MISSING:
+                return False
+            self._cache.set(key, value, ttl=ttl)
+            return True
+
+    def incr(self, key, ttl=None):
+        with self._lock:
+            if ttl is None:
+                value = self._counters[key] = self._counters.get(key, 0) + 1
+            else:
+                value = self._expiring.get(key, 0) + 1
+                self._expiring.set(key, value, ttl=ttl)
+            return value
+
+
+class RedisBackend:
+    """
+    Shared backend for ResponseCache, so every worker sees the same entries
+    and invalidations. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as err:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis needs the 'redis' package") from err
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, json.dumps(value, default=str), px=max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+    def add(self, key, value, ttl):
+        return bool(self._redis.set(key, json.dumps(value), nx=True, px=max(int(ttl * 1000), 1)))
+
+    def incr(self, key, ttl=None):
+        if ttl is None:
+            return self._redis.incr(key)
+        pipeline = self._redis.pipeline()
+        pipeline.incr(key)
+        pipeline.pexpire(key, max(int(ttl * 1000), 1))
+        return pipeline.execute()[0]
+
+
+class ResponseCache:
+    """
+    Caches serialised resources under namespaced keys.
+
+    Stampede protection: an entry stays fresh for `ttl` seconds and is kept
+    for `grace` more. When a stale entry is read, one caller (the one that
+    wins a short lock in the backend) rebuilds it while everyone else keeps
+    serving the stale copy; on a cold miss concurrent callers in the same
+    process wait for a single rebuild instead of all querying the database.
+
+    Each namespace has a generation number that is part of its keys, so a
+    whole namespace can be dropped at once by bumping it. Each key has an
+    invalidation counter too, read before a fill calls producer() and again
+    once its value is stored: when an invalidation came in between, the
+    value may have been built from rows read before the change and is
+    dropped instead of being served until it expires.
+    """
+
+    def __init__(self, backend=None, ttl=30, grace=30, on_result=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.grace = grace
+        # called with (namespace, "hit" | "stale" | "miss") for the metrics
+        self.on_result = on_result or (lambda namespace, result: None)
+        self._fill_locks = {}
+        self._fill_locks_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key(self, namespace, identifier):
+        generation = self.backend.get(f"gen:{namespace}") or 0
+        return f"{namespace}:{generation}:{identifier}"
+
+    def _fill_lock(self, key):
+        with self._fill_locks_lock:
+            return self._fill_locks.setdefault(key, threading.Lock())
+
+    def _invalidations(self, key):
+        return self.backend.get(f"inv:{key}") or 0
+
+    def _store(self, key, value, invalidations):
+        entry = {"value": value, "fresh_until": time.time() + self.ttl}
+        self.backend.set(key, entry, self.ttl + self.grace)
+        # Checked after the set: invalidate() bumps the counter before deleting the key, so
+        # either this sees the bump or that delete comes after the set
+        if self._invalidations(key) != invalidations:
+            self.backend.delete(key)
+        return value
+
+    def get_or_set(self, namespace, identifier, producer):
+        """Returns the cached value, calling producer() to build it when needed."""
+        key = self.key(namespace, identifier)
+        entry = self.backend.get(key)
+        if entry is not None:
+            if entry["fresh_until"] > time.time():
+                self.on_result(namespace, "hit")
+                return entry["value"]
+            # Stale: only the caller that wins the refresh lock rebuilds it
+            if not self.backend.add(f"lock:{key}", 1, ttl=self.grace or 1):
+                self.on_result(namespace, "stale")
+                return entry["value"]
+            self.on_result(namespace, "miss")
+            try:
+                invalidations = self._invalidations(key)
+                return self._store(key, producer(), invalidations)
+            finally:
+                self.backend.delete(f"lock:{key}")
+
+        lock = self._fill_lock(key)
+        with lock:
+            # Another thread may have filled it while we waited
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.on_result(namespace, "hit")
+                return entry["value"]
+            self.on_result(namespace, "miss")
+            try:
+                invalidations = self._invalidations(key)
+                return self._store(key, producer(), invalidations)
+            finally:
+                with self._fill_locks_lock:
+                    self._fill_locks.pop(key, None)
+
+    def invalidate(self, namespace, identifier):
+        key = self.key(namespace, identifier)
+        # The counter only has to outlive the fills running now, INVALIDATION_TTL is plenty
+        self.backend.incr(f"inv:{key}", ttl=INVALIDATION_TTL)
+        self.backend.delete(key)
+
+    def invalidate_namespace(self, namespace):
+        self.backend.incr(f"gen:{namespace}")
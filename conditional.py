@@ -0,0 +1,27 @@
+from flask import request, make_response
+
+
+# Strong ETag for one version of a resource's representation
+def make_etag(*parts):
+    return "-".join(str(part) for part in parts)
+
+
+# The client already holds this version, so answer 304 without building the body
+def not_modified(etag):
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+# Attach the ETag to a freshly serialised body
+def with_etag(body, etag, status=200):
+    response = make_response(body, status)
+    response.set_etag(etag)
+    return response
+
+
+# Answer from a cached {"etag", "body"} entry, with a 304 if the client already has it
+def cached_response(entry):
+    return not_modified(entry["etag"]) or with_etag(entry["body"], entry["etag"])
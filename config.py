@@ -0,0 +1,100 @@
+from os import environ
+from uuid import uuid4
+from sqlalchemy.pool import NullPool
+from metrics import TimedQueuePool
+
+
+def env_bool(name, default):
+    """Reads a true/false style environment variable."""
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def engine_options(uri):
+    """
+    Builds SQLALCHEMY_ENGINE_OPTIONS for a PostgreSQL URI from the environment:
+
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT  connections kept open, extra
+                                                        ones allowed, seconds to wait
+        DB_POOL_RECYCLE                                 seconds before a connection is
+                                                        replaced (stale sockets after failover)
+        DB_POOL_PRE_PING                                test connections on checkout
+        DB_STATEMENT_TIMEOUT_MS                         server side statement_timeout, 0 is none
+        DB_APPLICATION_NAME                             shown in pg_stat_activity
+        DB_PGBOUNCER                                    an external pooler in transaction mode
+                                                        does the pooling, so use NullPool
+
+    Other databases (SQLite in development) keep SQLAlchemy's defaults.
+    """
+    if not uri or not uri.startswith("postgresql"):
+        return {}
+
+    connect_args = {"application_name": environ.get("DB_APPLICATION_NAME", "pokemon-api")}
+    options = {
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", True),
+        "connect_args": connect_args,
+    }
+
+    if env_bool("DB_PGBOUNCER", False):
+        # PgBouncer owns the pooling. Startup "options" are rejected in transaction mode, so
+        # statement_timeout has to be set on the database role instead (ALTER ROLE ... SET).
+        # psycopg2 never uses server side prepared statements, which transaction mode breaks.
+        options["poolclass"] = NullPool
+        return options
+
+    statement_timeout = int(environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=int(environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=int(environ.get("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(environ.get("DB_POOL_RECYCLE", 1800)),
+    )
+    return options
+
+
+# Async drivers used by the ASGI app for each synchronous one
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_uri(uri):
+    """
+    The URI for the async engine: ASYNC_DB_URI when set, otherwise DB_URI with
+    its driver swapped for asyncpg (PostgreSQL) or aiosqlite (SQLite).
+    """
+    if environ.get("ASYNC_DB_URI"):
+        return environ["ASYNC_DB_URI"]
+    scheme, separator, rest = uri.partition("://")
+    return ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + separator + rest
+
+
+def async_engine_options(uri):
+    """
+    engine_options() for the asyncpg engine of the ASGI app. The pool settings
+    are the same (with SQLAlchemy's async queue pool), while the session
+    settings go through asyncpg's server_settings.
+    """
+    options = engine_options(uri)
+    if not options:
+        return {}
+    connect_args = options["connect_args"]
+    server_settings = {"application_name": connect_args.pop("application_name")}
+    statement_timeout = connect_args.pop("options", None)
+    if statement_timeout:
+        server_settings["statement_timeout"] = statement_timeout.rpartition("=")[2]
+    connect_args["server_settings"] = server_settings
+    if options.get("poolclass") is NullPool:
+        # asyncpg prepares every statement, which PgBouncer in transaction mode breaks:
+        # turn off both asyncpg's and SQLAlchemy's statement caches and give every
+        # prepared statement a unique name so server connections never clash
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    else:
+        # The metrics pool is a synchronous QueuePool, async engines use their own
+        options.pop("poolclass")
+    return options
@@ -0,0 +1,28 @@
+from flask import jsonify
+from marshmallow.exceptions import ValidationError
+
+
+# Error handler for 404 (Not Found) and 405 (Method Not Allowed) errors
+def not_found():
+    """Returns a JSON response with an 'error' message for 404 and 405 errors"""
+    return jsonify({"error": "Not Found"}), 404
+
+# Error handler for ValidationError (invalid data)
+def invalid_request(err):
+    """Returns a JSON response with validation error messages for ValidationError"""
+    return jsonify({"error": vars(err)["messages"]}), 400
+
+# Specific error handler for 404 None (Not Found) errors
+def not_found_error(error=None):
+    """Returns a JSON response with a more informative 'error' message for 404"""
+    error_message = "Not Found" if error is None else str(error)
+    return jsonify({"error": error_message}), 404
+
+
+def register_error_handlers(app):
+    """Registers the JSON error handlers on the app (see init.create_app)."""
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(405, not_found)
+    app.register_error_handler(ValidationError, invalid_request)
+    # Registered last, so it replaces not_found for 404s like it always has
+    app.register_error_handler(404, not_found_error)
@@ -0,0 +1,305 @@
+import atexit
+import json
+import os
+import threading
+from collections import deque
+from datetime import date, datetime, timezone
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from init import app, db, on_setup
+from metrics import registry
+from models.event import ChangeEvent
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+
+change_events = registry.counter(
+    "change_events_total",
+    "Change events by result (queued, written, dropped or failed).",
+    ["result"],
+)
+
+# Name of each entity in the log and the fields recorded for it
+# (trainers' emails and password hashes stay out of the log)
+ENTITIES = {
+    Pokemon: ("pokemon", ("name", "type", "ability", "date_caught", "trainer_id")),
+    Trainer: ("trainer", ("name", "username", "team", "admin")),
+}
+
+ACTIONS = {"is_insert": "create", "is_update": "update", "is_delete": "delete"}
+
+
+def _plain(value):
+    # Dates are kept as ISO strings so events serialise to JSON as they are
+    return value.isoformat() if isinstance(value, date) else value
+
+
+class TableSink:
+    """Appends events to the change_events table, one multi-row INSERT per batch."""
+
+    def write(self, events):
+        # Straight on the primary's engine, outside any session (and its write tracking)
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(insert(ChangeEvent.__table__), events)
+
+
+class FileSink:
+    """
+    Appends events as JSON lines to one file per UTC day and process in a
+    directory (changes-YYYY-MM-DD-<pid>.jsonl), so workers never interleave
+    their writes and a day of events can be loaded by file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, events):
+        os.makedirs(self.directory, exist_ok=True)
+        lines = {}
+        for change in events:
+            day = change["occurred_at"].date().isoformat()
+            record = {**change, "occurred_at": change["occurred_at"].isoformat()}
+            lines.setdefault(day, []).append(json.dumps(record, separators=(",", ":")) + "\n")
+        for day, day_lines in lines.items():
+            path = os.path.join(self.directory, f"changes-{day}-{os.getpid()}.jsonl")
+            with open(path, "a", encoding="utf-8") as file:
+                file.write("".join(day_lines))
+
+
+class EventLog:
+    """
+    Write-behind log of change events. Committing sessions append their
+    events to a bounded in-memory buffer and return straight away; a
+    background thread writes them to the sink in batches of `batch_size`,
+    or every `flush_interval` seconds when fewer are waiting. When the
+    buffer is full the oldest events are dropped (and counted) rather than
+    holding the committing request up, or every other committer behind it.
+    close() drains what is left on shutdown.
+    """
+
+    def __init__(self, sink=None, capacity=10_000, batch_size=500, flush_interval=1.0, drain_seconds=10.0):
+        self.sink = sink
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drain_seconds = drain_seconds
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._stopping = False
+        # A forked worker process starts empty, its parent writes the events it copied
+        os.register_at_fork(after_in_child=self._reset)
+
+    @property
+    def enabled(self):
+        return self.sink is not None
+
+    def _reset(self):
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def append(self, events):
+        with self._condition:
+            # Never waits for room: a full buffer means the sink is behind, and waiting here
+            # (holding the lock) would only stall every commit until it catches up
+            dropped = max(len(self._buffer) + len(events) - self.capacity, 0)
+            for _ in range(min(dropped, len(self._buffer))):
+                self._buffer.popleft()
+            self._buffer.extend(events[-self.capacity:])
+            if dropped:
+                change_events.inc(dropped, result="dropped")
+            change_events.inc(len(events), result="queued")
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+            if self._worker is None and not self._stopping:
+                self._worker = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self):
+        with self._condition:
+            if not self._stopping and len(self._buffer) < self.batch_size:
+                self._condition.wait(self.flush_interval)
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            return batch, self._stopping
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if not batch:
+                if stopping:
+                    return
+                continue
+            try:
+                self.sink.write(batch)
+                change_events.inc(len(batch), result="written")
+            except Exception:
+                app.logger.exception("Writing %d change events failed", len(batch))
+                if stopping:
+                    change_events.inc(len(batch), result="failed")
+                    continue
+                # Put the batch back in front (as far as there is room) and retry after a pause
+                with self._condition:
+                    room = max(self.capacity - len(self._buffer), 0)
+                    self._buffer.extendleft(reversed(batch[:room]))
+                    change_events.inc(len(batch) - min(room, len(batch)), result="failed")
+                    self._condition.wait(self.flush_interval)
+
+    def close(self):
+        """Writes the buffered events and stops the worker, waiting at most drain_seconds."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(self.drain_seconds)
+
+
+def _sink(config):
+    backend = config["EVENT_LOG_BACKEND"]
+    if backend == "table":
+        return TableSink()
+    if backend == "file":
+        return FileSink(config["EVENT_LOG_PATH"])
+    return None
+
+
+# The event log of this process, off until create_app gives it its sink
+event_log = EventLog()
+atexit.register(event_log.close)
+
+
+@on_setup
+def _configure_event_log(app):
+    event_log.sink = _sink(app.config)
+    event_log.capacity = app.config["EVENT_LOG_BUFFER_SIZE"]
+    event_log.batch_size = app.config["EVENT_LOG_BATCH_SIZE"]
+    event_log.flush_interval = app.config["EVENT_LOG_FLUSH_SECONDS"]
+    event_log.drain_seconds = app.config["EVENT_LOG_DRAIN_SECONDS"]
+
+
+def _staged(session):
+    return session.info.setdefault("change_events", [])
+
+
+# Record what the unit of work wrote: every recorded field of created and
+# deleted objects, only the changed ones of updated objects
+def _flushed(session, flush_context):
+    if not event_log.enabled:
+        return
+    staged = _staged(session)
+    for action, objects in (("create", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            entity = ENTITIES.get(type(obj))
+            if entity is None:
+                continue
+            name, fields = entity
+            if action == "update":
+                attrs = inspect(obj).attrs
+                changed = [field for field in fields if attrs[field].history.has_changes()]
+                data = {field: _plain(getattr(obj, field)) for field in changed}
+                if not data:
+                    # e.g. only the password changed
+                    continue
+            else:
+                data = {field: _plain(getattr(obj, field)) for field in fields}
+            staged.append({"entity": name, "entity_id": obj.id, "action": action, "data": data})
+
+
+def _ids_in(whereclause):
+    """The ids an UPDATE/DELETE is limited to by an `id = ...` or `id IN (...)` condition, if any."""
+    ids = []
+    if whereclause is None:
+        return ids
+    for element in visitors.iterate(whereclause):
+        if (
+            isinstance(element, BinaryExpression)
+            and getattr(element.left, "key", None) == "id"
+            and isinstance(element.right, BindParameter)
+        ):
+            if element.operator is operators.eq:
+                ids.append(element.right.value)
+            elif element.operator is operators.in_op:
+                ids.extend(element.right.value)
+    return ids
+
+
+# Bulk INSERT/UPDATE/DELETE statements bypass the flush, record them from the
+# statement: its parameters, its RETURNING rows and the ids in its WHERE clause
+def _executed(orm_execute_state):
+    if not event_log.enabled:
+        return None
+    action = next((ACTIONS[flag] for flag in ACTIONS if getattr(orm_execute_state, flag)), None)
+    mapper = orm_execute_state.bind_mapper
+    if action is None or mapper is None or mapper.class_ not in ENTITIES:
+        return None
+    name, fields = ENTITIES[mapper.class_]
+    statement = orm_execute_state.statement
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+    # Run the statement here, to know what it changed, and hand its result on to the caller
+    result = orm_execute_state.invoke_statement()
+    returned = []
+    if statement.returning_column_descriptions:
+        # Read the RETURNING rows from a frozen copy, the caller gets another one
+        frozen = result.freeze()
+        returned = [row._mapping for row in frozen()]
+        result = frozen()
+        if not rows and not returned:
+            return result
+    elif not rows and result.rowcount == 0:
+        # e.g. an UPDATE/DELETE scoped to another trainer's Pokemon changed nothing
+        return result
+    events = []
+    for index, row in enumerate(rows):
+        entity_id = row.get("id")
+        if entity_id is None and index < len(returned):
+            entity_id = returned[index].get("id")
+        data = {field: _plain(row[field]) for field in fields if field in row}
+        events.append({"entity": name, "entity_id": entity_id, "action": action, "data": data})
+    if not rows:
+        data = {}
+        if action == "update" and returned:
+            data = {field: _plain(returned[0][field]) for field in fields if field in returned[0]}
+        elif action == "update":
+            # Neither parameters nor RETURNING rows, the values are only in the statement
+            params = statement.compile().params
+            data = {field: _plain(params[field]) for field in fields if field in params}
+        ids = [row["id"] for row in returned if "id" in row] or _ids_in(getattr(statement, "whereclause", None))
+        events.extend(
+            {"entity": name, "entity_id": entity_id, "action": action, "data": data} for entity_id in ids or [None]
+        )
+    _staged(orm_execute_state.session).extend(events)
+    return result
+
+
+# Queue the events once the transaction commits...
+def _committed(session):
+    staged = session.info.pop("change_events", None)
+    if staged:
+        occurred_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        for change in staged:
+            change["occurred_at"] = occurred_at
+        event_log.append(staged)
+
+
+# ...and forget them if it rolls back
+def _rolled_back(session):
+    session.info.pop("change_events", None)
+
+
+def track_change_events(session_class):
+    """Logs the trainer and Pokemon changes committed by sessions of this class."""
+    event.listen(session_class, "after_flush", _flushed)
+    event.listen(session_class, "do_orm_execute", _executed)
+    event.listen(session_class, "after_commit", _committed)
+    event.listen(session_class, "after_rollback", _rolled_back)
+
+
+track_change_events(Session)
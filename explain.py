@@ -0,0 +1,195 @@
+import json
+from werkzeug.datastructures import MultiDict
+from init import db
+from auth import owned_pokemon
+from loaders import load_options
+from models.pokemon import Pokemon, PokemonSchema
+from models.trainer import Trainer, TrainerSchema
+from blueprints.pokemons_bp import pokemon_listing
+from stats import pokemon_queries, trainer_queries
+from search import search_in_database, search_clause, search_sort
+
+
+def _pokemon_page(pokemon_schema, args):
+    # One page of /pokemons/ with the filters and sort of these query parameters
+    conditions, sort, schema = pokemon_listing(MultiDict(args))
+    return (
+        db.select(Pokemon)
+        .options(*load_options(Pokemon, pokemon_schema))
+        .where(*conditions)
+        .order_by(*sort.order_by())
+        .limit(101)
+    )
+
+
+def _search_pages(pokemon_schema, pokemon):
+    # First page of /pokemons/search in both modes, only searched in the database on PostgreSQL
+    if not search_in_database():
+        return []
+    pages = []
+    for mode, query in (("fuzzy", pokemon.name), ("prefix", pokemon.name[:3])):
+        condition, rank = search_clause(query, mode)
+        stmt = (
+            db.select(Pokemon)
+            .options(*load_options(Pokemon, pokemon_schema))
+            .where(condition)
+            .order_by(*search_sort(rank).order_by())
+            .limit(101)
+        )
+        pages.append((f"pokemons.search_pokemons (?mode={mode} page)", stmt, False))
+    return pages
+
+
+def blueprint_queries(trainer, pokemon):
+    """
+    Returns (label, statement, allow_scan) for each query the blueprints
+    issue, using an existing trainer and pokemon for the parameter values.
+    allow_scan marks queries that read the whole table by design.
+    """
+    pokemon_schema = PokemonSchema()
+    trainer_schema = TrainerSchema(only=["id", "name", "username", "email", "team"])
+    return [
+        (
+            "trainers.login",
+            db.select(Trainer).where(
+                Trainer.email == trainer.email, Trainer.username == trainer.username
+            ),
+            False,
+        ),
+        (
+            "auth.admin_only",
+            db.select(Trainer.id).where(Trainer.id == trainer.id, Trainer.admin),
+            False,
+        ),
+        (
+            "trainers.all_trainers",
+            db.select(Trainer).options(*load_options(Trainer, trainer_schema)).order_by(Trainer.id),
+            True,
+        ),
+        (
+            "trainers.all_trainers (page)",
+            db.select(Trainer)
+            .options(*load_options(Trainer, trainer_schema))
+            .where(Trainer.id > trainer.id)
+            .order_by(Trainer.id)
+            .limit(101),
+            False,
+        ),
+        ("trainers.one_trainer", db.select(Trainer).where(Trainer.id == trainer.id), False),
+        (
+            "pokemons.all_pokemons",
+            db.select(Pokemon).options(*load_options(Pokemon, pokemon_schema)).order_by(Pokemon.id),
+            True,
+        ),
+        (
+            "pokemons.all_pokemons (page)",
+            db.select(Pokemon)
+            .options(*load_options(Pokemon, pokemon_schema))
+            .where(Pokemon.id > pokemon.id)
+            .order_by(Pokemon.id)
+            .limit(101),
+            False,
+        ),
+        (
+            "pokemons.all_pokemons (?type= page)",
+            _pokemon_page(pokemon_schema, {"type": pokemon.type}),
+            False,
+        ),
+        (
+            "pokemons.all_pokemons (?ability= page)",
+            _pokemon_page(pokemon_schema, {"ability": pokemon.ability}),
+            False,
+        ),
+        (
+            "pokemons.all_pokemons (?name= page)",
+            _pokemon_page(pokemon_schema, {"name": pokemon.name[:3]}),
+            False,
+        ),
+        (
+            "pokemons.all_pokemons (?caught_from=&caught_to= page)",
+            _pokemon_page(
+                pokemon_schema,
+                {"caught_from": pokemon.date_caught.isoformat(), "caught_to": pokemon.date_caught.isoformat()},
+            ),
+            False,
+        ),
+        (
+            "pokemons.all_pokemons (?sort=-date_caught page)",
+            _pokemon_page(pokemon_schema, {"sort": "-date_caught"}),
+            False,
+        ),
+        # The statistics read whole rollup tables, one row per group
+        *(
+            (f"pokemons.pokemon_stats ({name})", query, name != "by_day")
+            for name, query in pokemon_queries(pokemon.date_caught, pokemon.date_caught).items()
+        ),
+        *((f"trainers.trainer_stats ({name})", query, True) for name, query in trainer_queries().items()),
+        *_search_pages(pokemon_schema, pokemon),
+        (
+            "pokemons.get_owned_pokemons",
+            db.select(Pokemon)
+            .where(Pokemon.trainer_id == trainer.id)
+            .options(*load_options(Pokemon, pokemon_schema)),
+            False,
+        ),
+        (
+            "pokemons.get_one_pokemon (owned versions)",
+            db.select(Pokemon.version, Trainer.version)
+            .join(Pokemon.trainer)
+            .where(*owned_pokemon(pokemon.id, pokemon.trainer_id)),
+            False,
+        ),
+        (
+            "pokemons.get_one_pokemon",
+            db.select(Pokemon).options(*load_options(Pokemon, pokemon_schema)).where(Pokemon.id == pokemon.id),
+            False,
+        ),
+        (
+            "pokemons.bulk (ownership check)",
+            db.select(Pokemon.id, Pokemon.trainer_id).where(Pokemon.id.in_([pokemon.id])),
+            False,
+        ),
+    ]
+
+
+def _compile(stmt):
+    # Inline the parameters so the statement can be prefixed with EXPLAIN
+    return str(
+        stmt.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+    )
+
+
+def _postgresql_scans(sql, analyze):
+    options = "ANALYZE, FORMAT JSON" if analyze else "FORMAT JSON"
+    plan = db.session.execute(db.text(f"EXPLAIN ({options}) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+
+    def walk(node):
+        if node["Node Type"] == "Seq Scan":
+            scans.append(f"Seq Scan on {node['Relation Name']}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return scans, json.dumps(plan, indent=2)
+
+
+def _sqlite_scans(sql):
+    rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    details = [row[-1] for row in rows]
+    # "SCAN table" is a full table scan, "SEARCH ... USING INDEX" and covering index scans are not
+    scans = [detail for detail in details if detail.startswith("SCAN") and "INDEX" not in detail]
+    return scans, "\n".join(details)
+
+
+def explain(stmt, analyze=True):
+    """
+    Runs EXPLAIN on a statement and returns (sequential scans, plan text).
+    On PostgreSQL ANALYZE executes the query to report actual timings.
+    """
+    sql = _compile(stmt)
+    if db.engine.dialect.name == "postgresql":
+        return _postgresql_scans(sql, analyze)
+    return _sqlite_scans(sql)
@@ -0,0 +1,82 @@
+from datetime import date
+from flask import abort
+from pagination import Sort
+
+
+# Read a comma separated query parameter into its non-empty values
+def list_arg(args, name):
+    return [value.strip() for value in args.get(name, "").split(",") if value.strip()]
+
+
+# Read an ISO 8601 date query parameter (YYYY-MM-DD), None when it is not given
+def date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"{name} must be a date in the format YYYY-MM-DD")
+
+
+def prefix_range(expression, prefix):
+    """
+    Matches the values of `expression` starting with `prefix`, for lowercase
+    letters only, as an index range (prefix <= value < next prefix) rather
+    than LIKE 'prefix%', which PostgreSQL only runs on an index built with
+    text_pattern_ops and SQLite only on a NOCASE column. The upper bound is
+    the prefix with its last letter moved on by one ("char" -> "chas",
+    "az" -> "b"); a prefix of only z's has no upper bound.
+    """
+    upper = prefix.rstrip("z")
+    if not upper:
+        return expression >= prefix
+    upper = upper[:-1] + chr(ord(upper[-1]) + 1)
+    return (expression >= prefix) & (expression < upper)
+
+
+def parse_sort(args, model, sort_keys):
+    """
+    Reads ?sort=key,-key (a leading - sorts descending) into a Sort, with
+    `sort_keys` mapping each accepted key to its (expression, parse) pair.
+    "id" may be given last to choose the direction of the tie breaker.
+    """
+    keys = []
+    id_descending = None
+    for name in list_arg(args, "sort"):
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        if id_descending is not None:
+            abort(400, description="id must be the last sort key")
+        if name == "id":
+            id_descending = descending
+            continue
+        if name not in sort_keys or any(key[0] == name for key in keys):
+            abort(400, description=f"Cannot sort by {name}, choose from: id, {', '.join(sort_keys)}")
+        expression, parse = sort_keys[name]
+        keys.append((name, expression, descending, parse))
+    return Sort(model, keys, id_descending)
+
+
+# Sparse fieldset schemas, built once per (schema, fields)
+_sparse_schemas = {}
+
+
+def sparse_schema(args, schema):
+    """
+    Returns the schema narrowed to ?fields=a,b (in the schema's own field
+    order, so each set of fields is built once), or the schema itself when
+    the parameter is not given. listing() then selects only those columns.
+    """
+    requested = set(list_arg(args, "fields"))
+    if not requested:
+        return schema
+    available = list(schema.dump_fields)
+    unknown = requested.difference(available)
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(sorted(unknown))}, choose from: {', '.join(available)}")
+    only = tuple(name for name in available if name in requested)
+    key = (id(schema), only)
+    if key not in _sparse_schemas:
+        _sparse_schemas[key] = type(schema)(many=schema.many, only=only)
+    return _sparse_schemas[key]
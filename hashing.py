@@ -0,0 +1,113 @@
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt as bcrypt_lib
+from flask import abort, current_app, jsonify, make_response
+from metrics import phase
+
+
+# These run inside the worker processes, so they must be plain module level functions
+def _generate_hash(password, rounds):
+    return bcrypt_lib.hashpw(password, bcrypt_lib.gensalt(rounds)).decode("utf-8")
+
+
+def _check_hash(pw_hash, password):
+    # Same comparison Flask-Bcrypt uses, so existing hashes keep verifying
+    return hmac.compare_digest(bcrypt_lib.hashpw(password, pw_hash), pw_hash)
+
+
+class HashingPool:
+    """
+    Runs bcrypt in a dedicated process pool so that hashing neither blocks the
+    request threads nor holds the GIL. At most `queue_depth` hashes may be
+    running or waiting at once; beyond that callers get a 503 instead of
+    queueing behind a login burst. A size of 0 hashes inline.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self, size, queue_depth):
+        # Pools do not survive a fork, so every worker process builds its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=size)
+                    self._slots = threading.BoundedSemaphore(queue_depth)
+                    self._pid = os.getpid()
+
+    def run(self, fn, *args):
+        with phase("bcrypt"):
+            return self._run(fn, *args)
+
+    def _run(self, fn, *args):
+        size = current_app.config["HASH_POOL_SIZE"]
+        if size == 0:
+            return fn(*args)
+        self._ensure_executor(size, current_app.config["HASH_QUEUE_DEPTH"])
+        if not self._slots.acquire(blocking=False):
+            abort(
+                make_response(
+                    jsonify(error="The server is busy, please try again shortly"),
+                    503,
+                    {"Retry-After": "1"},
+                )
+            )
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    async def run_async(self, fn, *args, size, queue_depth):
+        """
+        run() for the async app: awaits the pool instead of blocking the event
+        loop, and returns None when the queue is full so the caller can answer
+        503. A size of 0 hashes on a worker thread.
+        """
+        if size == 0:
+            return await asyncio.to_thread(fn, *args)
+        self._ensure_executor(size, queue_depth)
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+hashing_pool = HashingPool()
+
+
+# Hash a plain text password with the configured work factor
+def hash_password(password):
+    rounds = current_app.config["BCRYPT_LOG_ROUNDS"]
+    return hashing_pool.run(_generate_hash, password.encode("utf-8"), rounds)
+
+
+# Check a plain text password against a stored hash
+def check_password(pw_hash, password):
+    return hashing_pool.run(
+        _check_hash, pw_hash.encode("utf-8"), password.encode("utf-8")
+    )
+
+
+# True when a stored hash was made with a different work factor than the configured one
+def needs_rehash(pw_hash, rounds=None):
+    if rounds is None:
+        rounds = current_app.config["BCRYPT_LOG_ROUNDS"]
+    try:
+        hash_rounds = int(pw_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return hash_rounds != rounds
@@ -1,33 +1,196 @@
+from importlib import import_module
 from os import environ
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
+from metrics import TimedRequest, TimedJWTManager
+from config import engine_options, env_bool
+from json_provider import json_provider
+from routing import RoutingSession
+from errors import register_error_handlers
 
 # used to define classes mapped to relational database tables
 class Base(DeclarativeBase):
     pass
 
 app = Flask(__name__)
+# Request class that times JSON body parsing for the metrics endpoint
+app.request_class = TimedRequest
 
 ## DB CONNECTION
 app.config["JWT_SECRET_KEY"] = environ.get("JWT_KEY")
 app.config["SQLALCHEMY_DATABASE_URI"] = environ.get("DB_URI")
+# connection pool, pre-ping, recycle and statement timeout settings (see config.py)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
+## READ REPLICAS
+# comma separated replica URIs, each one becomes a "replica_<n>" bind for read-only handlers
+replica_uris = [uri.strip() for uri in environ.get("DB_REPLICA_URIS", "").split(",") if uri.strip()]
+app.config["SQLALCHEMY_BINDS"] = {
+    f"replica_{index}": {"url": uri, "pool_logging_name": f"replica_{index}", **engine_options(uri)}
+    for index, uri in enumerate(replica_uris)
+}
+# "round_robin" or "least_connections"
+app.config["REPLICA_STRATEGY"] = environ.get("REPLICA_STRATEGY", "round_robin")
+# seconds a client reads from the primary after writing, so it sees its own writes
+app.config["READ_YOUR_WRITES_SECONDS"] = int(environ.get("READ_YOUR_WRITES_SECONDS", 5))
 
-# Initialise SQLAlchemy
-db = SQLAlchemy(model_class=Base)
+## LISTINGS
+# page size used when ?limit= is not given, and the largest page a client may ask for
+app.config["PAGINATION_DEFAULT_LIMIT"] = int(environ.get("PAGINATION_DEFAULT_LIMIT", 100))
+app.config["PAGINATION_MAX_LIMIT"] = int(environ.get("PAGINATION_MAX_LIMIT", 1000))
+# number of rows fetched per round-trip when streaming a listing as NDJSON
+app.config["STREAM_CHUNK_SIZE"] = int(environ.get("STREAM_CHUNK_SIZE", 1000))
+# largest number of Pokemons accepted by one /pokemons/bulk request
+app.config["BULK_MAX_BATCH_SIZE"] = int(environ.get("BULK_MAX_BATCH_SIZE", 1000))
 
-# Bind SQLAlchemy to the Flask app
-db.init_app(app)
+## SEARCH
+# "pg_trgm" (trigram GIN indexes, PostgreSQL), "memory" (in-process index, for SQLite)
+# or "auto" to pick pg_trgm on PostgreSQL and the in-process index otherwise
+app.config["SEARCH_BACKEND"] = environ.get("SEARCH_BACKEND", "auto")
 
-# Initialise Marshmallow for object serialisation/deserialisation
-ma = Marshmallow(app)
+## SERIALISATION
+# "orjson" (when installed) or "default" for Flask's standard library JSON provider
+app.config["JSON_PROVIDER"] = environ.get("JSON_PROVIDER", "orjson")
+# build list responses straight from the selected columns instead of ORM objects
+app.config["FAST_DUMP"] = env_bool("FAST_DUMP", True)
 
-# Initialise Bcrypt for password hashing
-bcrypt = Bcrypt(app)
+## AUTHORISATION
+# how long (seconds) an admin flag is cached per trainer, 0 disables the cache
+app.config["ADMIN_CACHE_TTL"] = int(environ.get("ADMIN_CACHE_TTL", 60))
+app.config["ADMIN_CACHE_SIZE"] = int(environ.get("ADMIN_CACHE_SIZE", 1024))
+# seconds between reads of the tokens revoked by other processes (logout, deleted trainers)
+app.config["TOKEN_DENYLIST_SYNC_SECONDS"] = float(environ.get("TOKEN_DENYLIST_SYNC_SECONDS", 1))
+# verified token payloads kept per process, so a token seen again skips signature checking
+# (0 disables), and the most seconds one is kept (never past the token's expiry)
+app.config["JWT_DECODE_CACHE_SIZE"] = int(environ.get("JWT_DECODE_CACHE_SIZE", 1024))
+app.config["JWT_DECODE_CACHE_TTL"] = int(environ.get("JWT_DECODE_CACHE_TTL", 300))
 
-# initalise JWTManager
-jwt = JWTManager(app)
+## RATE LIMITING
+# "memory" (per process buckets), "redis" (shared, needs RATE_LIMIT_URL) or "none"
+app.config["RATE_LIMIT_BACKEND"] = environ.get("RATE_LIMIT_BACKEND", "memory")
+app.config["RATE_LIMIT_URL"] = environ.get("RATE_LIMIT_URL", "redis://localhost:6379/0")
+# login attempts allowed per client address and per username/email, e.g. "5/minute" (empty = no limit)
+app.config["RATE_LIMIT_LOGIN_IP"] = environ.get("RATE_LIMIT_LOGIN_IP", "30/minute")
+app.config["RATE_LIMIT_LOGIN_ACCOUNT"] = environ.get("RATE_LIMIT_LOGIN_ACCOUNT", "5/minute")
+
+## PASSWORD HASHING
+# bcrypt work factor (see benchmarks/bcrypt_cost.py to pick one for your hardware)
+app.config["BCRYPT_LOG_ROUNDS"] = int(environ.get("BCRYPT_LOG_ROUNDS", 12))
+# processes dedicated to hashing (0 hashes on the request thread) and how many
+# hashes may be running or waiting before requests are turned away with a 503
+app.config["HASH_POOL_SIZE"] = int(environ.get("HASH_POOL_SIZE", 2))
+app.config["HASH_QUEUE_DEPTH"] = int(environ.get("HASH_QUEUE_DEPTH", 16))
+
+## RESPONSE CACHE
+# "memory" (per process LRU), "redis" (shared, needs RESPONSE_CACHE_URL) or "none"
+app.config["RESPONSE_CACHE_BACKEND"] = environ.get("RESPONSE_CACHE_BACKEND", "memory")
+app.config["RESPONSE_CACHE_URL"] = environ.get("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+# seconds an entry is fresh, and how much longer a stale copy is served while it is rebuilt
+app.config["RESPONSE_CACHE_TTL"] = int(environ.get("RESPONSE_CACHE_TTL", 30))
+app.config["RESPONSE_CACHE_GRACE"] = int(environ.get("RESPONSE_CACHE_GRACE", 30))
+app.config["RESPONSE_CACHE_SIZE"] = int(environ.get("RESPONSE_CACHE_SIZE", 10000))
+
+## STATISTICS
+# seconds before /pokemons/stats and /trainers/stats rebuild their rollups in the background,
+# 0 leaves it to `flask db refresh-stats` (e.g. run from cron)
+app.config["STATS_MAX_AGE"] = int(environ.get("STATS_MAX_AGE", 300))
+
+## CHANGE EVENTS
+# where creates, updates and deletes of trainers and Pokemons are logged for analytics:
+# "table" (change_events), "file" (JSON lines in EVENT_LOG_PATH) or "none"
+app.config["EVENT_LOG_BACKEND"] = environ.get("EVENT_LOG_BACKEND", "table")
+app.config["EVENT_LOG_PATH"] = environ.get("EVENT_LOG_PATH", "events")
+# events written per batch, and seconds before a smaller batch is written anyway
+app.config["EVENT_LOG_BATCH_SIZE"] = int(environ.get("EVENT_LOG_BATCH_SIZE", 500))
+app.config["EVENT_LOG_FLUSH_SECONDS"] = float(environ.get("EVENT_LOG_FLUSH_SECONDS", 1))
+# events buffered in memory per process; once full the oldest events are dropped
+app.config["EVENT_LOG_BUFFER_SIZE"] = int(environ.get("EVENT_LOG_BUFFER_SIZE", 10000))
+# seconds spent writing the buffered events when the process shuts down
+app.config["EVENT_LOG_DRAIN_SECONDS"] = float(environ.get("EVENT_LOG_DRAIN_SECONDS", 10))
+
+## METRICS
+# requests slower than this many milliseconds are logged with their SQL, 0 turns the log off
+app.config["SLOW_REQUEST_MS"] = int(environ.get("SLOW_REQUEST_MS", 0))
+
+
+# The extensions are built here for the models, schemas and views to import, and only
+# bound to the app by create_app, after any configuration passed to it is applied
+
+# SQLAlchemy, with a session that can send read-only handlers to replicas
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+
+# Marshmallow for object serialisation/deserialisation
+ma = Marshmallow()
+
+# Bcrypt for password hashing
+bcrypt = Bcrypt()
+
+# JWTManager (timing token decoding for the metrics endpoint)
+jwt = TimedJWTManager()
+
+# Blueprints create_app can register, by name, with the module each one is imported from
+BLUEPRINTS = {
+    "db": ("blueprints.cli_bp", "db_commands"),
+    "trainers": ("blueprints.trainers_bp", "trainers_bp"),
+    "pokemons": ("blueprints.pokemons_bp", "pokemons_bp"),
+    "metrics": ("blueprints.metrics_bp", "metrics_bp"),
+}
+
+
+# Functions that build module level state (caches, rate limits, the event log...) from the
+# configuration, registered with on_setup and run by create_app once the configuration is final
+_setup_functions = []
+
+
+def on_setup(fn):
+    """
+    Registers fn(app) to read the app's configuration into module level
+    state. create_app runs it once `config` has been applied, or it runs
+    straight away for a module imported after the app was set up.
+    """
+    if "sqlalchemy" in app.extensions:
+        fn(app)
+    else:
+        _setup_functions.append(fn)
+    return fn
+
+
+def create_app(config=None, blueprints=None):
+    """
+    Sets the app up: applies `config` over the environment configuration
+    above, binds the extensions, registers the error handlers and runs the
+    on_setup functions (the first time only), then imports and registers
+    the named `blueprints` (all of them by default). Only the blueprints
+    asked for are imported, so an entry point such as manage.py (the
+    `flask db` commands) does not load the API views. Later calls register
+    further blueprints on the same app.
+
+    The app is a single module level object that the models and views
+    import, so `config` can only be given to the first call. The caches,
+    rate limits, event log and token denylist read it in their on_setup
+    functions, so it applies to them whenever they were imported.
+    """
+    if "sqlalchemy" not in app.extensions:
+        if config:
+            app.config.from_mapping(config)
+            # Pool settings follow the database unless they are given too
+            if "SQLALCHEMY_DATABASE_URI" in config and "SQLALCHEMY_ENGINE_OPTIONS" not in config:
+                app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+        app.json = json_provider(app, app.config["JSON_PROVIDER"])
+        db.init_app(app)
+        ma.init_app(app)
+        bcrypt.init_app(app)
+        jwt.init_app(app)
+        register_error_handlers(app)
+        for setup in _setup_functions:
+            setup(app)
+    elif config:
+        raise RuntimeError("create_app(config) must be called before the app is set up")
+    for name in BLUEPRINTS if blueprints is None else blueprints:
+        if name not in app.blueprints:
+            module, attribute = BLUEPRINTS[name]
+            app.register_blueprint(getattr(import_module(module), attribute))
+    return app
@@ -0,0 +1,52 @@
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional, without it the app keeps Flask's standard library provider
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes with orjson. Keys are sorted like Flask's own
+    provider, and dates, dataclasses and anything else orjson does not handle
+    the same way go through Flask's `default`, so responses keep their shape.
+    Responses are written straight from orjson's bytes.
+    """
+
+    # Marshmallow error dicts use the item index (an int) as key for lists
+    options = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    ) if orjson else 0
+
+    def _encode(self, obj, option=0):
+        return orjson.dumps(obj, default=self.default, option=self.options | option)
+
+    def dumps(self, obj, **kwargs):
+        # json.dumps style arguments (indent, cls, ...) have no orjson equivalent
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(self._encode(obj, option), mimetype=self.mimetype)
+
+
+def json_provider(app, name):
+    """The JSON provider named by JSON_PROVIDER ("orjson" or "default") for the app."""
+    if name == "orjson" and orjson is not None:
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
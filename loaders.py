@@ -0,0 +1,70 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload, load_only, raiseload
+from marshmallow import fields
+
+
+# Map each field a schema will dump to the attribute it reads on the model
+def _dumped_attributes(schema):
+    return {
+        name: field
+        for name, field in schema.dump_fields.items()
+        if not isinstance(field, fields.Method)
+    }
+
+
+def _column_options(mapper, attributes, loader):
+    # Only load the columns the schema will dump (primary keys are always loaded)
+    columns = [
+        getattr(mapper.class_, (field.attribute or name))
+        for name, field in attributes.items()
+        if (field.attribute or name) in mapper.column_attrs
+    ]
+    return [loader.load_only(*columns)] if columns else []
+
+
+def _relationship_options(mapper, attributes, loader):
+    options = []
+    for relationship in mapper.relationships:
+        field = attributes.get(relationship.key)
+        attribute = getattr(mapper.class_, relationship.key)
+        if field is None or not isinstance(field, fields.Nested):
+            # The schema never touches this relationship, so make sure it is never loaded
+            options.append(loader.raiseload(attribute))
+            continue
+        # Many-to-one rows are joined into the same SELECT, collections get one extra
+        # SELECT ... WHERE IN for the whole batch instead of one per parent row
+        if relationship.uselist:
+            eager = loader.selectinload(attribute)
+        else:
+            eager = loader.joinedload(attribute)
+        nested_attributes = _dumped_attributes(field.schema)
+        options.extend(_column_options(relationship.mapper, nested_attributes, eager))
+        options.extend(_relationship_options(relationship.mapper, nested_attributes, eager))
+    return options
+
+
+class _RootLoader:
+    """
+    Stands in for a loader option chain at the root of the query so the same
+    helpers build both top level options and options nested under an eager load.
+    """
+
+    load_only = staticmethod(load_only)
+    joinedload = staticmethod(joinedload)
+    selectinload = staticmethod(selectinload)
+    raiseload = staticmethod(raiseload)
+
+
+def load_options(model, schema):
+    """
+    Returns the loader options that fetch exactly what the schema will dump:
+    a column only projection of the model, eager loading for each nested
+    relationship the schema serialises and raiseload for the rest, so
+    serialising a list never falls back to one lazy load per row.
+    """
+    mapper = inspect(model)
+    attributes = _dumped_attributes(schema)
+    loader = _RootLoader()
+    return _column_options(mapper, attributes, loader) + _relationship_options(
+        mapper, attributes, loader
+    )
@@ -0,0 +1,12 @@
+"""
+Lightweight entry point for the database commands, which only registers
+the `db` blueprint instead of importing every API view:
+
+    flask --app manage db create
+    flask --app manage db refresh-stats
+
+`flask --app app db ...` keeps working as well, with the whole API loaded.
+"""
+from init import create_app
+
+app = create_app(blueprints=["db"])
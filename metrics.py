@@ -0,0 +1,368 @@
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from flask import Request, g, has_request_context, request
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from cache import TTLCache, MISSING
+
+# Latency buckets in seconds, from sub-millisecond SQL up to slow bcrypt calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets for per request query counts
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """A value read from a callback each time the metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, callback, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # callback returns {label values tuple: value}, or a single number without labels
+        self.callback = callback
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one count per bucket, then the sum and the total count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = ("le", _format_value(bound))
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [le]), count
+            inf = ("le", "+Inf")
+            yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [inf]), series[-1]
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), series[-2]
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), series[-1]
+
+
+class Registry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Modules may be reloaded (flask --reload), keep the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, callback, labelnames=()):
+        return self._register(Gauge(name, help, callback, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, including streaming the response.",
+    ["endpoint", "method", "status"],
+)
+phase_duration = registry.histogram(
+    "http_request_phase_seconds",
+    "Time spent per request in each phase (json_parse, jwt_decode, schema_load, schema_dump, bcrypt, sql).",
+    ["endpoint", "phase"],
+)
+queries_per_request = registry.histogram(
+    "sql_queries_per_request",
+    "Number of SQL statements executed per request.",
+    ["endpoint"],
+    buckets=COUNT_BUCKETS,
+)
+query_duration = registry.histogram(
+    "sql_query_duration_seconds",
+    "Latency of individual SQL statements.",
+    ["endpoint"],
+)
+
+
+@contextmanager
+def phase(name):
+    """
+    Adds the time spent inside the block to the named phase of the current
+    request. Nested blocks of the same phase (e.g. nested schemas) only count
+    once, and outside of a request nothing is recorded.
+    """
+    if not has_request_context() or "_metrics_phases" not in g or name in g._metrics_active:
+        yield
+        return
+    g._metrics_active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g._metrics_active.discard(name)
+        phases = g._metrics_phases
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def start_request(capture_statements):
+    """Starts collecting metrics for the current request."""
+    g._metrics_start = time.perf_counter()
+    g._metrics_phases = {}
+    g._metrics_active = set()
+    g._metrics_queries = 0
+    # Statements are only kept when the slow request log is turned on
+    g._metrics_statements = [] if capture_statements else None
+
+
+def finish_request(endpoint, method, status):
+    """
+    Records the metrics collected for the current request and returns
+    (duration, phases, statements) for the slow request log.
+    """
+    duration = time.perf_counter() - g._metrics_start
+    request_duration.observe(duration, endpoint=endpoint, method=method, status=status)
+    for name, elapsed in g._metrics_phases.items():
+        phase_duration.observe(elapsed, endpoint=endpoint, phase=name)
+    queries_per_request.observe(g._metrics_queries, endpoint=endpoint)
+    return duration, g._metrics_phases, g._metrics_statements
+
+
+# SQL timing for every engine, recorded against the request that issued it
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["_metrics_query_start"].pop()
+    if not has_request_context() or "_metrics_phases" not in g:
+        return
+    query_duration.observe(elapsed, endpoint=request.endpoint or "unmatched")
+    g._metrics_queries += 1
+    phases = g._metrics_phases
+    phases["sql"] = phases.get("sql", 0.0) + elapsed
+    if g._metrics_statements is not None:
+        g._metrics_statements.append((elapsed, statement))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute, drop its start time
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("_metrics_query_start"):
+        connection.info["_metrics_query_start"].pop()
+
+
+# Every TimedQueuePool alive in this process, read by the pool gauges at scrape time
+_pools = weakref.WeakSet()
+
+pool_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool.",
+    ["pool"],
+)
+
+
+def _pool_stats(stat):
+    def collect():
+        values = {}
+        for pool in list(_pools):
+            key = (pool.logging_name or "default",)
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            current = {
+                "checked_out": pool.checkedout(),
+                "size": capacity,
+                "saturation": pool.checkedout() / capacity if capacity else 0,
+            }[stat]
+            values[key] = values.get(key, 0) + current
+        return values
+
+    return collect
+
+
+registry.gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool.",
+    _pool_stats("checked_out"), ["pool"],
+)
+registry.gauge(
+    "db_pool_capacity", "Maximum connections the pool can hand out (size plus overflow).",
+    _pool_stats("size"), ["pool"],
+)
+registry.gauge(
+    "db_pool_saturation", "Checked out connections as a fraction of the pool capacity.",
+    _pool_stats("saturation"), ["pool"],
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - start, pool=self.logging_name or "default")
+
+
+class TimedRequest(Request):
+    """Request class that records JSON body parsing as the json_parse phase."""
+
+    def get_json(self, *args, **kwargs):
+        with phase("json_parse"):
+            return super().get_json(*args, **kwargs)
+
+
+jwt_decode_cache = registry.counter(
+    "jwt_decode_cache_requests_total",
+    "Token decodes answered from the verified payload cache (hit) or by checking the signature (miss).",
+    ["result"],
+)
+
+
+class TimedJWTManager(JWTManager):
+    """
+    JWTManager that records token decoding and verification as the jwt_decode
+    phase. The payloads of recently verified tokens are kept in an LRU cache
+    keyed by the encoded token, so a client sending the same token again skips
+    the signature check. An entry never outlives its token's expiry, after
+    which the token is decoded again and rejected as expired. Revocation is
+    checked after decoding, so cached tokens are still refused once revoked.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._decoded = None
+        self._decoded_ttl = 0
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app, *args, **kwargs):
+        super().init_app(app, *args, **kwargs)
+        size = app.config.get("JWT_DECODE_CACHE_SIZE", 0)
+        self._decoded = TTLCache(maxsize=size) if size > 0 else None
+        self._decoded_ttl = app.config.get("JWT_DECODE_CACHE_TTL", 0)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        with phase("jwt_decode"):
+            # Tokens from cookies (CSRF checked) and expired ones being let through are always decoded
+            cacheable = self._decoded is not None and csrf_value is None and not allow_expired
+            if cacheable:
+                claims = self._decoded.get(encoded_token)
+                if claims is not MISSING:
+                    jwt_decode_cache.inc(result="hit")
+                    return dict(claims)
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            if cacheable:
+                jwt_decode_cache.inc(result="miss")
+                ttl = self._decoded_ttl
+                if "exp" in claims:
+                    ttl = min(ttl, claims["exp"] - time.time())
+                if ttl > 0:
+                    self._decoded.set(encoded_token, dict(claims), ttl=ttl)
+            return claims
+
+
+class TimedSchemaMixin:
+    """Schema mixin that records marshmallow load and dump as their own phases."""
+
+    def dump(self, obj, *args, **kwargs):
+        with phase("schema_dump"):
+            return super().dump(obj, *args, **kwargs)
+
+    def load(self, data, *args, **kwargs):
+        with phase("schema_load"):
+            return super().load(data, *args, **kwargs)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import JSON, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from init import db
+
+
+class ChangeEvent(db.Model):
+    """
+    One create, update or delete of a trainer or Pokemon, appended by the
+    write-behind event log (events.py) for analytics. Rows are only ever
+    inserted, in batches, and consumers read them in id order, so the table
+    has no index besides its primary key to keep the inserts cheap.
+    """
+
+    __tablename__ = "change_events"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Primary key for the table, increasing in the order the events were written
+
+    occurred_at: Mapped[datetime] = mapped_column(nullable=False)
+    # When the change was committed (UTC)
+
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    # What changed, "trainer" or "pokemon"
+
+    entity_id: Mapped[Optional[int]]
+    # Id of the trainer or Pokemon (null for bulk inserts that did not return their ids)
+
+    action: Mapped[str] = mapped_column(String(10), nullable=False)
+    # "create", "update" or "delete"
+
+    data: Mapped[dict] = mapped_column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)
+    # The recorded fields: all of them on create, the changed ones on update, and on delete
+    # the ones of objects deleted through the ORM (bulk deletes only carry the id)
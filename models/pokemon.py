@@ -0,0 +1,133 @@
+import secrets
+import time
+from datetime import date
+from typing import Optional
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import DDL, String, Enum, ForeignKey, Index, event, func, literal_column
+from marshmallow import fields
+from marshmallow.validate import Regexp
+from init import db, ma
+from metrics import TimedSchemaMixin
+
+# Creating an Enum for Pokemon types
+pokemon_types = Enum(
+    "Normal",
+    "Fire",
+    "Water",
+    "Electric",
+    "Grass",
+    "Ice",
+    "Fighting",
+    "Poison",
+    "Ground",
+    "Flying",
+    "Psychic",
+    "Bug",
+    "Rock",
+    "Ghost",
+    "Dragon",
+    "Dark",
+    "Steel",
+    "Fairy",
+    name="pokemon_types",
+)
+
+
+# A random 128 bit id in hex that starts with the time in milliseconds (like a UUIDv7), so
+# new ones go to the end of the uuid index instead of all over it, and an import (in export
+# order) appends to it too
+def new_uuid():
+    return f"{time.time_ns() // 1_000_000:012x}{secrets.token_hex(10)}"
+
+
+# Defining the Pokemon model
+class Pokemon(db.Model):
+    """
+    This class represents a Pokemon in the database.
+    """
+
+    # setting the table name
+    __tablename__ = "pokemons"
+
+    __table_args__ = (
+        # One index per listing filter (?type=, ?ability=, ?caught_from=/?caught_to=), each
+        # ending in the id so a filtered page is read in id order straight from the index
+        Index("ix_pokemons_type_id", "type", "id"),
+        Index("ix_pokemons_ability_id", "ability", "id"),
+        Index("ix_pokemons_date_caught_id", "date_caught", "id"),
+    )
+
+    # Defining model attributes (columns)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Primary key for the table
+
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Pokemon name (string, not nullable)
+
+    type: Mapped[str] = mapped_column(pokemon_types, nullable=False)
+    # Pokemon type (uses the 'pokemon_types' Enum)
+
+    ability: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Pokemon ability (string, not nullable)
+
+    date_caught: Mapped[date]
+    # Date the Pokemon was caught
+
+    trainer_id: Mapped[int] = mapped_column(ForeignKey("trainers.id"), nullable=True, index=True)
+    # Foreign key referencing the 'trainers' table (indexed, every owned Pokemon lookup filters on it)
+
+    trainer: Mapped["Trainer"] = relationship(back_populates="pokemons")
+     # Relationship with the 'Trainer' model
+
+    version: Mapped[int] = mapped_column(
+        nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1
+    )
+    # Row version, bumped by every UPDATE (used to build the ETag of the Pokemon)
+
+    uuid: Mapped[Optional[str]] = mapped_column(String(32), unique=True, default=new_uuid)
+    # Identifies the Pokemon across databases: `db export` writes it and `db import` keeps
+    # it, skipping the Pokemons it already has (null for rows from before the column)
+
+    # Read the bumped version back in the UPDATE itself (RETURNING) rather than a SELECT later
+    __mapper_args__ = {"eager_defaults": True}
+
+
+# ?name= prefix searches and ?sort=name both read lower(name), the expression index
+# is declared once the name column exists
+Index("ix_pokemons_name_lower_id", func.lower(Pokemon.name), Pokemon.id)
+
+# Trigram GIN indexes behind /pokemons/search, on PostgreSQL only (with the pg_trgm
+# extension); other databases search with the in-process index in search.py
+event.listen(
+    Pokemon.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+Index(
+    "ix_pokemons_name_trgm", Pokemon.name, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_pokemons_ability_trgm", Pokemon.ability, postgresql_using="gin", postgresql_ops={"ability": "gin_trgm_ops"}
+).ddl_if(dialect="postgresql")
+
+# Defining the PokemonSchema for serialisation and validation
+class PokemonSchema(TimedSchemaMixin, ma.Schema):
+    """
+    This class defines the Marshmallow schema for the Pokemon model.
+    It specifies how Pokemon objects are serialised and validated.
+    """
+    name = fields.String(
+        validate=[
+            Regexp(
+                "^[a-zA-Z]+$",
+                error="Pokemon name must contain only letters.",
+            ),
+        ],
+        required=True,
+    )
+    trainer = fields.Nested(
+        "TrainerSchema", exclude=["password", "admin", "id", "email"], allow_none=True
+    )
+
+    class Meta:
+        fields = ("id", "name", "type", "ability", "date_caught", "trainer")
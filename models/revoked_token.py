@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+from init import db
+
+
+class RevokedToken(db.Model):
+    """
+    A revoked access token (logout), or every token of a trainer issued up to
+    `revoked_at` (the trainer was deleted). Each process keeps a copy of the
+    rows in memory (revocation.py) and only reads the rows added since its
+    last sync, so checking a token does not query this table.
+    """
+
+    __tablename__ = "revoked_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Primary key for the table
+
+    jti: Mapped[Optional[str]] = mapped_column(String(36), unique=True)
+    # Unique id of the revoked token (null when all of a trainer's tokens are revoked)
+
+    trainer_id: Mapped[Optional[int]]
+    # Trainer whose tokens issued up to revoked_at are all revoked (no foreign key, the trainer is gone)
+
+    revoked_at: Mapped[datetime] = mapped_column(nullable=False, index=True)
+    # When the revocation was made (UTC), the processes sync the rows added after their last read
+
+    expires_at: Mapped[datetime] = mapped_column(nullable=False, index=True)
+    # When the revoked tokens expire anyway (UTC), after which the row is deleted
@@ -0,0 +1,74 @@
+from datetime import date, datetime
+from sqlalchemy.orm import Mapped, mapped_column
+from init import db
+from models.pokemon import pokemon_types
+from models.trainer import gym_types
+
+
+# Rollup tables behind /pokemons/stats and /trainers/stats. Each one holds a
+# GROUP BY over the pokemons and trainers tables, rebuilt by stats.refresh_stats
+# (`flask db refresh-stats`), so reading the statistics costs one row per group
+# instead of a scan of every Pokemon.
+
+
+class PokemonTypeStats(db.Model):
+    """
+    Number of Pokemons of each type.
+    """
+
+    __tablename__ = "pokemon_type_stats"
+
+    type: Mapped[str] = mapped_column(pokemon_types, primary_key=True)
+    # Pokemon type (uses the 'pokemon_types' Enum)
+
+    pokemons: Mapped[int] = mapped_column(nullable=False)
+    # Number of Pokemons of this type
+
+
+class CatchDayStats(db.Model):
+    """
+    Number of Pokemons caught on each day.
+    """
+
+    __tablename__ = "pokemon_catch_day_stats"
+
+    date_caught: Mapped[date] = mapped_column(primary_key=True)
+    # Day the Pokemons were caught (the primary key keeps date ranges an index range)
+
+    pokemons: Mapped[int] = mapped_column(nullable=False)
+    # Number of Pokemons caught that day
+
+
+class TeamStats(db.Model):
+    """
+    Number of trainers in each gym team and of Pokemons owned by them.
+    """
+
+    __tablename__ = "team_stats"
+
+    team: Mapped[str] = mapped_column(gym_types, primary_key=True)
+    # Trainer's Gym team (uses the 'gym_types' Enum)
+
+    trainers: Mapped[int] = mapped_column(nullable=False)
+    # Number of trainers in the team
+
+    pokemons: Mapped[int] = mapped_column(nullable=False)
+    # Number of Pokemons owned by the team's trainers (joined through trainer_id)
+
+
+class StatsRefresh(db.Model):
+    """
+    One row per rebuild of the rollup tables, the latest one tells how old
+    the statistics are (and versions their ETag).
+    """
+
+    __tablename__ = "stats_refreshes"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Primary key for the table, increasing with every refresh
+
+    refreshed_at: Mapped[datetime] = mapped_column(nullable=False)
+    # When the rollups were rebuilt (UTC)
+
+    seconds: Mapped[float] = mapped_column(nullable=False)
+    # How long the rebuild took
@@ -1,9 +1,10 @@
 from typing import List
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Boolean, Enum
+from sqlalchemy import String, Boolean, Enum, Index, false, literal_column, text
 from marshmallow.validate import Length, Regexp
 from marshmallow import fields
 from init import db, ma
+from metrics import TimedSchemaMixin
 
 
 # Creating an Enum for Gym types
@@ -21,6 +22,22 @@ class Trainer(db.Model):
     """
     __tablename__ = "trainers"
 
+    __table_args__ = (
+        # Login looks trainers up by email AND username together
+        Index("ix_trainers_email_username", "email", "username"),
+        # Partial index holding only the admins, used by the admin_only check
+        Index(
+            "ix_trainers_admin",
+            "id",
+            postgresql_where=text("admin"),
+            sqlite_where=text("admin"),
+        ),
+        # SQLite otherwise hands a deleted trainer's id to the next trainer created, who would
+        # inherit the deleted trainer's revoked tokens cutoff and owned Pokemons ETags
+        # (PostgreSQL sequences never reuse an id)
+        {"sqlite_autoincrement": True},
+    )
+
     # Defining model attributes (columns)
     id: Mapped[int] = mapped_column(primary_key=True)
         # Primary key for the table
@@ -41,15 +58,27 @@ class Trainer(db.Model):
         # Trainer's Gym team (uses the 'gym_types' Enum, not nullable)
 
     
-    admin: Mapped[bool] = mapped_column(Boolean(), server_default="false")
+    admin: Mapped[bool] = mapped_column(Boolean(), server_default=false())
         # Flag indicating if the trainer is an admin (boolean, defaults to False)
 
 
     pokemons: Mapped[List["Pokemon"]] = relationship(back_populates="trainer")
         # Relationship with the 'Pokemon' model (one trainer can have many pokemons)
 
+    version: Mapped[int] = mapped_column(
+        nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1
+    )
+        # Row version, bumped by every UPDATE (used to build the ETag of the Trainer)
+
+    pokemons_version: Mapped[int] = mapped_column(nullable=False, default=1, server_default="1")
+        # Bumped whenever one of the trainer's Pokemons is added, changed, moved or deleted (see
+        # versions.py), only ever goes up so the owned Pokemons ETag never repeats an earlier one
+
+    # Read the bumped version back in the UPDATE itself (RETURNING) rather than a SELECT later
+    __mapper_args__ = {"eager_defaults": True}
+
 # Defining the TrainerSchema for serialization and validation
-class TrainerSchema(ma.Schema):
+class TrainerSchema(TimedSchemaMixin, ma.Schema):
     """
     This class defines the Marshmallow schema for the Trainer model.
     It specifies how Trainer objects are serialized and validated.
@@ -0,0 +1,194 @@
+import base64
+import json
+from datetime import date
+from flask import request, abort, current_app, stream_with_context
+from sqlalchemy import and_, or_
+from init import db
+from projection import RowProjection
+
+
+# Run a listing statement, as Rows for a column projection or as model objects otherwise
+def fetch(stmt, schema):
+    if isinstance(schema, RowProjection):
+        return db.session.execute(stmt)
+    return db.session.scalars(stmt)
+
+
+# Turn the last seen key into an opaque token the client hands back as ?after=
+def encode_cursor(last_id, **keys):
+    payload = json.dumps({"id": last_id, **keys}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+# Read a cursor token back into its payload, rejecting anything tampered with
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        last_id = payload["id"]
+    except (ValueError, TypeError, KeyError):
+        abort(400, description="Invalid pagination cursor")
+    if not isinstance(last_id, int):
+        abort(400, description="Invalid pagination cursor")
+    return payload
+
+
+class Sort:
+    """
+    The ORDER BY of a listing: the requested keys, each a (name, expression,
+    descending, parse) tuple, followed by the model's id so every row has a
+    unique position. Builds the keyset condition that resumes a page right
+    after the last row of the previous one, and the cursor that carries that
+    row's key values to the client.
+    """
+
+    def __init__(self, model, keys=(), id_descending=None):
+        self.model = model
+        self.keys = list(keys)
+        if id_descending is None:
+            # The id follows the last key's direction so a (key, id) index is read one way only
+            id_descending = self.keys[-1][2] if self.keys else False
+        self.id_descending = id_descending
+        names = [("-" if descending else "") + name for name, _, descending, _ in self.keys]
+        if self.id_descending or self.keys:
+            names.append("-id" if self.id_descending else "id")
+        # The ?sort= value this order was read from, stored in cursors to reject mismatches
+        self.spec = ",".join(names)
+
+    def _terms(self):
+        terms = [(expression, descending) for _, expression, descending, _ in self.keys]
+        return terms + [(self.model.id, self.id_descending)]
+
+    def order_by(self):
+        return [expression.desc() if descending else expression.asc() for expression, descending in self._terms()]
+
+    def columns(self):
+        """The key values of each row, selected next to it for the cursor of the last row."""
+        labelled = [expression.label(f"sort__{index}") for index, (_, expression, _, _) in enumerate(self.keys)]
+        return labelled + [self.model.id.label("sort__id")]
+
+    def read_cursor(self, token):
+        """The key values and id of the cursor's row, rejecting a cursor of another sort order."""
+        payload = decode_cursor(token)
+        if payload.get("sort", "") != self.spec:
+            abort(400, description="This pagination cursor belongs to a different sort order")
+        values = payload.get("keys", [])
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            abort(400, description="Invalid pagination cursor")
+        try:
+            values = [parse(value) for (_, _, _, parse), value in zip(self.keys, values)]
+        except (ValueError, TypeError):
+            abort(400, description="Invalid pagination cursor")
+        return values + [payload["id"]]
+
+    def after(self, token):
+        """The condition selecting the rows that come after the cursor's row."""
+        values = self.read_cursor(token)
+        # (a > x) OR (a = x AND b > y) OR ... spelled out, since the keys can mix directions
+        terms = self._terms()
+        clauses = []
+        for index, (expression, descending) in enumerate(terms):
+            beyond = expression < values[index] if descending else expression > values[index]
+            equal = [terms[before][0] == values[before] for before in range(index)]
+            clauses.append(and_(*equal, beyond))
+        return or_(*clauses)
+
+    def encode(self, values):
+        """The cursor of a row with these key values and id (the id last)."""
+        *keys, last_id = values
+        if not self.spec:
+            # Plain id order keeps the original {"id": ...} cursor
+            return encode_cursor(last_id)
+        return encode_cursor(last_id, sort=self.spec, keys=[_cursor_value(value) for value in keys])
+
+    def cursor(self, row):
+        mapping = row._mapping
+        return self.encode([mapping[f"sort__{index}"] for index in range(len(self.keys))] + [mapping["sort__id"]])
+
+
+def _cursor_value(value):
+    # Dates travel as ISO 8601 strings and are parsed back by the key's parse function
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+# Read and validate the ?limit= and ?after= query parameters
+def page_args():
+    max_limit = current_app.config["PAGINATION_MAX_LIMIT"]
+    limit = request.args.get("limit", current_app.config["PAGINATION_DEFAULT_LIMIT"], type=int)
+    if limit is None or limit < 1 or limit > max_limit:
+        abort(400, description=f"limit must be between 1 and {max_limit}")
+    return limit, request.args.get("after") or None
+
+
+# The client asked for newline delimited JSON instead of a single JSON document
+def wants_stream():
+    if request.args.get("stream") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+
+# The client asked for a single page instead of the whole table
+def wants_page():
+    return "limit" in request.args or "after" in request.args
+
+
+def paginate(stmt, model, schema, sort=None):
+    """
+    Returns one keyset page of the statement in the sort order (the model's
+    id by default), with the cursor for the next page (None once the last
+    page is reached).
+    """
+    sort = sort or Sort(model)
+    limit, after = page_args()
+    if after is not None:
+        stmt = stmt.where(sort.after(after))
+    # Fetch one extra row to know whether there is another page without a COUNT(*),
+    # with each row's sort key values selected alongside it for the cursor
+    stmt = stmt.add_columns(*sort.columns()).order_by(*sort.order_by()).limit(limit + 1)
+    rows = db.session.execute(stmt).all()
+    next_cursor = sort.cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"data": schema.dump(page_items(rows[:limit], schema), many=True), "next_cursor": next_cursor}
+
+
+# The rows of a page as the dumper expects them: the Rows themselves for a column
+# projection, the model objects (ahead of the sort key columns) otherwise
+def page_items(rows, schema):
+    if isinstance(schema, RowProjection):
+        return rows
+    return [row[0] for row in rows]
+
+
+def stream_ndjson(stmt, model, schema, sort=None):
+    """
+    Streams every row of the statement as newline delimited JSON. Rows are read
+    from a server side cursor in chunks and written out as soon as they are
+    serialised, so memory use does not grow with the size of the table.
+    """
+    sort = sort or Sort(model)
+    chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+    stmt = stmt.order_by(*sort.order_by()).execution_options(yield_per=chunk_size)
+
+    def generate():
+        for row in fetch(stmt, schema):
+            yield current_app.json.dumps(schema.dump(row, many=False)) + "\n"
+
+    # stream_with_context keeps the request (and its db session) alive while streaming
+    return current_app.response_class(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+
+
+def list_response(stmt, model, schema, sort=None):
+    """
+    Serialises a listing either as an NDJSON stream, a keyset page, or (when
+    neither is asked for) the whole result as a plain JSON list, in the sort
+    order (the model's id by default).
+    """
+    sort = sort or Sort(model)
+    if wants_stream():
+        return stream_ndjson(stmt, model, schema, sort)
+    if wants_page():
+        return paginate(stmt, model, schema, sort)
+    return schema.dump(fetch(stmt.order_by(*sort.order_by()), schema).all(), many=True)
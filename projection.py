@@ -0,0 +1,130 @@
+from datetime import date, datetime
+from sqlalchemy import inspect
+from sqlalchemy.orm import aliased
+from flask import current_app
+from marshmallow import fields
+from init import db
+from loaders import load_options
+from metrics import phase
+
+# Field types whose dump is the plain column value (dates become ISO 8601 strings)
+PLAIN_FIELDS = (fields.Inferred, fields.String, fields.Integer, fields.Boolean, fields.Date, fields.DateTime)
+
+
+def _plain_columns(mapper, dump_fields):
+    """Maps each dumped field to its column, or returns None if a field is not a plain column."""
+    columns = {}
+    for name, field in dump_fields.items():
+        attribute = field.attribute or name
+        if not isinstance(field, PLAIN_FIELDS) or attribute not in mapper.column_attrs:
+            return None
+        columns[field.data_key or name] = attribute
+    return columns
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class RowProjection:
+    """
+    A fast stand-in for a schema on list endpoints: selects only the columns
+    the schema dumps (joining many-to-one nested schemas in the same query)
+    and builds each dict straight from the result Row, producing the same
+    output as schema.dump() without loading ORM objects or running
+    marshmallow per field.
+    """
+
+    def __init__(self, model, schema, columns, nested):
+        self.model = model
+        self.schema = schema
+        self._columns = columns
+        # [(key, relationship, alias, {key: attribute}, {key: label})] per nested schema
+        self._nested = nested
+
+    @classmethod
+    def of(cls, model, schema):
+        """Returns the projection for a schema, or None when it needs the ORM path."""
+        mapper = inspect(model)
+        columns = _plain_columns(
+            mapper,
+            {name: field for name, field in schema.dump_fields.items() if not isinstance(field, fields.Nested)},
+        )
+        if columns is None:
+            return None
+        nested = []
+        for name, field in schema.dump_fields.items():
+            if not isinstance(field, fields.Nested):
+                continue
+            relationship = mapper.relationships.get(field.attribute or name)
+            if relationship is None or relationship.uselist or field.many:
+                return None
+            nested_columns = _plain_columns(relationship.mapper, field.schema.dump_fields)
+            if nested_columns is None:
+                return None
+            alias = aliased(relationship.mapper.class_)
+            labels = {key: f"{name}__{key}" for key in nested_columns}
+            nested.append((field.data_key or name, relationship, alias, nested_columns, labels))
+        return cls(model, schema, columns, nested)
+
+    def select(self):
+        """A SELECT of exactly the dumped columns, including the joined nested ones."""
+        selected = [getattr(self.model, attribute).label(key) for key, attribute in self._columns.items()]
+        if "id" not in self._columns:
+            # Keyset pagination reads the id of the last row
+            selected.append(self.model.id.label("id"))
+        joins = []
+        for key, relationship, alias, nested_columns, labels in self._nested:
+            related_key = inspect(alias).mapper.primary_key[0].key
+            selected.append(getattr(alias, related_key).label(f"{key}__pk"))
+            selected.extend(
+                getattr(alias, attribute).label(labels[nested_key])
+                for nested_key, attribute in nested_columns.items()
+            )
+            joins.append((alias, getattr(self.model, relationship.key).of_type(alias)))
+        stmt = db.select(*selected).select_from(self.model)
+        for alias, onclause in joins:
+            stmt = stmt.outerjoin(onclause)
+        return stmt
+
+    def _dump_row(self, row):
+        mapping = row._mapping
+        data = {key: _value(mapping[key]) for key in self._columns}
+        for key, relationship, alias, nested_columns, labels in self._nested:
+            if mapping[f"{key}__pk"] is None:
+                data[key] = None
+            else:
+                data[key] = {nested_key: _value(mapping[label]) for nested_key, label in labels.items()}
+        return data
+
+    def dump(self, rows, many=None):
+        if many is None:
+            many = self.schema.many
+        with phase("schema_dump"):
+            if many:
+                return [self._dump_row(row) for row in rows]
+            return self._dump_row(rows)
+
+
+# Projections are built once per (model, schema instance)
+_projections = {}
+
+
+def listing(model, schema, fast_dump=None):
+    """
+    Returns (statement, dumper) for a list endpoint: the column projection
+    when FAST_DUMP is on and the schema allows it, otherwise a SELECT of the
+    model with loader options matched to the schema, and the schema itself.
+    """
+    if fast_dump is None:
+        fast_dump = current_app.config["FAST_DUMP"]
+    if fast_dump:
+        key = (model, id(schema))
+        if key not in _projections:
+            _projections[key] = RowProjection.of(model, schema)
+        projection = _projections[key]
+        if projection is not None:
+            return projection.select(), projection
+    return db.select(model).options(*load_options(model, schema)), schema
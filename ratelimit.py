@@ -0,0 +1,214 @@
+import math
+import time
+from functools import wraps
+from flask import abort, after_this_request, current_app, jsonify, make_response, request
+from init import on_setup
+from metrics import registry
+
+rate_limit_requests = registry.counter(
+    "rate_limit_requests_total",
+    "Rate limited requests by route and result (allowed or rejected).",
+    ["route", "result"],
+)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(value):
+    """
+    Reads a limit such as "5/minute" or "100/3600" into (capacity, tokens per
+    second). An empty value or a count of 0 turns the limit off (None).
+    """
+    if not value:
+        return None
+    count, _, period = value.partition("/")
+    seconds = PERIODS[period] if period in PERIODS else float(period or 1)
+    if int(count) <= 0:
+        return None
+    return int(count), int(count) / seconds
+
+
+class MemoryBuckets:
+    """
+    Per process token buckets. Each bucket is a (tokens, updated, full_at)
+    tuple replaced with a single dict assignment, so there is no lock on the
+    login path: two threads racing on the same key can at worst both take the
+    last token, which is fine for a limiter. Buckets that have refilled are
+    dropped once there are more than `maxsize` of them.
+    """
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._buckets = {}
+
+    def take(self, key, capacity, rate):
+        """Takes a token, returning (allowed, tokens left, seconds until one is available)."""
+        now = time.monotonic()
+        tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        if len(self._buckets) > self.maxsize:
+            self._prune(now)
+        return allowed, tokens, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        # A full bucket is the same as no bucket, so forgetting it loses nothing
+        for key, (_, _, full_at) in list(self._buckets.items()):
+            if full_at <= now:
+                self._buckets.pop(key, None)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+# Refill and take in one atomic step on the Redis server
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by every worker through Redis, so a limit holds for
+    the whole deployment rather than per process. Needs the optional `redis`
+    package.
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as err:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the 'redis' package") from err
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self._take(keys=[f"ratelimit:{key}"], args=[capacity, rate, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), tokens, 0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        for key in self._redis.scan_iter("ratelimit:*"):
+            self._redis.delete(key)
+
+
+def _backend(config):
+    backend = config["RATE_LIMIT_BACKEND"]
+    if backend == "memory":
+        return MemoryBuckets()
+    if backend == "redis":
+        return RedisBuckets(config["RATE_LIMIT_URL"])
+    return None
+
+
+# The buckets of RATE_LIMIT_BACKEND (None when limits are off), built by create_app
+buckets = None
+
+
+@on_setup
+def _create_buckets(app):
+    global buckets
+    buckets = _backend(app.config)
+
+
+# Bucket keys for the client's address (the request's, unless one is given)
+def by_ip(address=None):
+    if address is None:
+        address = request.remote_addr
+    return [f"ip:{address}"]
+
+
+# Bucket keys for the account a login names, one per identifier so that
+# changing only the username or only the email does not get a fresh bucket
+def by_account(body=None):
+    if body is None:
+        body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return []
+    return [
+        f"{field}:{body[field].strip().lower()}"
+        for field in ("username", "email")
+        if isinstance(body.get(field), str)
+    ]
+
+
+def consume(route, keyed_limits):
+    """
+    Takes a token from every bucket in `keyed_limits`, a list of (keys,
+    limit string) pairs. Returns (allowed, seconds to wait, headers), with
+    the headers describing the tightest bucket; (True, 0, {}) when no limit
+    applies.
+    """
+    if buckets is None:
+        return True, 0, {}
+    checked = []
+    for keys, value in keyed_limits:
+        limit = parse_limit(value)
+        if limit is None:
+            continue
+        for key in keys:
+            allowed, tokens, retry_after = buckets.take(f"{route}:{key}", *limit)
+            checked.append((limit[0], tokens, allowed, retry_after))
+    if not checked:
+        return True, 0, {}
+    capacity, tokens, _, _ = min(checked, key=lambda bucket: bucket[1])
+    headers = {
+        "X-RateLimit-Limit": str(capacity),
+        "X-RateLimit-Remaining": str(int(tokens)),
+    }
+    if all(allowed for _, _, allowed, _ in checked):
+        rate_limit_requests.inc(route=route, result="allowed")
+        return True, 0, headers
+    rate_limit_requests.inc(route=route, result="rejected")
+    retry_after = math.ceil(max(retry_after for _, _, allowed, retry_after in checked if not allowed))
+    headers["Retry-After"] = str(retry_after)
+    return False, retry_after, headers
+
+
+def rate_limit(route, *limits):
+    """
+    Route decorator applying token bucket limits before the handler runs (so
+    before any query or password hash). Each limit is (key function, config
+    key), the config value being a limit such as "5/minute"; a request takes
+    a token from every bucket it maps to and is turned away with a 429 when
+    any of them is empty.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            allowed, _, headers = consume(
+                route,
+                [(key_function(), current_app.config[config_key]) for key_function, config_key in limits],
+            )
+            if not allowed:
+                abort(make_response(jsonify(error="Too many requests, please try again later"), 429, headers))
+            if headers:
+
+                @after_this_request
+                def add_headers(response):
+                    response.headers.update(headers)
+                    return response
+
+            return fn(*args, **kwargs)
+
+        return inner
+
+    return decorator
@@ -0,0 +1,137 @@
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from init import on_setup
+from cache import ResponseCache, MemoryBackend, RedisBackend
+from metrics import registry
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+
+cache_requests = registry.counter(
+    "response_cache_requests_total",
+    "Response cache lookups by namespace and result (hit, stale or miss).",
+    ["namespace", "result"],
+)
+
+
+def _backend(config):
+    backend = config["RESPONSE_CACHE_BACKEND"]
+    if backend == "memory":
+        return MemoryBackend(maxsize=config["RESPONSE_CACHE_SIZE"])
+    if backend == "redis":
+        return RedisBackend(config["RESPONSE_CACHE_URL"])
+    return None
+
+
+# Cache of serialised trainers ("trainer" namespace) and owned Pokemon lists ("owned"),
+# both keyed by trainer id. Off until create_app gives it its backend
+resource_cache = ResponseCache(
+    on_result=lambda namespace, result: cache_requests.inc(namespace=namespace, result=result),
+)
+
+
+@on_setup
+def _configure_resource_cache(app):
+    resource_cache.backend = _backend(app.config)
+    resource_cache.ttl = app.config["RESPONSE_CACHE_TTL"]
+    resource_cache.grace = app.config["RESPONSE_CACHE_GRACE"]
+
+
+def _stale_keys(session):
+    return session.info.setdefault("stale_cache_keys", set())
+
+
+# Collect the keys made stale by the objects this flush wrote
+def _collect_flushed(session, flush_context):
+    keys = _stale_keys(session)
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Trainer):
+            keys.add(("trainer", obj.id))
+            # Owned Pokemon lists nest their trainer
+            keys.add(("owned", obj.id))
+        elif isinstance(obj, Pokemon) and obj.trainer_id is not None:
+            keys.add(("owned", obj.trainer_id))
+
+
+def trainer_ids_in(statement, parameters):
+    """
+    Finds which trainers' Pokemons an INSERT/UPDATE/DELETE statement touches,
+    from its parameters or a `trainer_id = ...` condition. None if unknown.
+    """
+    trainer_ids = set()
+    rows = parameters if isinstance(parameters, list) else [parameters or {}]
+    for row in rows:
+        if "trainer_id" in row:
+            trainer_ids.add(row["trainer_id"])
+    whereclause = getattr(statement, "whereclause", None)
+    if whereclause is not None:
+        for element in visitors.iterate(whereclause):
+            if (
+                isinstance(element, BinaryExpression)
+                and element.operator is operators.eq
+                and getattr(element.left, "key", None) == "trainer_id"
+                and isinstance(element.right, BindParameter)
+            ):
+                trainer_ids.add(element.right.value)
+    return trainer_ids or None
+
+
+# Bulk INSERT/UPDATE/DELETE statements bypass the flush, look at the statement instead
+def _collect_executed(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    keys = _stale_keys(orm_execute_state.session)
+    if mapper is not None and mapper.class_ is Pokemon:
+        trainer_ids = trainer_ids_in(orm_execute_state.statement, orm_execute_state.parameters)
+        if trainer_ids is None:
+            keys.add(("owned", None))
+        else:
+            keys.update(("owned", trainer_id) for trainer_id in trainer_ids)
+    elif mapper is None or mapper.class_ is Trainer:
+        # A bulk trainer statement (or one on an unknown table) drops both namespaces
+        keys.update({("trainer", None), ("owned", None)})
+    # Writes to the other tables (e.g. the statistics rollups) are in no cached response
+
+
+def committed_keys(session):
+    """Takes the (namespace, identifier) keys made stale by what the session just committed."""
+    return session.info.pop("stale_cache_keys", None)
+
+
+def invalidate_keys(keys):
+    """Drops these keys (a whole namespace for an identifier of None) from the cache."""
+    if not keys or not resource_cache.enabled:
+        return
+    for namespace, identifier in keys:
+        if identifier is None:
+            resource_cache.invalidate_namespace(namespace)
+        else:
+            resource_cache.invalidate(namespace, identifier)
+
+
+# Only invalidate once the change is committed and visible to the next reader
+def _invalidate(session):
+    invalidate_keys(committed_keys(session))
+
+
+def _discard(session):
+    session.info.pop("stale_cache_keys", None)
+
+
+def track_writes(session_class, invalidate_on_commit=True):
+    """
+    Invalidates the cached entries made stale by what sessions of this class
+    commit. With invalidate_on_commit=False the commit only leaves the keys
+    for the caller to invalidate (invalidate_keys(committed_keys(session))),
+    e.g. from a worker thread rather than inside an event loop.
+    """
+    event.listen(session_class, "after_flush", _collect_flushed)
+    event.listen(session_class, "do_orm_execute", _collect_executed)
+    if invalidate_on_commit:
+        event.listen(session_class, "after_commit", _invalidate)
+    event.listen(session_class, "after_rollback", _discard)
+
+
+track_writes(Session)
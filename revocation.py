@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask_sqlalchemy.session import Session
+from sqlalchemy import delete, event, select
+from init import app, db, on_setup
+from models.revoked_token import RevokedToken
+
+# How long the tokens issued at login stay valid
+TOKEN_LIFETIME = timedelta(hours=8)
+
+# Every sync reads the revocations made from this long before the previous one on, so
+# rows committed late (a slow transaction, clocks a little apart between hosts) are not missed
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# Seconds between deletes of the rows whose tokens have expired, per process
+PURGE_INTERVAL = 3600
+
+# Seconds the first checks of a process wait for the denylist to be read, before they
+# are answered with a 503 rather than letting tokens through unchecked
+FIRST_SYNC_WAIT = 5
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _timestamp(moment):
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TokenDenylist:
+    """
+    In-process copy of the revoked_tokens table: a dict of revoked token ids
+    and a dict of trainer id -> time before which all of the trainer's tokens
+    are revoked, so checking a token is two dict lookups and never a query.
+    Revocations made in this process are added once they commit; those of
+    other processes are read every `sync_interval` seconds by a background
+    thread (started by the first check), which also evicts the entries whose
+    tokens have expired and deletes their rows once an hour.
+    """
+
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self._reset()
+        # A forked worker process starts its own thread, the parent's is not copied
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        # jti -> expiry of the token (UTC)
+        self._tokens = {}
+        # trainer id -> (cutoff as a timestamp, expiry of the last token issued before it)
+        self._trainers = {}
+        self._synced_at = None
+        self._next_purge = 0.0
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        # Set once the first sync has read the table
+        self._ready = threading.Event()
+
+    def __len__(self):
+        return len(self._tokens) + len(self._trainers)
+
+    def _add(self, jti, trainer_id, revoked_at, expires_at):
+        if jti is not None:
+            self._tokens[jti] = expires_at
+        if trainer_id is not None:
+            cutoff = _timestamp(revoked_at)
+            current = self._trainers.get(trainer_id)
+            if current is None or current[0] < cutoff:
+                self._trainers[trainer_id] = (cutoff, expires_at)
+
+    def add(self, revocations):
+        """Adds (jti, trainer id, revoked at, expires at) revocations committed in this process."""
+        with self._lock:
+            for revocation in revocations:
+                self._add(*revocation)
+
+    def is_revoked(self, claims):
+        if claims["jti"] in self._tokens:
+            return True
+        revoked = self._trainers.get(claims["sub"])
+        # Tokens issued in the second of the revocation are revoked too (iat is in whole seconds)
+        return revoked is not None and claims.get("iat", 0) <= revoked[0]
+
+    def ready(self, timeout=FIRST_SYNC_WAIT):
+        """
+        Starts the sync thread the first time, and waits up to `timeout` seconds
+        for its first read. False when the revocations are still unknown.
+        """
+        if self._ready.is_set():
+            return True
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="token-denylist", daemon=True)
+                    self._worker.start()
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                with app.app_context():
+                    self.sync()
+            except Exception:
+                app.logger.exception("Syncing the token denylist failed")
+            time.sleep(self.sync_interval)
+
+    def sync(self):
+        """
+        Reads the revocations made since the last sync (every unexpired one the
+        first time) and evicts the expired entries. Runs on the primary
+        database, outside any session, and needs the Flask app context. On
+        failure the last copy is kept and the error raised.
+        """
+        with self._lock:
+            now = _utcnow()
+            stmt = select(
+                RevokedToken.jti, RevokedToken.trainer_id, RevokedToken.revoked_at, RevokedToken.expires_at
+            ).where(RevokedToken.expires_at > now)
+            if self._synced_at is not None:
+                stmt = stmt.where(RevokedToken.revoked_at >= self._synced_at - SYNC_OVERLAP)
+            with db.engine.connect() as connection:
+                rows = connection.execute(stmt).all()
+            if time.monotonic() >= self._next_purge:
+                with db.engine.begin() as connection:
+                    connection.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+                self._next_purge = time.monotonic() + PURGE_INTERVAL
+            for row in rows:
+                self._add(*row)
+            # Rebuilt rather than changed in place, checks on other threads read them unlocked
+            self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+            self._trainers = {
+                trainer_id: revoked for trainer_id, revoked in self._trainers.items() if revoked[1] > now
+            }
+            self._synced_at = now
+            self._ready.set()
+
+
+# The denylist of this process
+token_denylist = TokenDenylist(sync_interval=1.0)
+
+
+@on_setup
+def _configure_denylist(app):
+    token_denylist.sync_interval = app.config["TOKEN_DENYLIST_SYNC_SECONDS"]
+
+
+def _revoke(session, jti, trainer_id, expires_at):
+    revocation = RevokedToken(jti=jti, trainer_id=trainer_id, revoked_at=_utcnow(), expires_at=expires_at)
+    session.add(revocation)
+    # Added to the denylist once the session commits
+    session.info.setdefault("revoked_tokens", []).append(
+        (revocation.jti, revocation.trainer_id, revocation.revoked_at, revocation.expires_at)
+    )
+
+
+def _token_expiry(claims):
+    if "exp" in claims:
+        return datetime.fromtimestamp(claims["exp"], timezone.utc).replace(tzinfo=None)
+    return _utcnow() + TOKEN_LIFETIME
+
+
+def revoke_token(session, claims):
+    """Revokes the token with these claims when the session commits (logout)."""
+    _revoke(session, claims["jti"], None, _token_expiry(claims))
+
+
+def already_revoked(claims):
+    """
+    Adds a token to the denylist straight away, when committing its revocation
+    failed because a concurrent logout of the same token committed its row first.
+    """
+    token_denylist.add([(claims["jti"], None, _utcnow(), _token_expiry(claims))])
+
+
+def revoke_trainer_tokens(session, trainer_id):
+    """Revokes every token issued to the trainer so far when the session commits (e.g. with its deletion)."""
+    _revoke(session, None, trainer_id, _utcnow() + TOKEN_LIFETIME)
+
+
+def _committed(session):
+    revocations = session.info.pop("revoked_tokens", None)
+    if revocations:
+        token_denylist.add(revocations)
+
+
+def _rolled_back(session):
+    session.info.pop("revoked_tokens", None)
+
+
+def track_revocations(session_class):
+    """Adds the revocations committed by sessions of this class to the in-process denylist."""
+    event.listen(session_class, "after_commit", _committed)
+    event.listen(session_class, "after_rollback", _rolled_back)
+
+
+track_revocations(Session)
@@ -0,0 +1,132 @@
+import hashlib
+import itertools
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+from cache import MemoryBackend
+from metrics import registry
+
+# Where clients that wrote recently are pinned to the primary when the response cache is
+# off: per process, so only that process's reads see the pin
+_local_pins = MemoryBackend(maxsize=100_000)
+
+_round_robin = itertools.count()
+
+routed_queries = registry.counter(
+    "db_routed_queries_total",
+    "Read-only handler queries by the database they were sent to.",
+    ["target"],
+)
+
+
+def replica_keys():
+    """The SQLALCHEMY_BINDS keys of the configured read replicas."""
+    return [key for key in current_app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith("replica_")]
+
+
+def client_key():
+    """
+    Identifies the client for read-your-writes pinning by its bearer token
+    (hashed, so tokens are never kept around), None without one. Not by its
+    address, behind a proxy every client has the same one.
+    """
+    authorization = request.headers.get("Authorization")
+    if not authorization:
+        return None
+    return "pin:" + hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+
+
+def _pins():
+    # The response cache's backend, shared by every worker with Redis. Imported here,
+    # resource_cache imports init, which imports this module
+    from resource_cache import resource_cache
+
+    return resource_cache.backend or _local_pins
+
+
+def pin_to_primary():
+    """Sends this client's reads to the primary for READ_YOUR_WRITES_SECONDS."""
+    window = current_app.config["READ_YOUR_WRITES_SECONDS"]
+    key = client_key()
+    if window > 0 and key is not None:
+        _pins().set(key, True, window)
+
+
+def pinned_to_primary():
+    # Looked up once per request, not once per query
+    if "db_pinned" not in g:
+        key = client_key()
+        g.db_pinned = key is not None and _pins().get(key) is not None
+    return g.db_pinned
+
+
+def choose_replica(engines, keys):
+    """Picks a replica engine with the configured REPLICA_STRATEGY."""
+    if current_app.config["REPLICA_STRATEGY"] == "least_connections":
+        # NullPool (PgBouncer) has no checked out count, those replicas count as idle
+        return min(
+            (engines[key] for key in keys),
+            key=lambda engine: getattr(engine.pool, "checkedout", lambda: 0)(),
+        )
+    return engines[keys[next(_round_robin) % len(keys)]]
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the SELECTs of read-only handlers to a read replica.
+    Writes, flushes, everything outside a read-only handler and clients that
+    wrote in the last few seconds (so they read their own writes) stay on
+    the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and has_request_context()
+            and g.get("db_read_only")
+        ):
+            keys = replica_keys()
+            if keys and not pinned_to_primary():
+                routed_queries.inc(target="replica")
+                return choose_replica(self._db.engines, keys)
+            routed_queries.inc(target="primary")
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Route decorator marking a handler as read-only, so its queries may go to a replica
+def read_only(fn):
+    @wraps(fn)
+    def inner(*args, **kwargs):
+        g.db_read_only = True
+        return fn(*args, **kwargs)
+
+    return inner
+
+
+# Remember that the session wrote something, through the unit of work...
+@event.listens_for(Session, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+# ...or through a bulk INSERT/UPDATE/DELETE statement
+@event.listens_for(Session, "do_orm_execute")
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+# Once the write is committed, keep the client on the primary for a while
+@event.listens_for(Session, "after_commit")
+def _committed(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        pin_to_primary()
+
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
@@ -0,0 +1,239 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from flask import abort
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Float, cast, event, func, or_, select
+from sqlalchemy.engine import make_url
+from init import app, db
+from models.pokemon import Pokemon
+from pagination import Sort
+
+# pg_trgm's default pg_trgm.word_similarity_threshold, the fuzzy match cut-off
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+# Longest ?q= accepted
+MAX_QUERY_LENGTH = 100
+
+# Words as pg_trgm splits them: runs of letters and digits
+WORD = re.compile(r"[^\W_]+")
+
+
+# Read and validate ?q= and ?mode= (fuzzy, the default, or prefix for autocomplete)
+def search_args(args):
+    query = args.get("q", "").strip()
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        abort(400, description=f"q must be between 1 and {MAX_QUERY_LENGTH} characters")
+    mode = args.get("mode", "fuzzy")
+    if mode not in ("fuzzy", "prefix"):
+        abort(400, description="mode must be fuzzy or prefix")
+    return query, mode
+
+
+def search_in_database():
+    """Whether to search with pg_trgm in the database, or with the in-process index."""
+    backend = app.config["SEARCH_BACKEND"]
+    if backend == "auto":
+        # Read from the URI rather than db.engine, the async views have no Flask app context
+        return make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name() == "postgresql"
+    return backend == "pg_trgm"
+
+
+def search_sort(rank=None):
+    # Best match first, ties broken by id like every other listing (the in-process
+    # index only needs the sort for its cursors, not the rank expression)
+    return Sort(Pokemon, [("rank", rank, True, float)])
+
+
+def _like_prefix(query):
+    # Escape the LIKE wildcards so they match literally
+    return re.sub(r"([\\%_])", r"\\\1", query) + "%"
+
+
+def search_clause(query, mode):
+    """
+    The (condition, rank) of a pg_trgm search over name and ability. Fuzzy
+    mode matches values with a word similar to the query (%> operator,
+    ranked by word_similarity); prefix mode matches values starting with it
+    (ILIKE 'q%', ranked by similarity so shorter values come first). Both
+    conditions are answered by the trigram GIN indexes on the two columns.
+    The rank is cast to double precision: similarity() returns a real,
+    which would come back from a keyset cursor as a float8 parameter and
+    never compare equal to itself, skipping or repeating the rows tied on
+    rank at a page boundary.
+    """
+    if mode == "prefix":
+        pattern = _like_prefix(query)
+        condition = or_(Pokemon.name.ilike(pattern, escape="\\"), Pokemon.ability.ilike(pattern, escape="\\"))
+        rank = func.greatest(func.similarity(Pokemon.name, query), func.similarity(Pokemon.ability, query))
+    else:
+        condition = or_(Pokemon.name.op("%>")(query), Pokemon.ability.op("%>")(query))
+        rank = func.greatest(
+            func.word_similarity(query, Pokemon.name), func.word_similarity(query, Pokemon.ability)
+        )
+    return condition, cast(rank, Float(53))
+
+
+def trigrams(text):
+    """pg_trgm's trigrams of a string: every word lower cased, padded with two spaces in front and one behind."""
+    grams = set()
+    for word in WORD.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+# pg_trgm's similarity(): the share of trigrams two strings have in common
+def similarity(grams, other):
+    shared = len(grams & other)
+    total = len(grams) + len(other) - shared
+    return shared / total if total else 0.0
+
+
+# Close to pg_trgm's word_similarity(): the share of the query's trigrams found in the value
+def word_similarity(query_grams, grams):
+    return len(query_grams & grams) / len(query_grams) if query_grams else 0.0
+
+
+class TrigramIndex:
+    """
+    In-process stand-in for the pg_trgm indexes on databases without them
+    (SQLite in development and tests). Keeps the name and ability trigrams
+    of every Pokemon, an inverted index from each trigram to the Pokemons
+    having it, and the lower cased values sorted for prefix lookups. It is
+    rebuilt from the database by the first search after a Pokemon write was
+    committed in this process, so it is meant for a single process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        # id -> (name trigrams, ability trigrams, trainer id)
+        self._documents = {}
+        self._postings = {}
+        # sorted (lower cased name or ability, id)
+        self._values = []
+
+    def invalidate(self):
+        self._stale = True
+
+    def _build(self):
+        documents = {}
+        postings = defaultdict(list)
+        values = []
+        stmt = select(Pokemon.id, Pokemon.name, Pokemon.ability, Pokemon.trainer_id)
+        for pokemon_id, name, ability, trainer_id in db.session.execute(stmt.execution_options(yield_per=10_000)):
+            name_grams = trigrams(name)
+            ability_grams = trigrams(ability)
+            documents[pokemon_id] = (name_grams, ability_grams, trainer_id)
+            for gram in name_grams | ability_grams:
+                postings[gram].append(pokemon_id)
+            values.append((name.lower(), pokemon_id))
+            values.append((ability.lower(), pokemon_id))
+        values.sort()
+        self._documents, self._postings, self._values = documents, dict(postings), values
+
+    def _ensure_built(self):
+        with self._lock:
+            if self._stale:
+                # Cleared first, so a write committed during the build marks it stale again
+                self._stale = False
+                try:
+                    self._build()
+                except Exception:
+                    self._stale = True
+                    raise
+
+    def _fuzzy(self, query_grams):
+        # Count the query trigrams each Pokemon has (in either column) and skip those
+        # that cannot reach the threshold before scoring the columns one by one
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+        needed = WORD_SIMILARITY_THRESHOLD * len(query_grams)
+        for pokemon_id, count in shared.items():
+            if count < needed:
+                continue
+            name_grams, ability_grams, _ = self._documents[pokemon_id]
+            rank = max(word_similarity(query_grams, name_grams), word_similarity(query_grams, ability_grams))
+            if rank >= WORD_SIMILARITY_THRESHOLD:
+                yield rank, pokemon_id
+
+    def _prefix(self, query, query_grams):
+        prefix = query.lower()
+        matched = set()
+        position = bisect_left(self._values, (prefix,))
+        while position < len(self._values) and self._values[position][0].startswith(prefix):
+            matched.add(self._values[position][1])
+            position += 1
+        for pokemon_id in matched:
+            name_grams, ability_grams, _ = self._documents[pokemon_id]
+            yield max(similarity(query_grams, name_grams), similarity(query_grams, ability_grams)), pokemon_id
+
+    def search(self, query, mode, trainer_id=None):
+        """Returns the matching (rank, id) pairs, best match first, ties by id (descending)."""
+        self._ensure_built()
+        query_grams = trigrams(query)
+        matches = self._prefix(query, query_grams) if mode == "prefix" else self._fuzzy(query_grams)
+        if trainer_id is not None:
+            matches = (match for match in matches if self._documents[match[1]][2] == trainer_id)
+        return sorted(matches, reverse=True)
+
+    def page(self, query, mode, trainer_id, sort, after, limit):
+        """
+        One page of a search as [(rank, id)], continuing after the cursor's
+        row, with the cursor for the next page (None on the last page).
+        """
+        matches = self.search(query, mode, trainer_id)
+        if after is not None:
+            rank, last_id = sort.read_cursor(after)
+            matches = [match for match in matches if match < (rank, last_id)]
+        next_cursor = sort.encode(list(matches[limit - 1])) if len(matches) > limit else None
+        return matches[:limit], next_cursor
+
+
+# The in-process index of this process
+trigram_index = TrigramIndex()
+
+
+# trigram_index.page on a worker thread of the async views, which builds the index
+# through the Flask-SQLAlchemy session and so needs the app context
+def page_in_app_context(*args):
+    with app.app_context():
+        return trigram_index.page(*args)
+
+
+# Note that the session wrote Pokemons, through the unit of work...
+def _flushed(session, flush_context):
+    if any(isinstance(obj, Pokemon) for obj in session.new | session.dirty | session.deleted):
+        session.info["search_stale"] = True
+
+
+# ...or through a bulk INSERT/UPDATE/DELETE statement
+def _executed(orm_execute_state):
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is Pokemon:
+        orm_execute_state.session.info["search_stale"] = True
+
+
+def _committed(session):
+    if session.info.pop("search_stale", False):
+        trigram_index.invalidate()
+
+
+def _rolled_back(session):
+    session.info.pop("search_stale", None)
+
+
+def track_search_writes(session_class):
+    """Marks the in-process search index stale once sessions of this class commit Pokemon writes."""
+    event.listen(session_class, "after_flush", _flushed)
+    event.listen(session_class, "do_orm_execute", _executed)
+    event.listen(session_class, "after_commit", _committed)
+    event.listen(session_class, "after_rollback", _rolled_back)
+
+
+track_search_writes(Session)
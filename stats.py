@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from flask import abort, jsonify, make_response
+from sqlalchemy import delete, insert, select, func
+from init import app, db
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+from models.stats import PokemonTypeStats, CatchDayStats, TeamStats, StatsRefresh
+
+# Key of the PostgreSQL advisory lock held while the rollups are rebuilt
+STATS_LOCK_KEY = 7_102_019
+
+# Seconds a first request waits for another process that is building the rollups, polling
+# every BUILD_POLL seconds, before it is answered with a 503 and a Retry-After instead
+BUILD_WAIT = 5
+BUILD_POLL = 0.25
+
+STATS_BUILDING = "The statistics are being built, please try again shortly"
+
+
+def try_stats_lock(session):
+    """Takes the rebuild lock for the session's transaction, False when another process holds it."""
+    if db.engine.dialect.name != "postgresql":
+        # Nothing to share the lock with, SQLite writers are serialised anyway
+        return True
+    return session.scalar(select(func.pg_try_advisory_xact_lock(STATS_LOCK_KEY)))
+
+
+def refresh_stats():
+    """
+    Rebuilds every rollup table with one INSERT ... SELECT ... GROUP BY each,
+    inside a single transaction, so readers see either the old or the new
+    statistics and never a mix. Returns the new StatsRefresh, or None when
+    another process is already refreshing them (PostgreSQL only).
+    """
+    started = time.perf_counter()
+    session = db.session
+    # Two concurrent rebuilds would both insert the same groups, the second one gives way
+    if not try_stats_lock(session):
+        session.rollback()
+        return None
+    rollups = [
+        (
+            PokemonTypeStats,
+            ["type", "pokemons"],
+            select(Pokemon.type, func.count(Pokemon.id)).group_by(Pokemon.type),
+        ),
+        (
+            CatchDayStats,
+            ["date_caught", "pokemons"],
+            select(Pokemon.date_caught, func.count(Pokemon.id)).group_by(Pokemon.date_caught),
+        ),
+        (
+            TeamStats,
+            ["team", "trainers", "pokemons"],
+            # Trainers without Pokemons still count towards their team
+            select(Trainer.team, func.count(func.distinct(Trainer.id)), func.count(Pokemon.id))
+            .outerjoin(Pokemon, Pokemon.trainer_id == Trainer.id)
+            .group_by(Trainer.team),
+        ),
+    ]
+    for model, columns, query in rollups:
+        session.execute(delete(model).execution_options(synchronize_session=False))
+        session.execute(insert(model).from_select(columns, query))
+    refresh = StatsRefresh(
+        refreshed_at=datetime.now(timezone.utc).replace(tzinfo=None),
+        seconds=time.perf_counter() - started,
+    )
+    session.add(refresh)
+    session.commit()
+    return refresh
+
+
+# refresh_stats outside a request, e.g. on a background thread
+def refresh_in_app_context():
+    with app.app_context():
+        refresh_stats()
+
+
+def build_stats():
+    """
+    Builds the rollups for the first time, or waits up to BUILD_WAIT seconds
+    for the process already building them. Returns the latest StatsRefresh,
+    or None when there is still none.
+    """
+    refresh = refresh_stats()
+    deadline = time.monotonic() + BUILD_WAIT
+    while refresh is None and time.monotonic() < deadline:
+        time.sleep(BUILD_POLL)
+        # A new transaction each time, to see the lock holder's commit
+        db.session.rollback()
+        refresh = db.session.scalar(latest_refresh_query)
+    return refresh
+
+
+# build_stats on a worker thread of the async views
+def build_in_app_context():
+    with app.app_context():
+        build_stats()
+
+
+# Only one background refresh per process at a time
+_refreshing = threading.Lock()
+
+
+def refresh_in_background():
+    """Starts refresh_stats on a background thread unless one is already running."""
+    if not _refreshing.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refresh_in_app_context()
+        except Exception:
+            app.logger.exception("Refreshing the statistics rollups failed")
+        finally:
+            _refreshing.release()
+
+    threading.Thread(target=run, name="stats-refresh", daemon=True).start()
+
+
+def is_stale(refresh):
+    # STATS_MAX_AGE=0 leaves refreshing to `flask db refresh-stats` (e.g. from cron)
+    max_age = app.config["STATS_MAX_AGE"]
+    if not max_age:
+        return False
+    age = datetime.now(timezone.utc).replace(tzinfo=None) - refresh.refreshed_at
+    return age.total_seconds() > max_age
+
+
+# The latest rebuild of the rollups
+latest_refresh_query = select(StatsRefresh).order_by(StatsRefresh.id.desc()).limit(1)
+
+
+def latest_refresh():
+    """
+    Returns the latest StatsRefresh. The rollups are built on the spot the
+    first time, and rebuilt in the background (while the current ones keep
+    being served) once they are older than STATS_MAX_AGE seconds. Answers
+    503 when another process is still building them after BUILD_WAIT seconds.
+    """
+    refresh = db.session.scalar(latest_refresh_query)
+    if refresh is None:
+        refresh = build_stats()
+        if refresh is None:
+            abort(make_response(jsonify(error=STATS_BUILDING), 503, {"Retry-After": "1"}))
+    elif is_stale(refresh):
+        refresh_in_background()
+    return refresh
+
+
+async def latest_refresh_async(session):
+    """
+    latest_refresh for the async views (asgi.py), building the rollups on a
+    worker thread. Returns None instead of answering 503, the views raise it.
+    """
+    refresh = await session.scalar(latest_refresh_query)
+    if refresh is None:
+        await asyncio.to_thread(build_in_app_context)
+        refresh = await session.scalar(latest_refresh_query)
+    elif is_stale(refresh):
+        refresh_in_background()
+    return refresh
+
+
+def pokemon_queries(caught_from=None, caught_to=None):
+    """The rollup reads behind /pokemons/stats, catches per day limited to the given dates."""
+    days = select(CatchDayStats.date_caught, CatchDayStats.pokemons).order_by(CatchDayStats.date_caught)
+    if caught_from is not None:
+        days = days.where(CatchDayStats.date_caught >= caught_from)
+    if caught_to is not None:
+        days = days.where(CatchDayStats.date_caught <= caught_to)
+    return {
+        "by_type": select(PokemonTypeStats.type, PokemonTypeStats.pokemons).order_by(PokemonTypeStats.type),
+        "by_day": days,
+        "by_team": select(TeamStats.team, TeamStats.pokemons).order_by(TeamStats.team),
+    }
+
+
+def pokemon_stats_body(refresh, rows):
+    by_type = {pokemon_type: count for pokemon_type, count in rows["by_type"]}
+    by_team = {team: count for team, count in rows["by_team"]}
+    total = sum(by_type.values())
+    return {
+        "refreshed_at": refresh.refreshed_at.isoformat(),
+        "total": total,
+        "by_type": by_type,
+        "by_team": by_team,
+        # Pokemons without a trainer are in no team
+        "unowned": total - sum(by_team.values()),
+        "by_day": [{"date": day.isoformat(), "pokemons": count} for day, count in rows["by_day"]],
+    }
+
+
+def trainer_queries():
+    """The rollup reads behind /trainers/stats."""
+    return {
+        "by_team": select(TeamStats.team, TeamStats.trainers, TeamStats.pokemons).order_by(TeamStats.team),
+    }
+
+
+def trainer_stats_body(refresh, rows):
+    by_team = {
+        team: {
+            "trainers": trainers,
+            "pokemons": pokemons,
+            "pokemons_per_trainer": round(pokemons / trainers, 2) if trainers else 0,
+        }
+        for team, trainers, pokemons in rows["by_team"]
+    }
+    return {
+        "refreshed_at": refresh.refreshed_at.isoformat(),
+        "total": sum(team["trainers"] for team in by_team.values()),
+        "by_team": by_team,
+    }
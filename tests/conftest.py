@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+# A throwaway SQLite database unless DB_URI is already set, before anything imports init.py
+os.environ.setdefault("DB_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "pokemon_tests.db"))
+os.environ.setdefault("JWT_KEY", "test-secret-key-test-secret-key-test")
+# Tests log in more often than the login rate limits allow, and read their writes straight back
+os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+os.environ.setdefault("EVENT_LOG_BACKEND", "none")
+
+import pytest  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from init import db  # noqa: E402
+
+# Trainers created by `flask db create`
+ADMIN = {"email": "mo@email.com", "username": "mo123", "password": "potatoismyfav123"}
+TRAINER = {"email": "johnno@email.com", "username": "John045", "password": "johnisnotmyname321"}
+
+
+@pytest.fixture
+def app():
+    """The Flask app on a freshly created database with the sample data."""
+    result = flask_app.test_cli_runner().invoke(args=["db", "create"])
+    assert result.exit_code == 0, result.output
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def auth_headers(client, trainer):
+    response = client.post("/trainers/login", json=trainer)
+    return {"Authorization": f"Bearer {response.json['token']}"}
+
+
+@pytest.fixture
+def admin_headers(client):
+    return auth_headers(client, ADMIN)
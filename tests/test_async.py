@@ -0,0 +1,43 @@
+import asyncio
+from models.trainer import Trainer
+from init import db
+from tests.conftest import TRAINER
+
+
+def run_async(*requests):
+    """Sends (method, path, json body) requests to the ASGI app, logged in as TRAINER, returning (status, body)s."""
+    from asgi import app as asgi_app
+
+    async def send():
+        client = asgi_app.test_client()
+        response = await client.post("/trainers/login", json=TRAINER)
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {(await response.get_json())['token']}"}
+        results = []
+        for method, path, body in requests:
+            response = await client.open(path, method=method, json=body, headers=headers)
+            results.append((response.status_code, await response.get_json()))
+        return results
+
+    return asyncio.run(send())
+
+
+def test_async_writes_invalidate_the_response_cache(app, client):
+    with app.app_context():
+        trainer_id = db.session.scalar(db.select(Trainer.id).where(Trainer.username == TRAINER["username"]))
+    assert client.get(f"/trainers/{trainer_id}").json["name"] == "John"
+    [(status, _)] = run_async(("PATCH", f"/trainers/update/{trainer_id}", {"name": "Johnny", "username": TRAINER["username"]}))
+    assert status == 200
+    assert client.get(f"/trainers/{trainer_id}").json["name"] == "Johnny"
+
+
+def test_async_pokemon_types_are_checked_like_the_flask_app(app):
+    pokemon = {"name": "Mew", "type": "psychic", "ability": "Synchronize"}
+    (create, bulk) = run_async(
+        ("POST", "/pokemons/create", {**pokemon, "type": "Cheese"}),
+        ("POST", "/pokemons/bulk", [pokemon, {**pokemon, "type": "Cheese"}]),
+    )
+    assert create[0] == 400
+    assert bulk[0] == 207
+    assert [result["status"] for result in bulk[1]] == [201, 400]
+    assert set(bulk[1][1]["errors"]) == {"type"}
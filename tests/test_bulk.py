@@ -0,0 +1,29 @@
+from tests.conftest import TRAINER, auth_headers
+
+
+def test_full_items_without_a_type_or_ability_are_rejected_one_by_one(client):
+    headers = auth_headers(client, TRAINER)
+    items = [
+        {"name": "Mew", "type": "psychic", "ability": "Synchronize"},
+        {"name": "Mew"},
+        {"name": "Mew", "ability": "Synchronize"},
+        {"name": "Mew", "type": 5, "ability": "Synchronize"},
+        "Mew",
+        {"name": "Mew2", "type": "Psychic", "ability": "Pressure"},
+    ]
+    response = client.post("/pokemons/bulk", json=items, headers=headers)
+    assert response.status_code == 207
+    results = response.json
+    assert [result["status"] for result in results] == [201, 400, 400, 400, 400, 400]
+    assert set(results[1]["errors"]) == {"type", "ability"}
+    assert set(results[2]["errors"]) == {"type"}
+    assert set(results[3]["errors"]) == {"type"}
+    assert set(results[5]["errors"]) == {"name"}
+
+    created = results[0]["id"]
+    response = client.put("/pokemons/bulk", json=[{"id": created, "name": "Mew"}], headers=headers)
+    assert response.status_code == 207
+    assert set(response.json[0]["errors"]) == {"type", "ability"}
+
+    response = client.patch("/pokemons/bulk", json=[{"id": created, "name": "Mewtwo"}], headers=headers)
+    assert response.status_code == 200
@@ -0,0 +1,40 @@
+import time
+from cache import MemoryBackend, ResponseCache
+
+
+def test_a_value_built_before_an_invalidation_is_not_cached():
+    cache = ResponseCache(MemoryBackend(), ttl=30, grace=30)
+    rows = {"name": "old"}
+
+    def producer():
+        value = dict(rows)
+        # A write commits and invalidates the key while the value is being built
+        rows["name"] = "new"
+        cache.invalidate("trainer", 1)
+        return value
+
+    assert cache.get_or_set("trainer", 1, producer) == {"name": "old"}
+    assert cache.get_or_set("trainer", 1, lambda: dict(rows)) == {"name": "new"}
+    assert cache.get_or_set("trainer", 1, producer) == {"name": "new"}
+
+
+def test_a_stale_value_rebuilt_across_an_invalidation_is_not_cached():
+    cache = ResponseCache(MemoryBackend(), ttl=0.2, grace=30)
+    cache.get_or_set("trainer", 1, lambda: "first")
+    time.sleep(0.25)
+
+    def producer():
+        cache.invalidate("trainer", 1)
+        return "rebuilt"
+
+    assert cache.get_or_set("trainer", 1, producer) == "rebuilt"
+    assert cache.get_or_set("trainer", 1, lambda: "current") == "current"
+
+
+def test_generation_counters_survive_evictions():
+    cache = ResponseCache(MemoryBackend(maxsize=2), ttl=30, grace=30)
+    cache.get_or_set("owned", 1, lambda: "before")
+    cache.invalidate_namespace("owned")
+    for identifier in range(10):
+        cache.get_or_set("trainer", identifier, lambda: "filler")
+    assert cache.get_or_set("owned", 1, lambda: "after") == "after"
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+# Imports every module with process-wide state, then sets the app up with its own config
+SCRIPT = textwrap.dedent("""
+    import auth, events, ratelimit, resource_cache, revocation
+    from init import create_app
+
+    create_app({
+        "ADMIN_CACHE_TTL": 7,
+        "RATE_LIMIT_BACKEND": "none",
+        "RESPONSE_CACHE_BACKEND": "none",
+        "EVENT_LOG_BACKEND": "none",
+        "EVENT_LOG_BATCH_SIZE": 3,
+        "TOKEN_DENYLIST_SYNC_SECONDS": 9,
+    })
+    print(auth.admin_cache.ttl, ratelimit.buckets, resource_cache.resource_cache.backend,
+          events.event_log.sink, events.event_log.batch_size, revocation.token_denylist.sync_interval)
+""")
+
+
+def test_create_app_config_reaches_module_state():
+    """Modules imported before create_app still use the config given to it."""
+    env = {"RATE_LIMIT_BACKEND": "memory", "RESPONSE_CACHE_BACKEND": "memory", "EVENT_LOG_BACKEND": "table"}
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], capture_output=True, text=True, env={**os.environ, **env}
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["7", "None", "None", "None", "3", "9"]
+
@@ -0,0 +1,9 @@
+import pytest
+from benchmarks.query_budget import SIZES, measure
+
+
+@pytest.mark.parametrize("trainers, pokemons", SIZES)
+def test_listings_stay_within_their_query_budget(trainers, pokemons):
+    for method, path, status, statements, budget in measure(trainers, pokemons):
+        assert status == 200, f"{method} {path}"
+        assert len(statements) <= budget, f"{method} {path} sent {len(statements)} statements: {statements}"
@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timedelta
+from flask_jwt_extended import decode_token
+from sqlalchemy import event, insert
+from init import db
+from models.revoked_token import RevokedToken
+from models.trainer import Trainer
+from revocation import token_denylist
+from tests.conftest import TRAINER, auth_headers
+
+
+def test_logged_out_token_is_refused(client):
+    headers = auth_headers(client, TRAINER)
+    assert client.post("/trainers/logout", headers=headers).status_code == 200
+    response = client.get("/pokemons/owned", headers=headers)
+    assert response.status_code == 401
+    assert response.json == {"msg": "Token has been revoked"}
+
+
+def test_checking_a_token_sends_no_query(app, client):
+    headers = auth_headers(client, TRAINER)
+    assert token_denylist.ready()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        # The sync thread runs in the background, only this request's statements are looked at
+        assert client.get("/pokemons/owned", headers=headers).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert not [statement for statement in statements if "revoked_tokens" in statement]
+
+
+def test_revocations_of_other_processes_are_read_in_the_background(app, client):
+    headers = auth_headers(client, TRAINER)
+    assert client.get("/pokemons/owned", headers=headers).status_code == 200
+    with app.app_context():
+        claims = decode_token(headers["Authorization"].removeprefix("Bearer "))
+        # Straight to the table, as another process would (this one's denylist is not told)
+        with db.engine.begin() as connection:
+            connection.execute(
+                insert(RevokedToken.__table__).values(
+                    jti=claims["jti"], revoked_at=datetime.utcnow(), expires_at=datetime.utcnow() + timedelta(hours=1)
+                )
+            )
+    deadline = time.monotonic() + token_denylist.sync_interval + 5
+    while not token_denylist.is_revoked(claims) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert client.get("/pokemons/owned", headers=headers).status_code == 401
+
+
+def test_concurrent_logouts_of_the_same_token(client, monkeypatch):
+    headers = auth_headers(client, TRAINER)
+    # Both requests passed the denylist check before either committed its revocation
+    monkeypatch.setattr(token_denylist, "is_revoked", lambda claims: False)
+    assert client.post("/trainers/logout", headers=headers).status_code == 200
+    assert client.post("/trainers/logout", headers=headers).status_code == 200
+    monkeypatch.undo()
+    assert client.get("/pokemons/owned", headers=headers).status_code == 401
+
+
+def test_a_new_trainer_never_gets_the_id_of_a_deleted_one(app, client):
+    created = client.post(
+        "/trainers/create",
+        json={"name": "Gone", "username": "gone", "email": "gone@email.com", "password": "password123", "team": "mystic"},
+    )
+    assert created.status_code == 201
+    headers = auth_headers(client, {"email": "gone@email.com", "username": "gone", "password": "password123"})
+    with app.app_context():
+        gone_id = db.session.scalar(db.select(Trainer.id).where(Trainer.username == "gone"))
+    assert client.delete(f"/trainers/delete/{gone_id}", headers=headers).status_code == 200
+
+    client.post(
+        "/trainers/create",
+        json={"name": "New", "username": "new", "email": "new@email.com", "password": "password123", "team": "mystic"},
+    )
+    with app.app_context():
+        new_id = db.session.scalar(db.select(Trainer.id).where(Trainer.username == "new"))
+    assert new_id != gone_id
+    # Logged in within the second of the deletion, yet not caught by the deleted trainer's revocation
+    headers = auth_headers(client, {"email": "new@email.com", "username": "new", "password": "password123"})
+    assert client.get("/pokemons/owned", headers=headers).status_code == 404
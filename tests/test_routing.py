@@ -0,0 +1,49 @@
+import shutil
+import sqlite3
+import pytest
+from sqlalchemy import create_engine
+from init import db
+from tests.conftest import ADMIN, auth_headers
+
+
+@pytest.fixture
+def replica(app, monkeypatch, tmp_path):
+    """A second SQLite database standing in for a read replica: a copy of the primary with one Pokemon renamed."""
+    with app.app_context():
+        primary = db.engine.url.database
+        db.session.remove()
+        db.engine.dispose()
+    path = tmp_path / "replica.db"
+    shutil.copyfile(primary, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE pokemons SET name = 'Replica' WHERE id = 1")
+    engine = create_engine(f"sqlite:///{path}")
+    monkeypatch.setitem(app.config, "SQLALCHEMY_BINDS", {"replica_0": {"url": str(engine.url)}})
+    with app.app_context():
+        monkeypatch.setitem(db.engines, "replica_0", engine)
+    yield
+    engine.dispose()
+
+
+def pokemon_names(client, headers):
+    response = client.get("/pokemons/", headers=headers)
+    assert response.status_code == 200
+    return {pokemon["id"]: pokemon["name"] for pokemon in response.json}
+
+
+def test_read_only_handlers_read_from_the_replica(client, replica):
+    headers = auth_headers(client, ADMIN)
+    assert pokemon_names(client, headers)[1] == "Replica"
+
+
+def test_reads_right_after_a_write_go_to_the_primary(client, replica):
+    headers = auth_headers(client, ADMIN)
+    response = client.post(
+        "/pokemons/create", json={"name": "Mew", "type": "Psychic", "ability": "Synchronize"}, headers=headers
+    )
+    assert response.status_code == 201, response.json
+    names = pokemon_names(client, headers)
+    assert names[1] != "Replica"
+    assert "Mew" in names.values()
+    # Only the writer is pinned: another client (at the same address) still reads from the replica
+    assert pokemon_names(client, auth_headers(client, ADMIN))[1] == "Replica"
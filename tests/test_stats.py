@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import pytest
+from sqlalchemy import delete, func, select
+import stats
+from init import db
+from models.stats import StatsRefresh
+
+
+class HeldLock:
+    """The rollups rebuild lock, held as if another worker were building them until release()."""
+
+    def __init__(self, app, monkeypatch):
+        self._connection = None
+        self._released = threading.Event()
+        with app.app_context():
+            if db.engine.dialect.name == "postgresql":
+                self._connection = db.engine.connect()
+                self._connection.execute(select(func.pg_advisory_lock(stats.STATS_LOCK_KEY)))
+                return
+        # SQLite has no lock to share, the other worker is only pretended
+        original = stats.try_stats_lock
+        monkeypatch.setattr(
+            stats, "try_stats_lock", lambda session: self._released.is_set() and original(session)
+        )
+
+    def release(self):
+        if self._connection is not None:
+            self._connection.execute(select(func.pg_advisory_unlock(stats.STATS_LOCK_KEY)))
+            self._connection.close()
+            self._connection = None
+        self._released.set()
+
+
+@pytest.fixture
+def stats_lock(app, monkeypatch):
+    # The rollups have never been built yet (`db create` builds them)
+    with app.app_context():
+        db.session.execute(delete(StatsRefresh))
+        db.session.commit()
+    lock = HeldLock(app, monkeypatch)
+    yield lock
+    lock.release()
+
+
+@pytest.mark.parametrize("path", ["/pokemons/stats", "/trainers/stats"])
+def test_first_stats_request_is_503_while_another_worker_builds_them(
+    client, admin_headers, stats_lock, monkeypatch, path
+):
+    monkeypatch.setattr(stats, "BUILD_WAIT", 0.3)
+    response = client.get(path, headers=admin_headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json == {"error": stats.STATS_BUILDING}
+
+
+def test_first_stats_request_waits_for_the_worker_building_them(app, client, admin_headers, stats_lock):
+    def other_worker():
+        time.sleep(0.3)
+        stats_lock.release()
+        stats.refresh_in_app_context()
+
+    worker = threading.Thread(target=other_worker)
+    worker.start()
+    try:
+        response = client.get("/pokemons/stats", headers=admin_headers)
+    finally:
+        worker.join()
+    assert response.status_code == 200
+    assert response.json["total"] > 0
+
+
+def test_async_stats_are_503_while_another_worker_builds_them(app, admin_headers, stats_lock, monkeypatch):
+    from asgi import app as asgi_app
+
+    monkeypatch.setattr(stats, "BUILD_WAIT", 0.3)
+
+    async def get():
+        response = await asgi_app.test_client().get("/pokemons/stats", headers=admin_headers)
+        return response.status_code, response.headers.get("Retry-After"), await response.get_json()
+
+    assert asyncio.run(get()) == (503, "1", {"error": stats.STATS_BUILDING})
@@ -0,0 +1,142 @@
+import gzip
+import json
+import pytest
+from sqlalchemy import delete, func, select
+from init import bcrypt, db
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+
+
+def flask_db(app, *args):
+    result = app.test_cli_runner().invoke(args=["db", *args])
+    return result
+
+
+def counts(app):
+    with app.app_context():
+        return (
+            db.session.scalar(select(func.count(Trainer.id))),
+            db.session.scalar(select(func.count(Pokemon.id))),
+        )
+
+
+def owned(app):
+    """(trainer username, Pokemon name, date caught) of every Pokemon, sorted."""
+    with app.app_context():
+        rows = db.session.execute(
+            select(Trainer.username, Pokemon.name, Pokemon.date_caught).outerjoin(Pokemon.trainer)
+        ).all()
+    return sorted(rows, key=str)
+
+
+def empty_database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+@pytest.fixture
+def export(app, tmp_path):
+    """Exports the sample data, returning (path, trainer and Pokemon counts, owned Pokemons)."""
+    path = str(tmp_path / "export.ndjson.gz")
+    result = flask_db(app, "export", path)
+    assert result.exit_code == 0, result.output
+    return path, counts(app), owned(app)
+
+
+@pytest.mark.parametrize("name", ["export.ndjson.gz", "export.csv"])
+def test_importing_an_export_into_its_own_database_adds_nothing(app, tmp_path, name):
+    path = str(tmp_path / name)
+    assert flask_db(app, "export", path).exit_code == 0
+    before = counts(app)
+    for _ in range(3):
+        result = flask_db(app, "import", path)
+        assert result.exit_code == 0, result.output
+        assert counts(app) == before
+
+
+def test_importing_the_same_file_twice_adds_nothing(app, export):
+    path, source_counts, source_owned = export
+    empty_database(app)
+    for _ in range(2):
+        result = flask_db(app, "import", path, "--batch-size", "2")
+        assert result.exit_code == 0, result.output
+        assert counts(app) == source_counts
+        assert owned(app) == source_owned
+
+
+def test_resuming_from_an_earlier_offset_adds_nothing(app, export):
+    path, source_counts, source_owned = export
+    empty_database(app)
+    assert flask_db(app, "import", path).exit_code == 0
+    # Past the trainer records: their Pokemons still find the trainers imported before the offset
+    result = flask_db(app, "import", path, "--offset", str(source_counts[0] + 1), "--batch-size", "2")
+    assert result.exit_code == 0, result.output
+    assert counts(app) == source_counts
+    assert owned(app) == source_owned
+
+
+def test_trainers_taken_by_other_accounts_are_left_out_with_their_pokemons(app, export):
+    path, source_counts, source_owned = export
+    with gzip.open(path, "rt") as file:
+        trainers = [record for record in map(json.loads, file) if record["kind"] == "trainer"]
+    by_username, by_email = trainers[0], trainers[1]
+    empty_database(app)
+    password = bcrypt.generate_password_hash("unrelated-password").decode("utf-8")
+    with app.app_context():
+        # One unrelated account with the first trainer's username, another with the second one's email
+        db.session.add_all([
+            Trainer(name="Other", username=by_username["username"], email="other@email.com", password=password, team="Valor"),
+            Trainer(name="Other", username="someoneelse", email=by_email["email"], password=password, team="Valor"),
+        ])
+        db.session.commit()
+    result = flask_db(app, "import", path)
+    assert result.exit_code == 0, result.output
+    left_out = {by_username["username"], by_email["username"]}
+    with app.app_context():
+        unrelated = db.session.scalars(select(Trainer.id).where(Trainer.name == "Other")).all()
+        assert db.session.scalar(select(func.count(Pokemon.id)).where(Pokemon.trainer_id.in_(unrelated))) == 0
+    assert owned(app) == [row for row in source_owned if row[0] not in left_out]
+    assert counts(app)[0] == source_counts[0]
+
+
+def test_pokemons_without_a_date_caught_are_invalid_records(app, export, tmp_path):
+    path, _, _ = export
+    with gzip.open(path, "rt") as file:
+        trainer = next(record for record in map(json.loads, file) if record["kind"] == "trainer")
+    pokemon = {"kind": "pokemon", "name": "Pikachu", "type": "Electric", "ability": "Static", "trainer": trainer["username"]}
+    records = [trainer, {**pokemon, "date_caught": "2024-01-01"}, pokemon, {**pokemon, "date_caught": None}]
+    broken = tmp_path / "broken.ndjson"
+    broken.write_text("".join(json.dumps(record) + "\n" for record in records))
+    empty_database(app)
+
+    result = flask_db(app, "import", str(broken))
+    assert result.exit_code != 0
+    assert "2 invalid records" in result.output and "date_caught" in result.output
+    assert counts(app) == (0, 0)
+
+    result = flask_db(app, "import", str(broken), "--skip-invalid")
+    assert result.exit_code == 0, result.output
+    assert counts(app) == (1, 1)
+
+
+def test_files_of_the_export_endpoint_add_pokemons_to_existing_accounts(app, client, admin_headers, tmp_path):
+    response = client.get("/trainers/export", headers=admin_headers)
+    assert response.status_code == 200
+    path = tmp_path / "trainers.ndjson.gz"
+    path.write_bytes(response.get_data())
+    source_counts, source_owned = counts(app), owned(app)
+    with app.app_context():
+        db.session.execute(delete(Pokemon))
+        db.session.commit()
+
+    result = flask_db(app, "import", str(path))
+    assert result.exit_code == 0, result.output
+    assert counts(app) == source_counts
+    assert owned(app) == source_owned
+
+    # Without the hashes no trainer can be created, nor can their Pokemons
+    empty_database(app)
+    result = flask_db(app, "import", str(path))
+    assert result.exit_code == 0, result.output
+    assert owned(app) == [row for row in source_owned if row[0] is None]
@@ -0,0 +1,398 @@
+import csv
+import gzip
+import io
+import json
+import re
+import uuid
+import zlib
+from collections import namedtuple
+from datetime import date
+from functools import partial
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from init import db
+from models.pokemon import Pokemon, PokemonSchema, pokemon_types
+from models.trainer import Trainer, TrainerSchema, gym_types
+
+# File formats of an export, each optionally gzip compressed
+FORMATS = ("ndjson", "csv")
+
+# Columns of a CSV export: the trainer and Pokemon fields side by side, a record
+# only fills its own (NDJSON records only carry their own). Pokemons refer to their
+# trainer by username, ids are not kept from one database to the next, and carry
+# their uuid so an import skips the ones the database already has
+FIELDS = (
+    "kind", "name", "username", "email", "password_hash", "team", "admin",
+    "type", "ability", "date_caught", "trainer", "uuid",
+)
+
+# Pokemons of files without uuids (written by hand, or before Pokemons had one) get one
+# derived from the record's number and content, the same each time the file is imported
+RECORD_NAMESPACE = uuid.UUID("5b7e3c1e-1f0a-4b55-9a55-3d0f3f2b7c11")
+
+# Trainers looked up per query when matching the accounts of a file's trainers
+MATCH_CHUNK = 1000
+
+# What import_batch did with a batch: the trainers inserted, those that were already
+# there (same username and email), the Pokemons inserted and those already there, and
+# {record number: messages} for the invalid records and for those left out because the
+# username or email of their trainer belongs to another account
+BatchResult = namedtuple(
+    "BatchResult", ["trainers", "existing_trainers", "pokemons", "existing_pokemons", "errors", "skipped"]
+)
+
+# gzip level of exports, past 6 files barely shrink while compressing gets much slower
+COMPRESSION_LEVEL = 6
+
+# Imports validate records with the API's schemas, so they accept what the API accepts.
+# A batch's records of each kind are loaded as one list, not one by one
+trainer_import_schema = TrainerSchema(
+    many=True, only=["name", "username", "email", "team", "admin"], unknown="exclude"
+)
+pokemon_import_schema = PokemonSchema(many=True, only=["name", "type", "ability", "date_caught"], unknown="exclude")
+
+
+def export_format(path, format=None):
+    """The format asked for, or the one the file name ends with (ndjson by default)."""
+    if format is None:
+        format = "csv" if path.removesuffix(".gz").endswith(".csv") else "ndjson"
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    return format
+
+
+def open_export(path, mode):
+    """Opens an export file as text for reading ("r") or writing ("w"), through gzip when its name ends in .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", compresslevel=COMPRESSION_LEVEL, encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def export_queries(usernames=None, passwords=True):
+    """
+    The (SELECT, record builder) pairs of an export: trainers first so an
+    import creates them before their Pokemons, each in id order. With
+    `usernames` only those trainers and their Pokemons are exported.
+    """
+    trainers = select(
+        Trainer.name, Trainer.username, Trainer.email, Trainer.password, Trainer.team, Trainer.admin
+    ).order_by(Trainer.id)
+    pokemons = (
+        select(Pokemon.name, Pokemon.type, Pokemon.ability, Pokemon.date_caught, Trainer.username, Pokemon.uuid)
+        .outerjoin(Pokemon.trainer)
+        .order_by(Pokemon.id)
+    )
+    if usernames:
+        trainers = trainers.where(Trainer.username.in_(usernames))
+        pokemons = pokemons.where(Trainer.username.in_(usernames))
+    return [(trainers, partial(trainer_record, passwords=passwords)), (pokemons, pokemon_record)]
+
+
+def trainer_record(row, passwords=True):
+    name, username, email, password, team, admin = row
+    record = {"kind": "trainer", "name": name, "username": username, "email": email, "team": team, "admin": bool(admin)}
+    if passwords:
+        # The bcrypt hash, so trainers can log in with their passwords after an import
+        record["password_hash"] = password
+    return record
+
+
+def pokemon_record(row):
+    name, type, ability, date_caught, trainer, pokemon_uuid = row
+    return {
+        "kind": "pokemon",
+        "name": name,
+        "type": type,
+        "ability": ability,
+        "date_caught": date_caught.isoformat() if date_caught else None,
+        "trainer": trainer,
+        "uuid": pokemon_uuid,
+    }
+
+
+def export_records(usernames=None, passwords=True, chunk_size=1000):
+    """
+    Yields every record of an export, read from server side cursors
+    `chunk_size` rows at a time so memory use stays flat however many rows
+    there are.
+    """
+    # On the session's connection (a replica for read-only handlers) but as Core statements,
+    # plain column rows need none of the ORM's result processing
+    connection = db.session.connection()
+    for stmt, record in export_queries(usernames, passwords):
+        for row in connection.execute(stmt.execution_options(yield_per=chunk_size)):
+            yield record(row)
+
+
+class Encoder:
+    """Turns export records into the lines of an NDJSON or CSV file."""
+
+    def __init__(self, format, dumps=json.dumps):
+        self.format = format
+        self.dumps = dumps
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, FIELDS)
+
+    def _written(self):
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def header(self):
+        if self.format != "csv":
+            return ""
+        self._writer.writeheader()
+        return self._written()
+
+    def line(self, record):
+        if self.format == "ndjson":
+            return self.dumps(record) + "\n"
+        self._writer.writerow(record)
+        return self._written()
+
+
+class GzipChunks:
+    """
+    Compresses the lines of an export into gzip chunks of about `chunk_size`
+    bytes of input each, for streaming it as a response body: write() returns
+    a chunk once enough lines are waiting (or b""), close() the rest.
+    """
+
+    def __init__(self, chunk_size=64 * 1024):
+        self.chunk_size = chunk_size
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+        self._pending = []
+        self._size = 0
+
+    def write(self, text):
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size < self.chunk_size:
+            return b""
+        data = self._compressor.compress("".join(self._pending).encode("utf-8"))
+        self._pending, self._size = [], 0
+        return data
+
+    def close(self):
+        return self._compressor.compress("".join(self._pending).encode("utf-8")) + self._compressor.flush()
+
+
+def _csv_value(field, value):
+    if field == "admin":
+        return value == "True"
+    return value
+
+
+def read_records(file, format):
+    """Yields the records of an export file opened as text, the same dicts for both formats."""
+    if format == "csv":
+        for row in csv.DictReader(file):
+            # Empty cells are the other kind's fields
+            yield {field: _csv_value(field, value) for field, value in row.items() if value != ""}
+    else:
+        for line in file:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Reported as an invalid record, so --skip-invalid can get past it
+                    yield line
+
+
+def _check(condition, field, message):
+    if not condition:
+        raise ValidationError({field: [message]})
+
+
+def trainer_row(number, record, trainer_info):
+    """The trainers row of a record loaded by TrainerSchema, or raises ValidationError."""
+    for field in ("name", "email", "team"):
+        _check(trainer_info.get(field) is not None, field, "Missing data for required field.")
+    team = str(trainer_info["team"]).capitalize()
+    _check(team in gym_types.enums, "team", f"This is a Invalid Gym team: {trainer_info['team']}")
+    # Only a bcrypt hash can be stored. Records without one (exports made without the hashes)
+    # cannot create trainers, they are matched to existing accounts only (see import_batch)
+    password_hash = record.get("password_hash")
+    _check(
+        password_hash is None
+        or (isinstance(password_hash, str) and password_hash.startswith("$2") and len(password_hash) == 60),
+        "password_hash", "Not a valid bcrypt hash.",
+    )
+    return {
+        "name": trainer_info["name"],
+        "username": trainer_info["username"],
+        "email": trainer_info["email"],
+        "password": password_hash,
+        "team": team,
+        "admin": trainer_info.get("admin") is True,
+    }
+
+
+def pokemon_row(number, record, pokemon_info):
+    """The pokemons row of a record loaded by PokemonSchema (owner as a username), or raises ValidationError."""
+    # The columns are NOT NULL, a record without one would fail the whole batch's INSERT
+    for field in ("type", "ability", "date_caught"):
+        _check(pokemon_info.get(field) is not None, field, "Missing data for required field.")
+    pokemon_type = str(pokemon_info["type"]).capitalize()
+    _check(pokemon_type in pokemon_types.enums, "type", f"This is a Invalid Pokemon type: {pokemon_info['type']}")
+    try:
+        date_caught = date.fromisoformat(pokemon_info["date_caught"])
+    except (TypeError, ValueError):
+        raise ValidationError({"date_caught": ["Not a valid date."]})
+    pokemon_uuid = record.get("uuid")
+    if pokemon_uuid is None:
+        pokemon_uuid = uuid.uuid5(RECORD_NAMESPACE, f"{number}:{json.dumps(record, sort_keys=True)}").hex
+    else:
+        _check(
+            isinstance(pokemon_uuid, str) and re.fullmatch("[0-9a-f]{32}", pokemon_uuid),
+            "uuid", "Not a valid uuid.",
+        )
+    return {
+        "name": pokemon_info["name"],
+        "type": pokemon_type,
+        "ability": pokemon_info["ability"],
+        "date_caught": date_caught,
+        "trainer_id": record.get("trainer"),
+        "uuid": pokemon_uuid,
+    }
+
+
+# Kind of record -> (schema loading them, function turning one into its table row)
+KINDS = {"trainer": (trainer_import_schema, trainer_row), "pokemon": (pokemon_import_schema, pokemon_row)}
+
+
+def _rows(kind, numbered, errors):
+    """The (number, row) of the valid records of a kind, adding the others' messages to errors."""
+    schema, to_row = KINDS[kind]
+    records = [record for _, record in numbered]
+    try:
+        loaded, messages = schema.load(records), {}
+    except ValidationError as err:
+        # valid_data keeps one entry per record, holding its valid fields
+        loaded, messages = err.valid_data, err.messages
+    rows = []
+    for index, ((number, record), info) in enumerate(zip(numbered, loaded)):
+        if index in messages:
+            errors[number] = messages[index]
+            continue
+        try:
+            rows.append((number, to_row(number, record, info)))
+        except ValidationError as err:
+            errors[number] = err.messages
+    return rows
+
+
+def _insert_ignoring_duplicates(table):
+    # Rows whose unique columns are taken are left as they are (a trainer's username or email,
+    # a Pokemon's uuid), rather than failing the batch
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def match_trainers(accounts, owners):
+    """
+    Adds the (username, email) of a file's trainers to `owners`, username ->
+    id of the account with that username and email, or None when the
+    username or the email belongs to another account (or to no account).
+    Only the trainer's own account gets its Pokemons, never an unrelated
+    one that happens to share the username.
+    """
+    accounts = list(accounts)
+    for index in range(0, len(accounts), MATCH_CHUNK):
+        chunk = dict(accounts[index:index + MATCH_CHUNK])
+        found = db.session.execute(
+            select(Trainer.username, Trainer.email, Trainer.id).where(Trainer.username.in_(chunk))
+        ).all()
+        ids = {username: id for username, email, id in found if chunk[username] == email}
+        owners.update((username, ids.get(username)) for username in chunk)
+
+
+def known_trainers(records, owners):
+    """match_trainers for the trainer records of a file before the --offset an import resumes from."""
+    match_trainers(
+        (
+            (record["username"], record.get("email"))
+            for record in records
+            if isinstance(record, dict) and record.get("kind") == "trainer" and isinstance(record.get("username"), str)
+        ),
+        owners,
+    )
+
+
+def import_batch(records, start, owners, insert_pokemons=None):
+    """
+    Validates and inserts one batch of records, numbered from `start`, in
+    the current transaction (the caller commits). `owners` is kept by the
+    caller across batches (see match_trainers): a Pokemon goes to its
+    trainer's account only when the file's trainer matched it. Trainers
+    without a password hash are not inserted, only matched to an existing
+    account. Pokemons
+    whose uuid is already in the database are skipped, so importing the
+    same file again, or resuming before where an import stopped, adds
+    nothing twice. They are inserted with `insert_pokemons(rows)` when
+    given (e.g. with COPY), otherwise with a multi-row INSERT. Returns a
+    BatchResult.
+    """
+    by_kind, errors, skipped = {kind: [] for kind in KINDS}, {}, {}
+    for number, record in enumerate(records, start):
+        if not isinstance(record, dict):
+            errors[number] = {"record": ["Not a JSON object."]}
+        elif record.get("kind") not in KINDS:
+            errors[number] = {"kind": ["Must be trainer or pokemon."]}
+        else:
+            by_kind[record["kind"]].append((number, record))
+    trainers = _rows("trainer", by_kind["trainer"], errors)
+    pokemons = _rows("pokemon", by_kind["pokemon"], errors)
+
+    inserted_trainers = 0
+    if trainers:
+        new_trainers = [row for _, row in trainers if row["password"] is not None]
+        if new_trainers:
+            # Straight to the table like `db seed`: a restore is not a stream of changes for the event log
+            stmt = _insert_ignoring_duplicates(Trainer.__table__).returning(Trainer.__table__.c.id)
+            inserted_trainers = len(db.session.execute(stmt, new_trainers).all())
+        match_trainers(((row["username"], row["email"]) for _, row in trainers), owners)
+        for number, row in trainers:
+            if owners[row["username"]] is not None:
+                continue
+            if row["password"] is None:
+                message = "No password hash and no account with this username and email, left out with its Pokemons."
+            else:
+                message = "Username or email taken by another account, left out with its Pokemons."
+            skipped[number] = {"username": [message]}
+
+    rows, uuids = [], set()
+    for number, row in pokemons:
+        username = row["trainer_id"]
+        if username is not None:
+            if username not in owners:
+                errors[number] = {"trainer": [f"Unknown trainer: {username}"]}
+                continue
+            if owners[username] is None:
+                skipped[number] = {"trainer": [f"Trainer {username} was left out, so is this Pokemon."]}
+                continue
+            row["trainer_id"] = owners[username]
+        if row["uuid"] not in uuids:
+            uuids.add(row["uuid"])
+            rows.append(row)
+    # The Pokemons already in the database, looked up once per batch on the uuid index
+    existing = set(db.session.scalars(select(Pokemon.uuid).where(Pokemon.uuid.in_(uuids)))) if uuids else set()
+    rows = [row for row in rows if row["uuid"] not in existing]
+    if rows and insert_pokemons is not None:
+        insert_pokemons(rows)
+    elif rows:
+        db.session.execute(_insert_ignoring_duplicates(Pokemon.__table__), rows)
+    return BatchResult(
+        inserted_trainers,
+        len(trainers) - inserted_trainers - sum(1 for number, _ in trainers if number in skipped),
+        len(rows),
+        len(pokemons) - len(rows) - sum(1 for number, _ in pokemons if number in skipped or number in errors),
+        errors,
+        skipped,
+    )
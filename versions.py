@@ -0,0 +1,87 @@
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, update
+from models.pokemon import Pokemon
+from models.trainer import Trainer
+from resource_cache import trainer_ids_in
+
+# Marks a write to Pokemons of unknown trainers, every trainer's counter is bumped then
+ALL_TRAINERS = object()
+
+
+def _owners(session):
+    return session.info.setdefault("changed_pokemon_owners", set())
+
+
+# The trainers whose Pokemons this flush added, changed, moved or deleted
+def _collect_flushed(session, flush_context):
+    owners = _owners(session)
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Pokemon):
+            history = inspect(obj).attrs.trainer_id.history
+            # The new owner and, for a Pokemon moved to another trainer, the previous one
+            owners.update(history.sum())
+            owners.add(obj.trainer_id)
+
+
+def pokemons_changed(session, trainer_ids):
+    """Bumps these trainers' counters when the session commits, for writes the session does not see (e.g. COPY)."""
+    _owners(session).update(trainer_ids)
+
+
+# Bulk statements bypass the flush, read the trainers from the statement instead. An UPDATE
+# that sets trainer_id also moves Pokemons away from trainers it does not name
+def _collect_executed(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    statement = orm_execute_state.statement
+    # ORM statements carry an annotated copy of the table, compare names
+    if getattr(getattr(statement, "table", None), "name", None) != Pokemon.__tablename__:
+        return
+    parameters = orm_execute_state.parameters
+    trainer_ids = trainer_ids_in(statement, parameters)
+    moves = orm_execute_state.is_update and (
+        any("trainer_id" in row for row in (parameters if isinstance(parameters, list) else [parameters or {}]))
+        or any(getattr(column, "key", column) == "trainer_id" for column in statement._values or ())
+    )
+    owners = _owners(orm_execute_state.session)
+    if moves or trainer_ids is None:
+        owners.add(ALL_TRAINERS)
+    else:
+        owners.update(trainer_ids)
+
+
+# Bump the counters in the committing transaction itself, so readers never see the new
+# Pokemons with the old counter
+def _bump(session):
+    # The commit only flushes after this event, flush first to collect everything it writes
+    session.flush()
+    owners = session.info.pop("changed_pokemon_owners", None)
+    if not owners:
+        return
+    owners.discard(None)
+    stmt = update(Trainer.__table__).values(
+        pokemons_version=Trainer.__table__.c.pokemons_version + 1,
+        # Set to itself, the trainer row's own version only counts changes to the trainer
+        version=Trainer.__table__.c.version,
+    )
+    if ALL_TRAINERS not in owners:
+        if not owners:
+            return
+        stmt = stmt.where(Trainer.__table__.c.id.in_(sorted(owners)))
+    # On the connection, so the other trackers do not take it for a trainer change
+    session.connection().execute(stmt)
+
+
+def _discard(session):
+    session.info.pop("changed_pokemon_owners", None)
+
+
+def track_pokemon_owners(session_class):
+    """Bumps Trainer.pokemons_version for every write to the trainer's Pokemons committed by sessions of this class."""
+    event.listen(session_class, "after_flush", _collect_flushed)
+    event.listen(session_class, "do_orm_execute", _collect_executed)
+    event.listen(session_class, "before_commit", _bump)
+    event.listen(session_class, "after_rollback", _discard)
+
+
+track_pokemon_owners(Session)